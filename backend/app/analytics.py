@@ -0,0 +1,127 @@
+"""
+Session-level analytics over the laps of the whole field.
+
+Each function takes session.laps (or the laps of the derived store) and
+computes its result for every driver with grouped/vectorized operations.
+Times are returned as integer milliseconds, None when missing.
+"""
+import pandas as pd
+
+# Track status codes of laps not representative of race pace:
+# 4 safety car, 5 red flag, 6 VSC deployed, 7 VSC ending
+NEUTRALIZED_STATUS = "[4567]"
+
+
+def _ms(series: pd.Series) -> pd.Series:
+    """Timedeltas as float milliseconds (NaN when missing)"""
+    return series.dt.total_seconds() * 1000
+
+
+def _int_or_none(values) -> list:
+    return [None if pd.isna(v) else int(round(v)) for v in values]
+
+
+def _driver_key(laps: pd.DataFrame) -> pd.Series:
+    return laps['DriverNumber'].astype(str)
+
+
+def tyre_stints(laps: pd.DataFrame) -> dict:
+    """Stints of every driver: {driver number: [{stint, compound, start_lap, ...}]}"""
+    laps = laps[laps['LapNumber'].notna()].assign(
+        driver=_driver_key(laps), lap_ms=_ms(laps['LapTime'])
+    )
+    # Stint is missing for some laps in older sessions; carry it over within the driver
+    laps = laps.sort_values(['driver', 'LapNumber'])
+    stint = laps.groupby('driver')['Stint'].ffill()
+    laps['stint'] = stint.groupby(laps['driver']).bfill().fillna(1)
+
+    grouped = laps.groupby(['driver', 'stint'], sort=True)
+    stints = grouped.agg(
+        compound=('Compound', 'first'),
+        start_lap=('LapNumber', 'min'),
+        end_lap=('LapNumber', 'max'),
+        laps=('LapNumber', 'size'),
+        tyre_life_start=('TyreLife', 'min'),
+        fresh_tyre=('FreshTyre', 'first'),
+        mean_lap_ms=('lap_ms', 'mean'),
+    ).reset_index()
+
+    result = {}
+    for row in stints.itertuples(index=False):
+        result.setdefault(row.driver, []).append({
+            "stint": int(row.stint),
+            "compound": None if pd.isna(row.compound) else str(row.compound),
+            "start_lap": int(row.start_lap),
+            "end_lap": int(row.end_lap),
+            "laps": int(row.laps),
+            "tyre_life_start": None if pd.isna(row.tyre_life_start) else int(row.tyre_life_start),
+            "fresh_tyre": None if pd.isna(row.fresh_tyre) else bool(row.fresh_tyre),
+            "mean_lap_ms": None if pd.isna(row.mean_lap_ms) else int(round(row.mean_lap_ms)),
+        })
+    return result
+
+
+def representative_laps(laps: pd.DataFrame) -> pd.DataFrame:
+    """Timed laps without the first lap, in/out laps and neutralized laps"""
+    mask = (
+        laps['LapTime'].notna()
+        & (laps['LapNumber'] > 1)
+        & laps['PitInTime'].isna()
+        & laps['PitOutTime'].isna()
+        & ~laps['TrackStatus'].fillna('').astype(str).str.contains(NEUTRALIZED_STATUS, regex=True)
+    )
+    if 'Deleted' in laps.columns:
+        mask &= ~laps['Deleted'].fillna(False).astype(bool)
+    return laps[mask]
+
+
+def race_pace(laps: pd.DataFrame) -> dict:
+    """Lap time distribution of every driver over representative laps"""
+    laps = representative_laps(laps)
+    times = _ms(laps['LapTime']).groupby(_driver_key(laps))
+    stats = pd.DataFrame({
+        "laps": times.size(),
+        "mean_ms": times.mean(),
+        "median_ms": times.median(),
+        "std_ms": times.std(),
+        "min_ms": times.min(),
+        "p25_ms": times.quantile(0.25),
+        "p75_ms": times.quantile(0.75),
+    })
+    result = {}
+    for driver, row in stats.iterrows():
+        result[driver] = {"laps": int(row["laps"])}
+        for column in stats.columns.drop("laps"):
+            result[driver][column] = None if pd.isna(row[column]) else int(round(row[column]))
+    return result
+
+
+def gaps_to_leader(laps: pd.DataFrame) -> dict:
+    """Cumulative gap of every driver to the leader at the end of each lap.
+
+    The leader of a lap is the first driver to complete it; gaps come from
+    the session time at which each driver completed the lap.
+    """
+    laps = laps[laps['LapNumber'].notna() & laps['Time'].notna()]
+    finished = _ms(laps['Time'])
+    lap_numbers = laps['LapNumber'].astype(int)
+    gaps = finished - finished.groupby(lap_numbers).transform('min')
+    table = pd.DataFrame({
+        "driver": _driver_key(laps), "lap": lap_numbers, "gap": gaps
+    }).pivot_table(index="lap", columns="driver", values="gap", aggfunc="first").sort_index()
+
+    leaders = laps.loc[finished.groupby(lap_numbers).idxmin()]
+    return {
+        "lap_numbers": table.index.astype(int).tolist(),
+        "leaders": _driver_key(leaders).tolist(),
+        "drivers": {driver: _int_or_none(table[driver].to_numpy()) for driver in table.columns},
+    }
+
+
+def session_analytics(laps: pd.DataFrame) -> dict:
+    """All analytics of a session, computed together so one load serves every endpoint"""
+    return {
+        "stints": tyre_stints(laps),
+        "pace": race_pace(laps),
+        "gaps": gaps_to_leader(laps),
+    }
@@ -0,0 +1,131 @@
+"""
+Process-wide state of the API and its startup.
+
+`app_context.start()` runs once per worker process from the lifespan handler
+in app.main: it prepares the FastF1 cache directory and configures the worker
+pool, without importing FastF1 (see app.fastf1_cache) or touching Redis.
+
+`preload()` is the optional preload-then-fork step (PRELOAD_APP=1 in
+gunicorn.conf.py). It runs once in the master process before the workers are
+forked and imports FastF1, builds the schedule index of PRELOAD_SEASONS and,
+when sessions are served in-process (SESSION_POOL_WORKERS=0), loads the laps
+and lap indexes of PRELOAD_SESSIONS. The workers then share that memory
+copy-on-write instead of each building their own.
+
+Configuration:
+    PRELOAD_SEASONS   comma separated seasons whose schedule is preloaded
+    PRELOAD_SESSIONS  comma separated year:round:session, e.g. 2024:8:R,2024:8:Q
+"""
+import gc
+import os
+import time
+import logging
+from typing import List, Optional
+
+from app.cache_manager import cache_manager
+from app.fastf1_cache import prepare_cache_dir, get_fastf1
+from app.session_cache import session_cache
+from app.query_store import query_store
+from app.worker_pool import worker_pool
+from app.prefetch import prefetcher
+
+logger = logging.getLogger(__name__)
+
+PRELOAD_SEASONS = [int(s) for s in os.getenv('PRELOAD_SEASONS', '').split(',') if s.strip()]
+PRELOAD_SESSIONS = [s.strip() for s in os.getenv('PRELOAD_SESSIONS', '').split(',') if s.strip()]
+
+
+class AppContext:
+    def __init__(self):
+        self.cache_manager = cache_manager
+        self.session_cache = session_cache
+        self.worker_pool = worker_pool
+        self.prefetcher = prefetcher
+        self.fastf1_cache_dir = None
+        self.started = False
+        self.startup_seconds = None
+        self.preloaded = {}
+
+    def start(self):
+        """Set up this worker process; cheap, everything heavy is deferred to first use"""
+        if self.started:
+            return
+        start = time.perf_counter()
+        self.fastf1_cache_dir = prepare_cache_dir()
+        # Session loading runs in worker processes that share the FastF1 cache
+        self.worker_pool.configure(fastf1_cache_dir=self.fastf1_cache_dir)
+        self.started = True
+        self.startup_seconds = time.perf_counter() - start
+        logger.info(f"Worker {os.getpid()} started in {self.startup_seconds * 1000:.1f} ms")
+
+    def shutdown(self):
+        self.prefetcher.cancel_all()
+        self.worker_pool.shutdown()
+
+    def session_cache_stats(self) -> list:
+        # Sessions live in the worker processes unless the pool runs in-process
+        if self.worker_pool.workers > 0:
+            return self.worker_pool.session_cache_stats()
+        return [self.session_cache.stats()]
+
+    def query_store_stats(self) -> list:
+        # Sessions are ingested where they are loaded
+        if self.worker_pool.workers > 0:
+            return self.worker_pool.query_store_stats()
+        return [query_store.stats()]
+
+    def stats(self) -> dict:
+        return {
+            "pid": os.getpid(),
+            "startup_ms": round(self.startup_seconds * 1000, 1) if self.startup_seconds is not None else None,
+            "preloaded": self.preloaded,
+        }
+
+
+# Create a singleton instance
+app_context = AppContext()
+
+
+def preload(seasons: Optional[List[int]] = None, sessions: Optional[List[str]] = None) -> dict:
+    """Build read-only state in the master process before the workers fork"""
+    from app.schedule_index import schedule_index
+    from app import session_data
+
+    seasons = PRELOAD_SEASONS if seasons is None else seasons
+    sessions = PRELOAD_SESSIONS if sessions is None else sessions
+    start = time.perf_counter()
+    get_fastf1(prepare_cache_dir())
+
+    loaded_seasons = []
+    for year in seasons:
+        try:
+            schedule_index.events(year)
+            loaded_seasons.append(year)
+        except Exception as e:
+            logger.warning(f"Could not preload the {year} schedule: {e}")
+
+    loaded_sessions = []
+    if sessions and worker_pool.workers > 0:
+        # The worker processes are spawned later and load sessions themselves
+        logger.info("Not preloading sessions: they are loaded by the session worker pool")
+    else:
+        for entry in sessions:
+            try:
+                year, round_number, session_type = entry.split(':')
+                session_data.get_lap_index(int(year), int(round_number), session_type.upper())
+                loaded_sessions.append(entry)
+            except Exception as e:
+                logger.warning(f"Could not preload session {entry}: {e}")
+
+    # Move everything built so far out of the collector's reach, so collections
+    # in the workers don't write to (and un-share) the preloaded pages
+    gc.collect()
+    gc.freeze()
+
+    app_context.preloaded = {
+        "seasons": loaded_seasons,
+        "sessions": loaded_sessions,
+        "seconds": round(time.perf_counter() - start, 3),
+    }
+    logger.info(f"Preloaded {app_context.preloaded}")
+    return app_context.preloaded
@@ -0,0 +1,247 @@
+"""
+Storage backends behind CacheManager.
+
+A backend stores JSON-serializable values or bytes under string keys with an
+optional TTL. `get` returns (expires_at, value, size) or None.
+
+- FileBackend: one file per key on local disk, shared by the workers of one
+  machine, size capped with LRU eviction.
+- RedisBackend: shared by every worker and instance, values zlib compressed,
+  multi-gets pipelined into one round trip.
+"""
+import os
+import json
+import time
+import zlib
+import hashlib
+import tempfile
+from pathlib import Path
+from typing import Optional, List
+
+# Values larger than this are compressed before they are sent to Redis
+COMPRESS_MIN_BYTES = 1024
+
+
+def encode_value(value) -> tuple:
+    """Returns (kind, payload bytes)"""
+    if isinstance(value, (bytes, bytearray)):
+        return "bytes", bytes(value)
+    return "json", json.dumps(value, separators=(",", ":")).encode()
+
+
+def decode_value(kind: str, payload: bytes):
+    return payload if kind == "bytes" else json.loads(payload)
+
+
+class CacheBackend:
+    name = "base"
+
+    def get(self, key: str):
+        raise NotImplementedError
+
+    def get_many(self, keys: List[str]) -> list:
+        return [self.get(key) for key in keys]
+
+    def set(self, key: str, value, ttl: Optional[int]) -> int:
+        raise NotImplementedError
+
+    def delete(self, key: str):
+        raise NotImplementedError
+
+    def ping(self) -> bool:
+        return True
+
+    def stats(self) -> dict:
+        return {}
+
+
+class FileBackend(CacheBackend):
+    """Each entry is one file named after the sha256 of its key.
+
+    The file holds a one line JSON header (key, expiry, kind) followed by the
+    payload. Files are written to a temp file and renamed, so other worker
+    processes never see partial writes. Reads refresh the file's mtime, which
+    is what LRU eviction orders by.
+    """
+    name = "file"
+
+    def __init__(self, cache_dir: Path, max_bytes: int):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self._disk_bytes = None
+        self.expired = 0
+        self.evictions = 0
+
+    @property
+    def disk_bytes(self) -> int:
+        # Scanned on first use instead of at import time in every API worker
+        if self._disk_bytes is None:
+            self._disk_bytes = sum(f.stat().st_size for f in self.cache_dir.glob("*/*.cache"))
+        return self._disk_bytes
+
+    def _path(self, key: str) -> Path:
+        digest = hashlib.sha256(key.encode()).hexdigest()
+        return self.cache_dir / digest[:2] / f"{digest}.cache"
+
+    def get(self, key: str):
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                header = json.loads(f.readline())
+                payload = f.read()
+        except FileNotFoundError:
+            return None
+
+        if header.get("key") != key:
+            return None  # Hash collision
+        expires_at = header.get("expires_at")
+        if expires_at is not None and expires_at <= time.time():
+            self.expired += 1
+            self._remove(path)
+            return None
+
+        value = decode_value(header.get("kind"), payload)
+        try:
+            # Mark as recently used for eviction
+            os.utime(path, None)
+        except OSError:
+            pass
+        return expires_at, value, len(payload)
+
+    def set(self, key: str, value, ttl: Optional[int]) -> int:
+        kind, payload = encode_value(value)
+        expires_at = time.time() + ttl if ttl is not None else None
+        header = json.dumps({"key": key, "expires_at": expires_at, "kind": kind}).encode()
+
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(header + b"\n" + payload)
+            previous = path.stat().st_size if path.exists() else 0
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+
+        self._disk_bytes = self.disk_bytes + len(header) + 1 + len(payload) - previous
+        if self._disk_bytes > self.max_bytes:
+            self._evict()
+        return len(payload)
+
+    def delete(self, key: str):
+        self._remove(self._path(key))
+
+    def clear(self):
+        for path in self.cache_dir.glob("*/*.cache"):
+            self._remove(path)
+
+    def _remove(self, path: Path):
+        try:
+            size = path.stat().st_size
+            path.unlink()
+            if self._disk_bytes is not None:
+                self._disk_bytes -= size
+        except OSError:
+            pass
+
+    def _evict(self):
+        """Delete least recently used files until the cache is below 90% of its cap"""
+        files = []
+        for path in self.cache_dir.glob("*/*.cache"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+        # Other workers write to the same directory, so resync the total
+        self._disk_bytes = sum(size for _, size, _ in files)
+        target = int(self.max_bytes * 0.9)
+        for _, size, path in sorted(files):
+            if self._disk_bytes <= target:
+                break
+            self._remove(path)
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        return {
+            "disk_bytes": self.disk_bytes,
+            "max_bytes": self.max_bytes,
+            "expired": self.expired,
+            "evictions": self.evictions,
+        }
+
+
+class RedisBackend(CacheBackend):
+    """Redis (or any client with the redis-py API, e.g. fakeredis).
+
+    Values are stored as a one byte kind marker followed by the payload,
+    zlib compressed when it is larger than COMPRESS_MIN_BYTES:
+    b"j"/b"b" plain JSON/bytes, b"J"/b"B" compressed JSON/bytes.
+    """
+    name = "redis"
+
+    def __init__(self, client, prefix: str = "f1:"):
+        self.client = client
+        self.prefix = prefix
+
+    @classmethod
+    def from_url(cls, url: str, max_connections: int = 16, **kwargs):
+        import redis
+        pool = redis.ConnectionPool.from_url(
+            url, max_connections=max_connections, socket_timeout=2, socket_connect_timeout=2
+        )
+        return cls(redis.Redis(connection_pool=pool), **kwargs)
+
+    @staticmethod
+    def _encode(value) -> bytes:
+        kind, payload = encode_value(value)
+        marker = b"b" if kind == "bytes" else b"j"
+        if len(payload) > COMPRESS_MIN_BYTES:
+            return marker.upper() + zlib.compress(payload, 3)
+        return marker + payload
+
+    @staticmethod
+    def _decode(raw: bytes):
+        marker, payload = raw[:1], raw[1:]
+        if marker.isupper():
+            payload = zlib.decompress(payload)
+        kind = "bytes" if marker.lower() == b"b" else "json"
+        return decode_value(kind, payload), len(raw)
+
+    def _entry(self, raw, pttl):
+        if raw is None:
+            return None
+        value, size = self._decode(raw)
+        expires_at = time.time() + pttl / 1000 if pttl is not None and pttl > 0 else None
+        return expires_at, value, size
+
+    def get(self, key: str):
+        return self.get_many([key])[0]
+
+    def get_many(self, keys: List[str]) -> list:
+        """Fetch values and remaining TTLs of all keys in one pipelined round trip"""
+        if not keys:
+            return []
+        pipe = self.client.pipeline(transaction=False)
+        for key in keys:
+            pipe.get(self.prefix + key)
+            pipe.pttl(self.prefix + key)
+        replies = pipe.execute()
+        return [self._entry(replies[i], replies[i + 1]) for i in range(0, len(replies), 2)]
+
+    def set(self, key: str, value, ttl: Optional[int]) -> int:
+        raw = self._encode(value)
+        self.client.set(self.prefix + key, raw, ex=ttl)
+        return len(raw)
+
+    def delete(self, key: str):
+        self.client.delete(self.prefix + key)
+
+    def ping(self) -> bool:
+        return bool(self.client.ping())
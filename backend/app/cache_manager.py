@@ -1,37 +1,233 @@
 import os
-import json
+import time
+import asyncio
+import threading
 from pathlib import Path
+from collections import OrderedDict
+from typing import List
+
+from app.cache_backends import FileBackend, RedisBackend
+
+# Total size of the file cache before least recently used entries are evicted
+DEFAULT_MAX_BYTES = int(os.getenv('JSON_CACHE_MAX_MB', '256')) * 1024 * 1024
+# Hot keys kept in process memory in front of the shared tiers
+DEFAULT_MEMORY_ENTRIES = int(os.getenv('JSON_CACHE_MEMORY_ENTRIES', '128'))
+DEFAULT_MEMORY_BYTES = int(os.getenv('JSON_CACHE_MEMORY_MB', '32')) * 1024 * 1024
+# How long to stop using Redis after an error before trying it again
+REDIS_RETRY_SECONDS = 30
+
 
 class CacheManager:
-    def __init__(self):
-        self.cache_dir = Path("app/cache")
+    """Tiered cache: in-process memory, then Redis (if REDIS_URL is set), then files.
+
+    Reads go through the tiers in that order. Writes go to Redis when it is
+    configured and reachable and to the file cache otherwise, so entries
+    computed by one worker or instance are served by all of them. When Redis
+    fails the cache keeps working on files and retries Redis later.
+    """
+
+    def __init__(self, cache_dir=None, max_bytes: int = DEFAULT_MAX_BYTES,
+                 memory_entries: int = DEFAULT_MEMORY_ENTRIES, memory_bytes: int = DEFAULT_MEMORY_BYTES,
+                 redis_url: str = None, shared_backend=None):
+        self.cache_dir = Path(cache_dir or os.getenv('JSON_CACHE_DIR', 'app/cache'))
+        self.memory_entries = memory_entries
+        self.memory_bytes = memory_bytes
+        self._memory = OrderedDict()  # key -> (expires_at, value, size)
+        self._memory_size = 0
+        self._lock = threading.Lock()
         self._ensure_cache_dir_exists()
+        self.file_backend = FileBackend(self.cache_dir, max_bytes)
+
+        redis_url = redis_url or os.getenv('REDIS_URL')
+        if shared_backend is None and redis_url:
+            try:
+                shared_backend = RedisBackend.from_url(redis_url)
+            except Exception as e:
+                print(f"Redis unavailable, using file cache only: {e}")
+        self.shared_backend = shared_backend
+        self._shared_down_until = 0.0
+
+        self.stats_counters = {
+            "memory_hits": 0, "shared_hits": 0, "file_hits": 0, "misses": 0,
+            "writes": 0, "shared_errors": 0,
+        }
 
     def _ensure_cache_dir_exists(self):
         """Ensure the cache directory exists"""
         self.cache_dir.mkdir(parents=True, exist_ok=True)
         print("✅ Cache directory ready")
 
-    async def get_cached_data(self, key: str, ttl: int = 3600):
-        """Get data from file system cache"""
-        try:
-            cache_file = self.cache_dir / f"{key}.json"
-            if cache_file.exists():
-                with open(cache_file, 'r') as f:
-                    return json.load(f)
-            return None
-        except Exception as e:
-            print(f"Cache read error: {e}")
+    def _count(self, name: str):
+        self.stats_counters[name] += 1
+
+    # In-memory tier
+
+    def _memory_get(self, key: str):
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                return None
+            expires_at, value, _ = entry
+            if expires_at is not None and expires_at <= time.time():
+                self._memory_pop(key)
+                return None
+            self._memory.move_to_end(key)
+            return value
+
+    def _memory_pop(self, key: str):
+        entry = self._memory.pop(key, None)
+        if entry is not None:
+            self._memory_size -= entry[2]
+
+    def _memory_set(self, key: str, expires_at, value, size: int):
+        if size > self.memory_bytes // 4:
+            return  # Large payloads only live in the shared tiers
+        with self._lock:
+            self._memory_pop(key)
+            self._memory[key] = (expires_at, value, size)
+            self._memory_size += size
+            while self._memory and (
+                len(self._memory) > self.memory_entries or self._memory_size > self.memory_bytes
+            ):
+                _, (_, _, evicted_size) = self._memory.popitem(last=False)
+                self._memory_size -= evicted_size
+
+    # Shared tier
+
+    def _shared(self):
+        """The shared backend, or None if there is none or it recently failed"""
+        if self.shared_backend is None or time.time() < self._shared_down_until:
             return None
+        return self.shared_backend
+
+    def _shared_failed(self, e: Exception):
+        self._count("shared_errors")
+        self._shared_down_until = time.time() + REDIS_RETRY_SECONDS
+        print(f"Shared cache error, using file cache for {REDIS_RETRY_SECONDS}s: {e}")
+
+    # Public API
+
+    def get_many(self, keys: List[str]) -> list:
+        """Get several keys (blocking); shared tier lookups take one round trip"""
+        values = [None] * len(keys)
+        missing = []
+        for i, key in enumerate(keys):
+            value = self._memory_get(key)
+            if value is not None:
+                self._count("memory_hits")
+                values[i] = value
+            else:
+                missing.append(i)
+
+        shared = self._shared()
+        if missing and shared is not None:
+            try:
+                entries = shared.get_many([keys[i] for i in missing])
+            except Exception as e:
+                self._shared_failed(e)
+                entries = [None] * len(missing)
+            still_missing = []
+            for i, entry in zip(missing, entries):
+                if entry is None:
+                    still_missing.append(i)
+                    continue
+                self._count("shared_hits")
+                expires_at, values[i], size = entry
+                self._memory_set(keys[i], expires_at, values[i], size)
+            missing = still_missing
+
+        for i in missing:
+            try:
+                entry = self.file_backend.get(keys[i])
+            except Exception as e:
+                print(f"Cache read error: {e}")
+                entry = None
+            if entry is None:
+                self._count("misses")
+                continue
+            self._count("file_hits")
+            expires_at, values[i], size = entry
+            self._memory_set(keys[i], expires_at, values[i], size)
+        return values
+
+    def get(self, key: str, ttl: int = 3600):
+        """Get data from the cache (blocking). `ttl` is applied when writing."""
+        return self.get_many([key])[0]
+
+    def set(self, key: str, data, ttl: int = 3600):
+        """Set data in the cache (blocking); JSON-serializable data or bytes. ttl=None never expires."""
+        expires_at = time.time() + ttl if ttl is not None else None
+        size = None
+        shared = self._shared()
+        if shared is not None:
+            try:
+                size = shared.set(key, data, ttl)
+            except Exception as e:
+                self._shared_failed(e)
+        if size is None:
+            try:
+                size = self.file_backend.set(key, data, ttl)
+            except Exception as e:
+                print(f"Cache write error: {e}")
+                return
+        self._count("writes")
+        self._memory_set(key, expires_at, data, size)
 
-    async def set_cached_data(self, key: str, data: dict, ttl: int = 3600):
-        """Set data in file system cache"""
+    def delete(self, key: str):
+        with self._lock:
+            self._memory_pop(key)
+        shared = self._shared()
+        if shared is not None:
+            try:
+                shared.delete(key)
+            except Exception as e:
+                self._shared_failed(e)
+        self.file_backend.delete(key)
+
+    def clear(self):
+        """Drop every entry of the memory and file tiers of this instance (the shared tier is left alone)"""
+        with self._lock:
+            self._memory.clear()
+            self._memory_size = 0
+        self.file_backend.clear()
+
+    def ping(self) -> bool:
+        """True if the primary tier (Redis when configured, else the file cache) is usable"""
+        if self.shared_backend is None:
+            return self.cache_dir.is_dir()
         try:
-            cache_file = self.cache_dir / f"{key}.json"
-            with open(cache_file, 'w') as f:
-                json.dump(data, f)
-        except Exception as e:
-            print(f"Cache write error: {e}")
+            return self.shared_backend.ping()
+        except Exception:
+            return False
+
+    @property
+    def backend_name(self) -> str:
+        backend = self.shared_backend or self.file_backend
+        return backend.name
+
+    def stats(self) -> dict:
+        lookups = sum(self.stats_counters[k] for k in ("memory_hits", "shared_hits", "file_hits", "misses"))
+        hits = lookups - self.stats_counters["misses"]
+        return {
+            **self.stats_counters,
+            "backend": self.backend_name,
+            "hit_ratio": round(hits / lookups, 3) if lookups else None,
+            "memory_entries": len(self._memory),
+            "memory_bytes": self._memory_size,
+            "file": self.file_backend.stats(),
+        }
+
+    async def get_cached_data(self, key: str, ttl: int = 3600):
+        """Get data from the cache; Redis and disk reads run off the event loop"""
+        value = self._memory_get(key)
+        if value is not None:
+            self._count("memory_hits")
+            return value
+        return await asyncio.to_thread(self.get, key, ttl)
+
+    async def set_cached_data(self, key: str, data, ttl: int = 3600):
+        """Set data in the cache; the write runs off the event loop"""
+        await asyncio.to_thread(self.set, key, data, ttl)
 
 # Create a singleton instance
-cache_manager = CacheManager() 
\ No newline at end of file
+cache_manager = CacheManager()
@@ -1,32 +1,340 @@
+"""
+Incremental sync of the FastF1 cache directory to and from object storage.
+
+Both directions compare a manifest of path -> size/mtime/sha256 and only
+transfer files that differ, with a bounded number of transfers in flight.
+The remote manifest is stored next to the files as `manifest.json` and is
+written last, so an interrupted upload never advertises missing files.
+Locally, hashes are remembered in `.sync_manifest.json` and reused while a
+file's size and mtime are unchanged. Large files (e.g. the
+`_extended_timing_data.ff1pkl` of a session) are zlib compressed in transit.
+
+Storage is chosen from the environment:
+    SUPABASE_URL, SUPABASE_KEY  Supabase storage bucket CACHE_BUCKET (default
+                                "fastf1-cache")
+    CACHE_SYNC_DIR              a local directory standing in for the bucket
+
+Run from backend/:
+
+    python -m app.cache_sync push --cache-dir cache
+    python -m app.cache_sync pull --cache-dir /cache/fastf1 --store /mnt/cache-mirror
+
+In production the cache is pulled before the API starts (see render.yaml).
+"""
 import os
-import glob
-from app.cache_manager import cache_manager
-
-async def sync_cache_to_storage(local_cache_dir: str):
-    """Upload new cache files to Supabase storage"""
-    # Get all cache files
-    cache_files = glob.glob(os.path.join(local_cache_dir, '**/*'), recursive=True)
-    
-    for file_path in cache_files:
-        if os.path.isfile(file_path):
-            # Get relative path for storage
-            relative_path = os.path.relpath(file_path, local_cache_dir)
-            # Upload file
-            await cache_manager.upload_file(file_path, relative_path)
-
-async def sync_cache_from_storage(local_cache_dir: str):
-    """Download cache files from Supabase storage"""
+import json
+import time
+import zlib
+import asyncio
+import hashlib
+import argparse
+import tempfile
+import logging
+from pathlib import Path
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = "manifest.json"
+LOCAL_MANIFEST_NAME = ".sync_manifest.json"
+# Files larger than this are compressed before they are transferred
+COMPRESS_MIN_BYTES = 64 * 1024
+DEFAULT_CONCURRENCY = int(os.getenv('CACHE_SYNC_CONCURRENCY', '8'))
+# FastF1's HTTP cache is rebuilt on demand and changes on every request
+EXCLUDED_NAMES = {LOCAL_MANIFEST_NAME, "fastf1_http_cache.sqlite"}
+
+
+class LocalObjectStore:
+    """A directory used as a bucket, for development, tests and mounted volumes"""
+
+    def __init__(self, root):
+        self.root = Path(root)
+
+    def get(self, name: str) -> Optional[bytes]:
+        try:
+            return (self.root / name).read_bytes()
+        except FileNotFoundError:
+            return None
+
+    def put(self, name: str, data: bytes):
+        _write_atomic(self.root / name, data)
+
+    def delete(self, name: str):
+        try:
+            (self.root / name).unlink()
+        except FileNotFoundError:
+            pass
+
+    def public_url(self, name: str) -> str:
+        return (self.root / name).resolve().as_uri()
+
+
+class SupabaseObjectStore:
+    """A Supabase storage bucket"""
+
+    def __init__(self, url: str, key: str, bucket: str = "fastf1-cache"):
+        from supabase import create_client
+        self.bucket = create_client(url, key).storage.from_(bucket)
+
+    def get(self, name: str) -> Optional[bytes]:
+        try:
+            return self.bucket.download(name)
+        except Exception as e:
+            # The client raises a generic storage error for missing objects
+            if "not found" in str(e).lower():
+                return None
+            raise
+
+    def put(self, name: str, data: bytes):
+        self.bucket.upload(name, data, {"upsert": "true", "content-type": "application/octet-stream"})
+
+    def delete(self, name: str):
+        self.bucket.remove([name])
+
+    def public_url(self, name: str) -> str:
+        return self.bucket.get_public_url(name)
+
+
+def default_store():
+    """Object store configured by the environment, or None"""
+    if os.getenv('SUPABASE_URL') and os.getenv('SUPABASE_KEY'):
+        try:
+            return SupabaseObjectStore(
+                os.environ['SUPABASE_URL'], os.environ['SUPABASE_KEY'], os.getenv('CACHE_BUCKET', 'fastf1-cache')
+            )
+        except ImportError:
+            # The supabase client is optional and not in requirements.txt
+            logger.warning("SUPABASE_URL is set but the supabase package is not installed")
+    if os.getenv('CACHE_SYNC_DIR'):
+        return LocalObjectStore(os.environ['CACHE_SYNC_DIR'])
+    return None
+
+
+def _write_atomic(path: Path, data: bytes):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
     try:
-        # List all files in the bucket
-        files = cache_manager.supabase.storage.from_(cache_manager.bucket_name).list()
-        
-        for file in files:
-            # Download each file
-            destination = os.path.join(local_cache_dir, file['name'])
-            await cache_manager.download_file(file['name'], destination)
-    except Exception as e:
-        print(f"Error syncing from storage: {e}")
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def _sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _read_json(data: Optional[bytes]) -> dict:
+    if not data:
+        return {}
+    try:
+        return json.loads(data)
+    except ValueError:
+        return {}
+
+
+def scan_cache(cache_dir) -> dict:
+    """Manifest of the local cache directory: {relative path: {size, mtime, sha256}}.
+
+    Files whose size and mtime match the last sync are not hashed again.
+    """
+    cache_dir = Path(cache_dir)
+    known = _read_json(_read_file(cache_dir / LOCAL_MANIFEST_NAME)).get("files", {})
+    files = {}
+    for path in cache_dir.rglob("*"):
+        if not path.is_file() or path.name in EXCLUDED_NAMES or path.suffix == ".tmp":
+            continue
+        name = path.relative_to(cache_dir).as_posix()
+        stat = path.stat()
+        previous = known.get(name)
+        if previous and previous["size"] == stat.st_size and previous["mtime"] == stat.st_mtime:
+            sha256 = previous["sha256"]
+        else:
+            sha256 = _sha256(path)
+        files[name] = {"size": stat.st_size, "mtime": stat.st_mtime, "sha256": sha256}
+    return files
+
 
-async def get_cache_url(file_path: str) -> str:
+def _read_file(path: Path) -> Optional[bytes]:
+    try:
+        return path.read_bytes()
+    except FileNotFoundError:
+        return None
+
+
+def _save_local_manifest(cache_dir, files: dict):
+    data = json.dumps({"files": files}, separators=(",", ":")).encode()
+    _write_atomic(Path(cache_dir) / LOCAL_MANIFEST_NAME, data)
+
+
+async def _run_bounded(jobs, concurrency: int) -> list:
+    """Run blocking callables in threads, at most `concurrency` at a time"""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(job):
+        async with semaphore:
+            return await asyncio.to_thread(job)
+
+    return await asyncio.gather(*(run(job) for job in jobs), return_exceptions=True)
+
+
+def _upload(store, cache_dir: Path, name: str, entry: dict) -> int:
+    data = (cache_dir / name).read_bytes()
+    if hashlib.sha256(data).hexdigest() != entry["sha256"]:
+        raise IOError(f"{name} changed while syncing")
+    if entry["compressed"]:
+        data = zlib.compress(data, 6)
+    store.put(name, data)
+    return len(data)
+
+
+def _download(store, cache_dir: Path, name: str, entry: dict) -> int:
+    data = store.get(name)
+    if data is None:
+        raise IOError(f"{name} is in the manifest but missing from storage")
+    transferred = len(data)
+    if entry.get("compressed"):
+        data = zlib.decompress(data)
+    if hashlib.sha256(data).hexdigest() != entry["sha256"]:
+        raise IOError(f"Checksum mismatch for {name}")
+    path = cache_dir / name
+    _write_atomic(path, data)
+    os.utime(path, (entry["mtime"], entry["mtime"]))
+    return transferred
+
+
+def _summary(direction: str, names: list, results: list, skipped: int, started: float) -> dict:
+    failed = [(name, result) for name, result in zip(names, results) if isinstance(result, Exception)]
+    for name, error in failed:
+        logger.error(f"Failed to {direction} {name}: {error}")
+    summary = {
+        "transferred": len(names) - len(failed),
+        "skipped": skipped,
+        "failed": len(failed),
+        "bytes": sum(r for r in results if not isinstance(r, Exception)),
+        "seconds": round(time.perf_counter() - started, 2),
+    }
+    logger.info(f"Cache {direction}: {summary}")
+    return summary
+
+
+async def sync_cache_to_storage(local_cache_dir: str, store=None, concurrency: int = DEFAULT_CONCURRENCY,
+                                prune: bool = False) -> dict:
+    """Upload new and changed cache files, then the manifest"""
+    started = time.perf_counter()
+    store = store or default_store()
+    if store is None:
+        raise RuntimeError("No cache storage configured")
+    cache_dir = Path(local_cache_dir)
+
+    local = await asyncio.to_thread(scan_cache, cache_dir)
+    remote = _read_json(await asyncio.to_thread(store.get, MANIFEST_NAME)).get("files", {})
+
+    changed = [
+        name for name, entry in local.items()
+        if remote.get(name, {}).get("sha256") != entry["sha256"]
+    ]
+    manifest = {} if prune else dict(remote)
+    manifest.update({name: remote[name] for name in local if name in remote})
+    for name in changed:
+        manifest[name] = {**local[name], "compressed": local[name]["size"] >= COMPRESS_MIN_BYTES}
+
+    results = await _run_bounded(
+        [lambda name=name: _upload(store, cache_dir, name, manifest[name]) for name in changed], concurrency
+    )
+    # Don't advertise files whose upload failed
+    for name, result in zip(changed, results):
+        if isinstance(result, Exception):
+            if name in remote:
+                manifest[name] = remote[name]
+            else:
+                manifest.pop(name, None)
+
+    if prune:
+        stale = [name for name in remote if name not in local]
+        await _run_bounded([lambda name=name: store.delete(name) for name in stale], concurrency)
+
+    if changed or (prune and remote.keys() - local.keys()):
+        data = json.dumps({"version": 1, "updated": time.time(), "files": manifest}).encode()
+        await asyncio.to_thread(store.put, MANIFEST_NAME, data)
+    await asyncio.to_thread(_save_local_manifest, cache_dir, local)
+    return _summary("upload", changed, results, len(local) - len(changed), started)
+
+
+async def sync_cache_from_storage(local_cache_dir: str, store=None, concurrency: int = DEFAULT_CONCURRENCY) -> dict:
+    """Download cache files that are missing or differ locally"""
+    started = time.perf_counter()
+    store = store or default_store()
+    if store is None:
+        raise RuntimeError("No cache storage configured")
+    cache_dir = Path(local_cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+
+    remote = _read_json(await asyncio.to_thread(store.get, MANIFEST_NAME)).get("files", {})
+    local = await asyncio.to_thread(scan_cache, cache_dir)
+
+    missing = [
+        name for name, entry in remote.items()
+        if local.get(name, {}).get("sha256") != entry["sha256"]
+    ]
+    results = await _run_bounded(
+        [lambda name=name: _download(store, cache_dir, name, remote[name]) for name in missing], concurrency
+    )
+
+    for name, result in zip(missing, results):
+        if not isinstance(result, Exception):
+            entry = remote[name]
+            local[name] = {"size": entry["size"], "mtime": entry["mtime"], "sha256": entry["sha256"]}
+    await asyncio.to_thread(_save_local_manifest, cache_dir, local)
+    return _summary("download", missing, results, len(remote) - len(missing), started)
+
+
+async def get_cache_url(file_path: str, store=None) -> str:
     """Get public URL for a cache file"""
-    return cache_manager.get_public_url(file_path) 
\ No newline at end of file
+    store = store or default_store()
+    if store is None:
+        raise RuntimeError("No cache storage configured")
+    return store.public_url(file_path)
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Sync the FastF1 cache with object storage")
+    parser.add_argument('direction', choices=['push', 'pull'])
+    parser.add_argument('--cache-dir', default=os.getenv('FF1_CACHE_DIR', 'cache'), help="FastF1 cache directory")
+    parser.add_argument('--store', help="Local directory to use as storage instead of the environment's bucket")
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument('--prune', action='store_true', help="On push, delete remote files missing locally")
+    args = parser.parse_args()
+
+    if args.direction == 'push':
+        store = LocalObjectStore(args.store) if args.store else default_store()
+        if store is None:
+            logger.warning("No cache storage configured, nothing to sync")
+            return
+        asyncio.run(sync_cache_to_storage(args.cache_dir, store, args.concurrency, args.prune))
+        return
+
+    # The pull runs before the API starts (see render.yaml) and is best-effort:
+    # without it FastF1 fills the cache on demand, so it must never block startup
+    try:
+        store = LocalObjectStore(args.store) if args.store else default_store()
+        if store is None:
+            logger.warning("No cache storage configured, nothing to sync")
+            return
+        asyncio.run(sync_cache_from_storage(args.cache_dir, store, args.concurrency))
+    except Exception as e:
+        logger.error(f"Cache pull failed, starting with the local cache: {e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,34 +1,100 @@
-import fastf1
+"""
+Warmup / precompute job for the derived data store.
+
+Loads each requested session once and writes its results, laps and per-lap
+telemetry as Parquet (see app/derived_store.py). Sessions whose FastF1 cache
+files hash to the same value as the last build are skipped, so the job can
+be re-run or resumed after an interruption.
+
+Run from backend/:
+
+    python -m app.data_cache --seasons 2023 2024 --events Monaco --sessions R Q
+    python -m app.data_cache --seasons 2024            # every event of 2024
+"""
+import os
+import argparse
 import logging
 from pathlib import Path
-import pandas as pd
+
+import fastf1
+
+from app import derived_store
+from app.query_store import query_store
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Configure FastF1 cache
-CACHE_DIR = Path(__file__).parent / "fastf1_cache"
-CACHE_DIR.mkdir(exist_ok=True)
-fastf1.Cache.enable_cache(str(CACHE_DIR))
+# Same FastF1 cache directory the API uses in development
+DEFAULT_CACHE_DIR = os.getenv('FF1_CACHE_DIR', str(Path(__file__).parent.parent / "cache"))
+
+
+def _source_dir(session) -> str:
+    """Directory of the FastF1 cache files backing a session"""
+    # FastF1 drops the leading '/static/' of the api path
+    return os.path.join(fastf1.Cache._CACHE_DIR, session.api_path[8:])
+
 
-def initialize_cache():
-    """Initialize FastF1 cache with Saudi Arabian GP 2024"""
+def precompute_session(year: int, event, session_type: str, force: bool = False) -> str:
+    """Build the artifacts of one session; returns 'built', 'skipped' or 'failed'"""
     try:
-        logger.info("Loading 2024 Saudi Arabian GP data...")
-        
-        # Load Saudi Arabian GP (Round 2)
-        logger.info("Caching Saudi Arabian GP sessions...")
-        race = fastf1.get_session(2024, 2, 'R')
-        race.load()  # This will cache the full session data
-        
-        quali = fastf1.get_session(2024, 2, 'Q')
-        quali.load()  # This will cache the full session data
-        
-        logger.info("Successfully cached Saudi Arabian GP sessions")
-        
+        session = fastf1.get_session(year, event, session_type)
+        round_number = int(session.event['RoundNumber'])
+        target = derived_store.session_dir(year, round_number, session_type)
+
+        manifest = derived_store.read_manifest(year, round_number, session_type)
+        current_hash = derived_store.source_hash(_source_dir(session))
+        if (not force and manifest is not None
+                and manifest.get("store_version") == derived_store.STORE_VERSION
+                and current_hash is not None
+                and manifest.get("content_hash") == current_hash):
+            logger.info(f"Up to date: {year} round {round_number} {session_type}")
+            return 'skipped'
+
+        logger.info(f"Loading {year} round {round_number} {session_type}...")
+        session.load()
+        # The cache files exist now even if they didn't before the load
+        content_hash = derived_store.source_hash(_source_dir(session))
+        manifest = derived_store.write_session(session, target, content_hash)
+        logger.info(f"Wrote {target} ({manifest['laps']} laps, {manifest['telemetry_rows']} telemetry rows)")
+        query_store.ingest_session(year, round_number, session_type, session)
+        return 'built'
     except Exception as e:
-        logger.error(f"Error caching race data: {str(e)}")
+        logger.error(f"Error precomputing {year} {event} {session_type}: {str(e)}")
+        return 'failed'
+
+
+def initialize_cache(seasons, events=None, sessions=('R', 'Q'), force: bool = False) -> dict:
+    """Precompute every requested session of the given seasons"""
+    summary = {'built': 0, 'skipped': 0, 'failed': 0}
+    for year in seasons:
+        if events:
+            targets = [int(e) if str(e).isdigit() else e for e in events]
+        else:
+            schedule = fastf1.get_event_schedule(year, include_testing=False)
+            targets = [int(r) for r in schedule['RoundNumber']]
+
+        for event in targets:
+            for session_type in sessions:
+                summary[precompute_session(year, event, session_type, force)] += 1
+
+    logger.info(f"Precompute finished: {summary}")
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute Parquet artifacts for F1 sessions")
+    parser.add_argument('--seasons', type=int, nargs='+', default=[2024])
+    parser.add_argument('--events', nargs='*', help="Event names or round numbers (default: all)")
+    parser.add_argument('--sessions', nargs='+', default=['R', 'Q'])
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR, help="FastF1 cache directory")
+    parser.add_argument('--force', action='store_true', help="Rebuild even if up to date")
+    args = parser.parse_args()
+
+    os.makedirs(args.cache_dir, exist_ok=True)
+    fastf1.Cache.enable_cache(args.cache_dir)
+    initialize_cache(args.seasons, args.events, args.sessions, args.force)
+
 
 if __name__ == "__main__":
-    initialize_cache() 
\ No newline at end of file
+    main()
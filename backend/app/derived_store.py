@@ -0,0 +1,192 @@
+"""
+Per-session derived data store (Parquet).
+
+Layout under STORE_DIR:
+
+    {year}/{round:02d}_{session}/
+        manifest.json         content hash, FastF1 version, build time
+        results.parquet       session.results
+        laps.parquet          session.laps (timing columns only)
+        telemetry/driver={n}/part.parquet
+                              lap.get_telemetry() of every lap, one row
+                              group per lap so a single lap is read alone
+
+Artifacts are written by `python -m app.data_cache` and read by the routers
+with column pruning and row-group filters, without loading FastF1 sessions.
+"""
+import os
+import json
+import shutil
+import hashlib
+import logging
+from pathlib import Path
+from datetime import datetime, timezone
+from typing import Optional, List
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+logger = logging.getLogger(__name__)
+
+STORE_DIR = Path(os.getenv('DERIVED_STORE_DIR', Path(__file__).parent / "derived_store"))
+
+# Bump when the artifact layout or contents change, forces a rebuild
+STORE_VERSION = 1
+
+RESULTS_COLUMNS = [
+    'DriverNumber', 'BroadcastName', 'Abbreviation', 'FullName', 'TeamName',
+    'Position', 'ClassifiedPosition', 'GridPosition', 'Q1', 'Q2', 'Q3',
+    'Time', 'Status', 'Points',
+]
+
+LAPS_COLUMNS = [
+    'Driver', 'DriverNumber', 'Team', 'LapNumber', 'Stint', 'Time', 'LapStartTime',
+    'LapTime', 'Sector1Time', 'Sector2Time', 'Sector3Time',
+    'PitInTime', 'PitOutTime', 'Compound', 'TyreLife', 'FreshTyre',
+    'IsPersonalBest', 'TrackStatus', 'Position', 'Deleted', 'IsAccurate',
+]
+
+TELEMETRY_COLUMNS = [
+    'SessionTime', 'Time', 'Distance', 'Speed', 'RPM', 'nGear',
+    'Throttle', 'Brake', 'DRS', 'X', 'Y', 'Z',
+]
+
+BOOLEAN_COLUMNS = ['IsPersonalBest', 'FreshTyre', 'Deleted', 'IsAccurate']
+
+
+def session_dir(year: int, round_number: int, session_type: str) -> Path:
+    return STORE_DIR / str(year) / f"{int(round_number):02d}_{session_type.upper()}"
+
+
+def read_manifest(year: int, round_number: int, session_type: str) -> Optional[dict]:
+    path = session_dir(year, round_number, session_type) / "manifest.json"
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def has_session(year: int, round_number: int, session_type: str) -> bool:
+    manifest = read_manifest(year, round_number, session_type)
+    return manifest is not None and manifest.get("store_version") == STORE_VERSION
+
+
+def source_hash(source_dir: Optional[str]) -> Optional[str]:
+    """sha256 over the FastF1 cache files a session was built from"""
+    if not source_dir or not os.path.isdir(source_dir):
+        return None
+    digest = hashlib.sha256(f"store-v{STORE_VERSION}".encode())
+    for name in sorted(os.listdir(source_dir)):
+        path = os.path.join(source_dir, name)
+        if not name.endswith('.ff1pkl') or not os.path.isfile(path):
+            continue
+        digest.update(name.encode())
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _select(frame: pd.DataFrame, columns: List[str]) -> pd.DataFrame:
+    frame = pd.DataFrame(frame)[[c for c in columns if c in frame.columns]].copy()
+    for column in BOOLEAN_COLUMNS:
+        if column in frame.columns:
+            frame[column] = frame[column].astype('boolean')
+    return frame
+
+
+def write_session(session, target: Path, content_hash: Optional[str]):
+    """Write all artifacts of a loaded session to `target` atomically"""
+    import fastf1
+
+    tmp = target.with_name(target.name + ".tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+
+    _select(session.results, RESULTS_COLUMNS).to_parquet(tmp / "results.parquet", index=False)
+    laps = _select(session.laps, LAPS_COLUMNS)
+    laps.to_parquet(tmp / "laps.parquet", index=False)
+
+    telemetry_rows = 0
+    for driver in session.laps['DriverNumber'].dropna().unique():
+        driver_laps = session.laps.pick_driver(driver)
+        writer = None
+        path = tmp / "telemetry" / f"driver={driver}" / "part.parquet"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            for _, lap in driver_laps.iterlaps():
+                try:
+                    telemetry = lap.get_telemetry()
+                except Exception as e:
+                    logger.warning(f"No telemetry for driver {driver} lap {lap['LapNumber']}: {e}")
+                    continue
+                if telemetry.empty:
+                    continue
+                telemetry = _select(telemetry, TELEMETRY_COLUMNS)
+                telemetry.insert(0, 'LapNumber', int(lap['LapNumber']))
+                table = pa.Table.from_pandas(telemetry, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(path, table.schema)
+                # One row group per lap
+                writer.write_table(table, row_group_size=len(telemetry))
+                telemetry_rows += len(telemetry)
+        finally:
+            if writer is not None:
+                writer.close()
+
+    manifest = {
+        "store_version": STORE_VERSION,
+        "content_hash": content_hash,
+        "fastf1_version": fastf1.__version__,
+        "built_at": datetime.now(timezone.utc).isoformat(),
+        "drivers": sorted(str(d) for d in laps['DriverNumber'].dropna().unique()),
+        "laps": len(laps),
+        "telemetry_rows": telemetry_rows,
+    }
+    with open(tmp / "manifest.json", 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    shutil.rmtree(target, ignore_errors=True)
+    os.replace(tmp, target)
+    return manifest
+
+
+def read_results(year: int, round_number: int, session_type: str, columns: Optional[List[str]] = None):
+    """session.results from the store, or None if the session isn't built"""
+    if not has_session(year, round_number, session_type):
+        return None
+    path = session_dir(year, round_number, session_type) / "results.parquet"
+    return pd.read_parquet(path, columns=columns)
+
+
+def _driver_filter(driver: str) -> list:
+    """Match a driver number or a three letter abbreviation"""
+    return [[('DriverNumber', '=', str(driver))], [('Driver', '=', str(driver).upper())]]
+
+
+def read_laps(year: int, round_number: int, session_type: str,
+              driver: Optional[str] = None, columns: Optional[List[str]] = None):
+    """session.laps from the store (optionally one driver), or None if not built"""
+    if not has_session(year, round_number, session_type):
+        return None
+    path = session_dir(year, round_number, session_type) / "laps.parquet"
+    filters = _driver_filter(driver) if driver is not None else None
+    return pd.read_parquet(path, columns=columns, filters=filters)
+
+
+def read_lap_telemetry(year: int, round_number: int, session_type: str, driver: str,
+                       lap_number: int, columns: Optional[List[str]] = None):
+    """Telemetry of one lap from the store, or None if the session isn't built.
+
+    `driver` must be a driver number; only the row group of the lap is read.
+    """
+    if not has_session(year, round_number, session_type):
+        return None
+    path = session_dir(year, round_number, session_type) / "telemetry" / f"driver={driver}" / "part.parquet"
+    if not path.exists():
+        return pd.DataFrame(columns=columns or TELEMETRY_COLUMNS)
+    if columns is not None and 'LapNumber' not in columns:
+        columns = ['LapNumber'] + list(columns)
+    return pd.read_parquet(path, columns=columns, filters=[('LapNumber', '=', int(lap_number))])
@@ -0,0 +1,62 @@
+"""
+Deferred FastF1 import with its cache enabled.
+
+Importing fastf1 (and requests-cache, which it pulls in) is the largest part
+of the API's import time, and most requests are answered from the response
+cache or the derived store without it. Modules that need FastF1 call
+`get_fastf1()` at first use instead of importing it at module load.
+"""
+import os
+import logging
+import tempfile
+import threading
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+ENVIRONMENT = os.getenv('ENVIRONMENT', 'development')
+
+_fastf1 = None
+_cache_dir = None
+_lock = threading.Lock()
+
+
+def default_cache_dir() -> str:
+    """FF1_CACHE_DIR if set, else the mounted disk in production and backend/cache in development"""
+    if os.getenv('FF1_CACHE_DIR'):
+        return os.getenv('FF1_CACHE_DIR')
+    if ENVIRONMENT == 'production':
+        return '/cache/fastf1'
+    return os.path.join(os.path.dirname(os.path.dirname(__file__)), 'cache')
+
+
+def prepare_cache_dir(cache_dir: Optional[str] = None) -> str:
+    """Create the FastF1 cache directory (or a temporary fallback) and use it from now on"""
+    global _cache_dir
+    cache_dir = cache_dir or default_cache_dir()
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        logger.info(f"Cache directory created/verified at: {cache_dir}")
+    except Exception as e:
+        logger.error(f"Error creating cache directory: {e}")
+        # Fallback to a temporary directory if we can't create the cache dir
+        cache_dir = os.path.join(tempfile.gettempdir(), 'fastf1_cache')
+        os.makedirs(cache_dir, exist_ok=True)
+        logger.warning(f"Using temporary cache directory: {cache_dir}")
+    _cache_dir = cache_dir
+    return cache_dir
+
+
+def get_fastf1(cache_dir: Optional[str] = None):
+    """The fastf1 module, imported and its cache enabled on the first call"""
+    global _fastf1
+    if _fastf1 is not None:
+        return _fastf1
+    with _lock:
+        if _fastf1 is None:
+            import fastf1
+            cache_dir = cache_dir or _cache_dir or prepare_cache_dir()
+            fastf1.Cache.enable_cache(cache_dir)
+            logger.info("FastF1 cache enabled")
+            _fastf1 = fastf1
+    return _fastf1
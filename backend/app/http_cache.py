@@ -0,0 +1,163 @@
+"""
+HTTP conditional caching for the race endpoints.
+
+Responses get an ETag derived from the endpoint's cache key, its parameters
+and the version of the data behind it, so clients and CDNs can revalidate
+with If-None-Match and get a 304 without the session being loaded or the
+body serialized. Sessions of past weekends never change and are marked
+immutable; the current weekend gets a short max-age and ETags that roll
+over with it, since FastF1 data is still being updated.
+"""
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+from typing import Optional
+from importlib.metadata import version
+
+from fastapi import Request, Response
+
+from app import derived_store
+
+# Bump when the shape of any response changes
+RESPONSE_VERSION = 1
+# Read from the package metadata, without importing fastf1
+FASTF1_VERSION = version('fastf1')
+
+# Sessions are final this long after the race day of their event
+FINALIZED_AFTER = timedelta(days=2)
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+RECENT_MAX_AGE = 300
+RECENT_CACHE_CONTROL = f"public, max-age={RECENT_MAX_AGE}"
+
+# Data versions of recently requested sessions: (year, round, session) ->
+# (manifest mtime, version), so requests stat the manifest instead of parsing it
+DATA_VERSION_ENTRIES = 1024
+_data_versions = OrderedDict()
+_data_versions_lock = threading.Lock()
+
+
+def is_finalized(event_date: Optional[str]) -> bool:
+    """True if the event (race day as YYYY-MM-DD) is far enough in the past"""
+    if not event_date:
+        return False
+    try:
+        day = datetime.strptime(event_date[:10], "%Y-%m-%d").date()
+    except ValueError:
+        return False
+    return date.today() - day >= FINALIZED_AFTER
+
+
+def data_version(year: int, round_number: int, session_type: str) -> str:
+    """Identifies the data a session's responses are built from"""
+    key = (year, int(round_number), session_type.upper())
+    try:
+        mtime = os.stat(derived_store.session_dir(*key) / "manifest.json").st_mtime_ns
+    except OSError:
+        mtime = None
+    with _data_versions_lock:
+        cached = _data_versions.get(key)
+        if cached is not None and cached[0] == mtime:
+            _data_versions.move_to_end(key)
+            return cached[1]
+
+    manifest = derived_store.read_manifest(*key) if mtime is not None else None
+    if manifest and manifest.get("content_hash"):
+        version = f"store:{manifest['content_hash']}"
+    else:
+        version = _session_version()
+    with _data_versions_lock:
+        _data_versions[key] = (mtime, version)
+        _data_versions.move_to_end(key)
+        while len(_data_versions) > DATA_VERSION_ENTRIES:
+            _data_versions.popitem(last=False)
+    return version
+
+
+def _session_version() -> str:
+    """Version of data built from FastF1 sessions. Snapshots (app.snapshot) compute
+    lap telemetry on their own time base, so their format is part of it."""
+    from app.session_cache import SESSION_SNAPSHOTS
+    from app.snapshot import SNAPSHOT_VERSION
+    if SESSION_SNAPSHOTS:
+        return f"fastf1:{FASTF1_VERSION}:snapshot{SNAPSHOT_VERSION}"
+    return f"fastf1:{FASTF1_VERSION}"
+
+
+def make_etag(*parts) -> str:
+    digest = hashlib.sha256(":".join(str(part) for part in parts).encode()).hexdigest()
+    # Weak, because GZipMiddleware may re-encode the body
+    return f'W/"{digest[:32]}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+
+def set_cache_status(request: Request, status: str):
+    """Record how a response was produced ("not-modified", "hit" or "miss") for TimingMiddleware"""
+    request.state.cache_status = status
+
+
+class Validator:
+    """ETag and Cache-Control of one response.
+
+    Endpoints that pick JSON or packed output from the Accept header pass
+    negotiated=True, so shared caches key those responses on Accept too.
+    """
+
+    def __init__(self, cache_key: str, year: int, round_number: int, session_type: str,
+                 event_date: Optional[str], *params, negotiated: bool = False):
+        self.negotiated = negotiated
+        self.finalized = is_finalized(event_date)
+        self.version = version = data_version(year, round_number, session_type)
+        if self.finalized:
+            self.cache_control = IMMUTABLE_CACHE_CONTROL
+            epoch = "final"
+        else:
+            self.cache_control = RECENT_CACHE_CONTROL
+            epoch = int(time.time() // RECENT_MAX_AGE)
+        self.etag = make_etag(RESPONSE_VERSION, cache_key, version, epoch, *params)
+
+    @property
+    def headers(self) -> dict:
+        headers = {"ETag": self.etag, "Cache-Control": self.cache_control}
+        if self.negotiated:
+            headers["Vary"] = "Accept"
+        return headers
+
+    def not_modified(self, request: Request) -> Optional[Response]:
+        """A 304 response if the client already has this version, else None"""
+        if not etag_matches(request.headers.get("if-none-match"), self.etag):
+            return None
+        set_cache_status(request, "not-modified")
+        return Response(status_code=304, headers=self.headers)
+
+    def apply(self, response: Response) -> Response:
+        response.headers["ETag"] = self.etag
+        response.headers["Cache-Control"] = self.cache_control
+        if self.negotiated:
+            add_vary(response.headers, "Accept")
+        return response
+
+
+def add_vary(headers, value: str):
+    """Add a header name to Vary, keeping the ones already listed"""
+    existing = [v.strip() for v in headers.get("Vary", "").split(",") if v.strip()]
+    if value.lower() not in (v.lower() for v in existing):
+        existing.append(value)
+    headers["Vary"] = ", ".join(existing)
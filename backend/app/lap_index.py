@@ -0,0 +1,108 @@
+"""
+Per-session lap index.
+
+Built once from the laps of a session and then used to answer lap-time
+requests for one driver or the whole field with array slices instead of
+pick_driver() and per-row timedelta conversions. Laps are sorted by driver and
+lap number so every driver owns one contiguous slice. Times are int64
+milliseconds with MISSING_MS for missing values.
+"""
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from app.serializers import LAP_TIME_COLUMNS
+
+MISSING_MS = np.iinfo(np.int64).min
+
+# Qualifying hot laps are within this many milliseconds of the driver's best lap
+HOT_LAP_WINDOW_MS = 3000
+
+
+def _milliseconds(series: pd.Series) -> np.ndarray:
+    values = series.to_numpy(dtype='timedelta64[ns]')
+    ms = values.astype(np.int64) // 1_000_000
+    ms[np.isnat(values)] = MISSING_MS
+    return ms
+
+
+class LapIndex:
+    def __init__(self, laps: pd.DataFrame):
+        laps = laps[laps['LapNumber'].notna()]
+        drivers = laps['DriverNumber'].astype(str).to_numpy()
+        lap_numbers = laps['LapNumber'].to_numpy(dtype=np.int64)
+        order = np.lexsort((lap_numbers, drivers))
+
+        self.driver_numbers = drivers[order]
+        self.lap_numbers = lap_numbers[order]
+        # lap_time, sector_1, ... as int64 ms
+        self.times = {
+            name: _milliseconds(laps[column])[order]
+            for name, column in LAP_TIME_COLUMNS.items()
+        }
+        self.is_personal_best = laps['IsPersonalBest'].fillna(False).astype(bool).to_numpy()[order]
+        compounds = laps['Compound'].astype('category')
+        self.compound_categories = list(compounds.cat.categories)
+        self.compound_codes = compounds.cat.codes.to_numpy()[order]
+
+        # driver number -> (start, stop) of its laps
+        self.drivers, starts = np.unique(self.driver_numbers, return_index=True)
+        stops = np.append(starts[1:], len(self.driver_numbers))
+        self.slices = {d: (int(a), int(b)) for d, a, b in zip(self.drivers, starts, stops)}
+        abbreviations = laps['Driver'].astype(str).str.upper().to_numpy()[order] if 'Driver' in laps else None
+        self.abbreviations = {}
+        if abbreviations is not None:
+            self.abbreviations = {abbreviations[start]: d for d, (start, _) in self.slices.items()}
+
+        # Best lap of each driver and the laps within the hot lap window of it
+        lap_ms = self.times["lap_time"]
+        valid = lap_ms != MISSING_MS
+        self.best_ms = {}
+        self.best_lap_numbers = {}
+        best_per_lap = np.full(len(lap_ms), MISSING_MS)
+        for driver, (start, stop) in self.slices.items():
+            driver_valid = valid[start:stop]
+            if driver_valid.any():
+                driver_ms = np.where(driver_valid, lap_ms[start:stop], np.iinfo(np.int64).max)
+                best_index = int(driver_ms.argmin())
+                self.best_ms[driver] = int(driver_ms[best_index])
+                self.best_lap_numbers[driver] = int(self.lap_numbers[start + best_index])
+                best_per_lap[start:stop] = self.best_ms[driver]
+        self.valid = valid
+        self.hot = valid & (np.abs(lap_ms - best_per_lap) <= HOT_LAP_WINDOW_MS)
+
+    def __len__(self):
+        return len(self.lap_numbers)
+
+    def driver_number(self, driver: str) -> Optional[str]:
+        """Driver number for a number or three letter abbreviation"""
+        driver = str(driver)
+        if driver in self.slices:
+            return driver
+        return self.abbreviations.get(driver.upper())
+
+    def select(self, driver: Optional[str] = None, hot_laps: bool = False) -> pd.DataFrame:
+        """Timed laps of one driver (or all drivers if None) as a laps-like DataFrame"""
+        if driver is None:
+            start, stop = 0, len(self)
+        else:
+            number = self.driver_number(driver)
+            if number is None:
+                start = stop = 0
+            else:
+                start, stop = self.slices[number]
+        mask = (self.hot if hot_laps else self.valid)[start:stop]
+
+        frame = {
+            'DriverNumber': self.driver_numbers[start:stop][mask],
+            'LapNumber': self.lap_numbers[start:stop][mask],
+        }
+        for name, column in LAP_TIME_COLUMNS.items():
+            ms = self.times[name][start:stop][mask]
+            frame[column] = pd.to_timedelta(np.where(ms == MISSING_MS, np.nan, ms), unit='ms')
+        frame['IsPersonalBest'] = self.is_personal_best[start:stop][mask]
+        frame['Compound'] = pd.Categorical.from_codes(
+            self.compound_codes[start:stop][mask], categories=self.compound_categories
+        )
+        return pd.DataFrame(frame)
@@ -1,11 +1,12 @@
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.gzip import GZipMiddleware
-from fastapi.responses import JSONResponse
-import fastf1
+from fastapi.responses import JSONResponse, PlainTextResponse
 import os
+from contextlib import asynccontextmanager
 from app.routers import races
-from app.cache_manager import CacheManager
+from app.metrics import metrics, start_phases, server_timing, SERVER_TIMING, PROMETHEUS_CONTENT_TYPE
+from app.app_context import app_context
 import time
 from starlette.middleware.base import BaseHTTPMiddleware
 from typing import Callable
@@ -18,42 +19,48 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Configure FastF1 cache with absolute path
-ENVIRONMENT = os.getenv('ENVIRONMENT', 'development')
-if ENVIRONMENT == 'production':
-    cache_dir = '/cache/fastf1'  # Use the mounted disk in production
-else:
-    cache_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'cache')
-
-# Ensure cache directory exists
-try:
-    os.makedirs(cache_dir, exist_ok=True)
-    logger.info(f"Cache directory created/verified at: {cache_dir}")
-except Exception as e:
-    logger.error(f"Error creating cache directory: {e}")
-    # Fallback to a temporary directory if we can't create the cache dir
-    import tempfile
-    cache_dir = os.path.join(tempfile.gettempdir(), 'fastf1_cache')
-    os.makedirs(cache_dir, exist_ok=True)
-    logger.warning(f"Using temporary cache directory: {cache_dir}")
-
-# Enable FastF1 cache
-fastf1.Cache.enable_cache(cache_dir)
-logger.info("FastF1 cache enabled")
-
-# Initialize cache manager
-cache_manager = CacheManager()
-
 class TimingMiddleware(BaseHTTPMiddleware):
     async def dispatch(self, request: Request, call_next: Callable):
         start_time = time.time()
+        phases = start_phases()
         response = await call_next(request)
         process_time = time.time() - start_time
         response.headers["X-Process-Time"] = str(process_time)
-        logger.info(f"Request to {request.url.path} took {process_time:.2f} seconds")
+        # Set by the race endpoints: "not-modified" (304), "hit" (response cache) or "miss" (computed)
+        cache_status = getattr(request.state, "cache_status", None)
+        if cache_status is not None:
+            response.headers["X-Cache"] = cache_status
+        if SERVER_TIMING or "x-server-timing" in request.headers:
+            response.headers["Server-Timing"] = server_timing(phases, process_time)
+        logger.info(f"Request to {request.url.path} took {process_time:.2f} seconds ({cache_status or 'uncached'})")
+
+        # Record the request once the body is sent, so streamed responses
+        # include the time (and compression) of the whole stream
+        route = request.scope.get("route")
+        route = route.path if route is not None else "unmatched"
+        body = response.body_iterator
+
+        async def observed_body():
+            try:
+                async for chunk in body:
+                    yield chunk
+            finally:
+                metrics.observe_request(route, request.method, response.status_code,
+                                        time.time() - start_time, phases, cache_status)
+
+        response.body_iterator = observed_body()
         return response
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Once per worker process; with PRELOAD_APP=1 the heavy imports and
+    # shared data were already built in the master (see app.app_context)
+    app_context.start()
+    yield
+    app_context.shutdown()
+
 app = FastAPI(
+    lifespan=lifespan,
     title="F1 Race Search API",
     description="API for searching and analyzing Formula 1 race data",
     version="1.0.0",
@@ -82,6 +89,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Cache", "X-Process-Time", "Server-Timing"],
 )
 
 # Include routers
@@ -93,10 +101,25 @@ async def health_check():
     return {
         "status": "ok",
         "message": "F1 Race Search API is running",
-        "cache_status": "connected" if cache_manager.redis.ping() else "disconnected",
+        "cache_status": "connected" if app_context.cache_manager.ping() else "disconnected",
+        "cache_backend": app_context.cache_manager.backend_name,
+        "session_cache": app_context.session_cache_stats(),
+        "query_store": app_context.query_store_stats(),
+        "worker_pool": app_context.worker_pool.stats(),
+        "prefetch": app_context.prefetcher.stats(),
+        "startup": app_context.stats(),
         "environment": ENVIRONMENT
     }
 
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    """Request, cache and worker pool metrics in the Prometheus text format"""
+    return PlainTextResponse(
+        metrics.render(app_context.cache_manager.stats(), app_context.session_cache_stats(),
+                       app_context.worker_pool.stats(), app_context.query_store_stats()),
+        media_type=PROMETHEUS_CONTENT_TYPE
+    )
+
 @app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception):
     logger.error(f"Global error handler caught: {exc}", exc_info=True)
@@ -0,0 +1,239 @@
+"""
+Request metrics and per-phase timing.
+
+The steps of a request (schedule resolution, session load, lap pick,
+telemetry merge, serialization, compression, ...) are wrapped in
+span("phase"). Durations are summed per request, including the part that runs
+on the worker pool (see worker_pool._run_task), and recorded in latency
+histograms by TimingMiddleware, which can also return them in a
+Server-Timing header. GET /metrics renders everything in the Prometheus text
+format together with cache and worker pool counters read at scrape time.
+"""
+import os
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Optional
+
+# PlainTextResponse appends the charset
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4"
+
+# Histogram buckets in seconds, from cache hits to cold session loads
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Return the phase breakdown of every request in a Server-Timing header;
+# otherwise only when the request has an X-Server-Timing header
+SERVER_TIMING = os.getenv('SERVER_TIMING', '0') == '1'
+
+# Phase durations of the current request: phase -> seconds
+_phases = contextvars.ContextVar("phases", default=None)
+
+
+def start_phases() -> dict:
+    """Start collecting phase durations in the current context"""
+    phases = {}
+    _phases.set(phases)
+    return phases
+
+
+@contextmanager
+def span(phase: str):
+    """Time a block and add it to the current request's phase (no-op outside requests)"""
+    phases = _phases.get()
+    if phases is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        phases[phase] = phases.get(phase, 0.0) + time.perf_counter() - start
+
+
+def add_phases(phases: Optional[dict]):
+    """Merge phases measured elsewhere (e.g. in a worker process) into the current request"""
+    current = _phases.get()
+    if current is None or not phases:
+        return
+    for phase, seconds in phases.items():
+        current[phase] = current.get(phase, 0.0) + seconds
+
+
+def server_timing(phases: dict, total: float) -> str:
+    """Server-Timing header value, durations in milliseconds"""
+    entries = [f"{phase};dur={seconds * 1000:.1f}" for phase, seconds in phases.items()]
+    entries.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(entries)
+
+
+def _labels(names: tuple, values: tuple) -> str:
+    if not names:
+        return ""
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: tuple, buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self._series = {}  # label values -> [count per bucket..., sum, count]
+
+    def observe(self, values: tuple, seconds: float):
+        series = self._series.get(values)
+        if series is None:
+            series = self._series[values] = [0] * len(self.buckets) + [0.0, 0]
+        for i, bound in enumerate(self.buckets):
+            if seconds <= bound:
+                series[i] += 1
+        series[-2] += seconds
+        series[-1] += 1
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for values, series in sorted(self._series.items()):
+            for bound, count in zip(self.buckets, series):
+                labels = _labels(self.labels + ("le",), values + (repr(bound),))
+                lines.append(f"{self.name}_bucket{labels} {count}")
+            labels = _labels(self.labels + ("le",), values + ("+Inf",))
+            lines.append(f"{self.name}_bucket{labels} {series[-1]}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, values)} {series[-2]:.6f}")
+            lines.append(f"{self.name}_count{_labels(self.labels, values)} {series[-1]}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: tuple):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._series = {}
+
+    def inc(self, values: tuple, amount: float = 1):
+        self._series[values] = self._series.get(values, 0) + amount
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for values, value in sorted(self._series.items()):
+            lines.append(f"{self.name}{_labels(self.labels, values)} {value}")
+        return lines
+
+
+def _sample(lines: list, name: str, kind: str, help: str, samples: list):
+    """Append a metric read from stats at scrape time: samples are [(labels dict, value)]"""
+    lines.append(f"# HELP {name} {help}")
+    lines.append(f"# TYPE {name} {kind}")
+    for labels, value in samples:
+        if value is None:
+            continue
+        lines.append(f"{name}{_labels(tuple(labels), tuple(labels.values()))} {value}")
+
+
+class Metrics:
+    """Request metrics of this API process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.request_seconds = Histogram(
+            "f1_http_request_duration_seconds", "Time until the last byte of the response was sent",
+            ("route", "method", "status")
+        )
+        self.phase_seconds = Histogram(
+            "f1_request_phase_duration_seconds", "Time spent in each phase of a request",
+            ("route", "phase")
+        )
+        self.responses = Counter(
+            "f1_http_responses_total", "Responses by route and response cache status",
+            ("route", "cache")
+        )
+
+    def observe_request(self, route: str, method: str, status: int, seconds: float,
+                        phases: dict, cache_status: Optional[str]):
+        with self._lock:
+            self.request_seconds.observe((route, method, str(status)), seconds)
+            for phase, phase_seconds in phases.items():
+                self.phase_seconds.observe((route, phase), phase_seconds)
+            self.responses.inc((route, cache_status or "none"))
+
+    def render(self, cache_stats: dict, session_cache_stats: list, pool_stats: dict,
+               query_store_stats: list = ()) -> str:
+        """All metrics in the Prometheus text format"""
+        with self._lock:
+            lines = self.request_seconds.render() + self.phase_seconds.render() + self.responses.render()
+
+        _sample(lines, "f1_response_cache_lookups_total", "counter",
+                "Response cache lookups by the tier that answered them", [
+                    ({"tier": "memory"}, cache_stats["memory_hits"]),
+                    ({"tier": "shared"}, cache_stats["shared_hits"]),
+                    ({"tier": "file"}, cache_stats["file_hits"]),
+                    ({"tier": "miss"}, cache_stats["misses"]),
+                ])
+        _sample(lines, "f1_response_cache_writes_total", "counter", "Response cache writes",
+                [({}, cache_stats["writes"])])
+        _sample(lines, "f1_response_cache_shared_errors_total", "counter", "Errors of the shared (Redis) tier",
+                [({}, cache_stats["shared_errors"])])
+        _sample(lines, "f1_response_cache_bytes", "gauge", "Bytes held by each local tier", [
+            ({"tier": "memory"}, cache_stats["memory_bytes"]),
+            ({"tier": "file"}, cache_stats["file"]["disk_bytes"]),
+        ])
+
+        # Session caches live in the worker processes: sum their last reported stats
+        totals = {}
+        for stats in session_cache_stats:
+            for name in ("hits", "misses", "loads", "upgrades", "coalesced", "evictions", "load_errors",
+                         "entries", "bytes"):
+                totals[name] = totals.get(name, 0) + stats.get(name, 0)
+        _sample(lines, "f1_session_cache_lookups_total", "counter", "Session cache lookups", [
+            ({"result": "hit"}, totals.get("hits")),
+            ({"result": "miss"}, totals.get("misses")),
+            ({"result": "coalesced"}, totals.get("coalesced")),
+        ])
+        _sample(lines, "f1_session_cache_loads_total", "counter", "Session loads and in-place upgrades", [
+            ({"kind": "load"}, totals.get("loads")),
+            ({"kind": "upgrade"}, totals.get("upgrades")),
+            ({"kind": "error"}, totals.get("load_errors")),
+        ])
+        _sample(lines, "f1_session_cache_evictions_total", "counter", "Evicted sessions",
+                [({}, totals.get("evictions"))])
+        _sample(lines, "f1_session_cache_entries", "gauge", "Loaded sessions", [({}, totals.get("entries"))])
+        _sample(lines, "f1_session_cache_bytes", "gauge", "Estimated bytes of loaded sessions",
+                [({}, totals.get("bytes"))])
+
+        _sample(lines, "f1_worker_pool_pending", "gauge", "Tasks queued or running on the worker pool", [
+            ({"kind": "request"}, pool_stats["pending"]),
+            ({"kind": "background"}, pool_stats.get("background")),
+        ])
+        _sample(lines, "f1_worker_pool_queue_limit", "gauge", "Pending tasks before requests are rejected",
+                [({}, pool_stats["queue_depth"])])
+        _sample(lines, "f1_worker_pool_workers", "gauge", "Worker processes (0: tasks run in threads)",
+                [({}, pool_stats["workers"])])
+        _sample(lines, "f1_worker_pool_tasks_total", "counter", "Finished worker pool tasks by outcome", [
+            ({"outcome": "completed"}, pool_stats["completed"]),
+            ({"outcome": "failed"}, pool_stats["failed"]),
+            ({"outcome": "rejected"}, pool_stats["rejected"]),
+        ])
+        _sample(lines, "f1_worker_pool_restarts_total", "counter", "Worker processes replaced after dying",
+                [({}, pool_stats.get("restarts"))])
+
+        # Sessions are ingested into the query store in the processes that load them
+        ingests = {}
+        for stats in query_store_stats:
+            for name in ("ingested", "ingest_errors", "ingest_pending"):
+                ingests[name] = ingests.get(name, 0) + stats.get(name, 0)
+        _sample(lines, "f1_query_store_ingests_total", "counter", "Background query store ingests by outcome", [
+            ({"outcome": "ingested"}, ingests.get("ingested")),
+            ({"outcome": "error"}, ingests.get("ingest_errors")),
+        ])
+        _sample(lines, "f1_query_store_ingests_pending", "gauge", "Sessions waiting for a query store ingest",
+                [({}, ingests.get("ingest_pending"))])
+        return "\n".join(lines) + "\n"
+
+
+# Create a singleton instance
+metrics = Metrics()
@@ -0,0 +1,90 @@
+"""
+Mini-sector comparison of laps.
+
+The lap distance is split into N equal mini-sectors and the time each lap
+spends in every one of them is taken from its Distance/Time telemetry by
+linear interpolation at the sector boundaries. The result is a small
+laps x sectors matrix from which deltas and per-sector winners follow
+directly.
+"""
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+# Laps shorter than this fraction of the median lap distance are incomplete
+MIN_LAP_FRACTION = 0.9
+
+
+def _time_seconds(telemetry: pd.DataFrame) -> np.ndarray:
+    column = 'Time' if 'Time' in telemetry.columns else 'SessionTime'
+    seconds = telemetry[column].dt.total_seconds().to_numpy(dtype=np.float64)
+    return seconds - np.nanmin(seconds)
+
+
+def boundary_times(telemetry: pd.DataFrame, boundaries: np.ndarray) -> np.ndarray:
+    """Time since the start of the lap at which each boundary distance was passed"""
+    distance = telemetry['Distance'].to_numpy(dtype=np.float64)
+    seconds = _time_seconds(telemetry)
+    valid = ~(np.isnan(distance) | np.isnan(seconds))
+    distance, seconds = distance[valid], seconds[valid]
+    # Integrated distance can jitter backwards by a few centimeters
+    distance = np.maximum.accumulate(distance)
+    # Before the first sample (a few meters past the line) the lap time is ~0
+    return np.interp(boundaries, distance, seconds, right=np.nan)
+
+
+def compare_laps(laps: Dict[tuple, pd.DataFrame], sectors: int) -> dict:
+    """Mini-sector times of several laps, keyed by (driver number, lap number)"""
+    keys = list(laps.keys())
+    lengths = np.array([
+        float(np.nanmax(laps[key]['Distance'])) if len(laps[key]) else 0.0 for key in keys
+    ])
+    complete = lengths >= MIN_LAP_FRACTION * np.median(lengths) if len(lengths) else lengths.astype(bool)
+    if not complete.any():
+        raise LookupError("No complete laps to compare")
+
+    # Every complete lap covers the whole of the shortest complete lap
+    track_length = float(lengths[complete].min())
+    boundaries = np.linspace(0.0, track_length, sectors + 1)
+    times = np.full((len(keys), sectors + 1), np.nan)
+    for i, key in enumerate(keys):
+        if complete[i]:
+            times[i] = boundary_times(laps[key], boundaries)
+    segment = np.diff(times, axis=1)
+
+    fastest = np.nanmin(segment, axis=0)
+    winner = np.full(sectors, -1)
+    has_time = ~np.isnan(segment).all(axis=0)
+    winner[has_time] = np.nanargmin(segment[:, has_time], axis=0)
+
+    def ms(values) -> list:
+        return [None if np.isnan(v) else int(round(v * 1000)) for v in values]
+
+    entries = []
+    for i, (driver_number, lap_number) in enumerate(keys):
+        entry = {"driver_number": driver_number, "lap_number": lap_number}
+        if not complete[i]:
+            entry["error"] = "Incomplete lap"
+        else:
+            entry.update({
+                "total_ms": ms([np.nansum(segment[i])])[0],
+                "sector_ms": ms(segment[i]),
+                "delta_to_fastest_ms": ms(segment[i] - fastest),
+                "sectors_won": int((winner == i).sum()),
+            })
+        entries.append(entry)
+
+    return {
+        "sectors": sectors,
+        "track_length": round(track_length, 1),
+        "boundaries": [round(b, 1) for b in boundaries.tolist()],
+        "laps": entries,
+        "fastest": [
+            {
+                "driver_number": keys[w][0], "lap_number": keys[w][1], "sector_ms": ms([fastest[s]])[0]
+            } if w >= 0 else None
+            for s, w in enumerate(winner)
+        ],
+        "theoretical_best_ms": ms([np.nansum(fastest)])[0],
+    }
@@ -0,0 +1,145 @@
+"""
+Background warming of the data the next steps of the UI ask for.
+
+The frontend always goes results -> lap times of the field -> telemetry of a
+few laps. Once results of an event have been sent, the router schedules a
+job here that loads the session with telemetry, builds the lap index, merges
+the fastest-lap telemetry of the top finishers and precomputes the lap times
+response, so the next clicks don't pay a cold load.
+
+Jobs are low priority: only PREFETCH_CONCURRENCY run at a time, each step
+waits until the worker owning the session is idle (and is dropped if it
+stays busy), steps don't count toward the worker pool's request limit, and
+all jobs are cancelled once the session caches get close to their memory
+budget, since warming would then only evict sessions users are looking at.
+
+Configuration:
+    PREFETCH_ENABLED          0 disables prefetching (default 1)
+    PREFETCH_CONCURRENCY      jobs running at the same time (default 1)
+    PREFETCH_TOP_N            finishers whose fastest lap is warmed (default 3)
+    PREFETCH_MAX_PENDING      steps only start while fewer worker pool tasks
+                              are pending (default 1)
+    PREFETCH_MEMORY_FRACTION  cancel when a session cache is this full (default 0.8)
+"""
+import os
+import time
+import asyncio
+import logging
+from typing import Awaitable, Callable
+
+from app.session_cache import session_cache
+from app.worker_pool import worker_pool
+
+logger = logging.getLogger(__name__)
+
+PREFETCH_ENABLED = os.getenv('PREFETCH_ENABLED', '1') == '1'
+PREFETCH_CONCURRENCY = int(os.getenv('PREFETCH_CONCURRENCY', '1'))
+PREFETCH_TOP_N = int(os.getenv('PREFETCH_TOP_N', '3'))
+PREFETCH_MAX_PENDING = int(os.getenv('PREFETCH_MAX_PENDING', '1'))
+PREFETCH_MEMORY_FRACTION = float(os.getenv('PREFETCH_MEMORY_FRACTION', '0.8'))
+
+# Jobs waiting for a slot beyond this are not scheduled
+MAX_QUEUED_JOBS = 8
+# How often a waiting step checks the worker pool, and how long it waits at most
+IDLE_POLL_SECONDS = 0.5
+IDLE_TIMEOUT_SECONDS = 30
+# The same job isn't scheduled again within this many seconds
+REPEAT_AFTER_SECONDS = 600
+
+
+class PrefetchCancelled(Exception):
+    pass
+
+
+class Prefetcher:
+    def __init__(self, enabled: bool = PREFETCH_ENABLED, concurrency: int = PREFETCH_CONCURRENCY,
+                 max_pending: int = PREFETCH_MAX_PENDING, memory_fraction: float = PREFETCH_MEMORY_FRACTION):
+        self.enabled = enabled
+        self.concurrency = concurrency
+        self.max_pending = max_pending
+        self.memory_fraction = memory_fraction
+        self._semaphore = None
+        self._tasks = set()
+        self._scheduled = {}  # job key -> time it was scheduled
+        self.counters = {"scheduled": 0, "completed": 0, "skipped": 0, "cancelled": 0, "failed": 0}
+
+    def memory_pressure(self) -> bool:
+        """True if any session cache is above memory_fraction of its budget"""
+        stats = worker_pool.session_cache_stats() if worker_pool.workers > 0 else [session_cache.stats()]
+        return any(s["bytes"] > self.memory_fraction * s["max_bytes"] for s in stats)
+
+    def schedule(self, key, job: Callable[[], Awaitable]) -> bool:
+        """Run job() in the background unless it ran recently or prefetching is paused"""
+        if not self.enabled:
+            return False
+        now = time.time()
+        if now - self._scheduled.get(key, 0) < REPEAT_AFTER_SECONDS or len(self._tasks) >= MAX_QUEUED_JOBS \
+                or self.memory_pressure():
+            self.counters["skipped"] += 1
+            return False
+        self._scheduled = {k: t for k, t in self._scheduled.items() if now - t < REPEAT_AFTER_SECONDS}
+        self._scheduled[key] = now
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+
+        task = asyncio.create_task(self._run(key, job))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        self.counters["scheduled"] += 1
+        return True
+
+    async def _run(self, key, job: Callable[[], Awaitable]):
+        try:
+            async with self._semaphore:
+                await job()
+            self.counters["completed"] += 1
+            logger.info(f"Prefetched {key}")
+        except (PrefetchCancelled, asyncio.CancelledError) as e:
+            self.counters["cancelled"] += 1
+            # Allow a retry once things calm down
+            self._scheduled.pop(key, None)
+            logger.info(f"Prefetch of {key} cancelled: {e or 'shutdown'}")
+        except Exception as e:
+            self.counters["failed"] += 1
+            logger.warning(f"Prefetch of {key} failed: {e}")
+
+    async def checkpoint(self, key):
+        """Wait until the worker owning `key` is idle and the pool has room for
+        the next step of a job, so prefetching never queues ahead of requests.
+
+        Raises PrefetchCancelled if it stays busy or memory runs short.
+        """
+        deadline = time.time() + IDLE_TIMEOUT_SECONDS
+        while True:
+            if self.memory_pressure():
+                self.cancel_all(current=False)
+                raise PrefetchCancelled("session cache memory pressure")
+            if not worker_pool.busy(key) and worker_pool.stats()["pending"] < self.max_pending:
+                return
+            if time.time() > deadline:
+                raise PrefetchCancelled("worker pool busy")
+            await asyncio.sleep(IDLE_POLL_SECONDS)
+
+    async def run(self, key, fn: Callable, *args):
+        """One step of a job: fn(*args) on the worker owning `key`, once it is idle"""
+        await self.checkpoint(key)
+        return await worker_pool.run_background(key, fn, *args)
+
+    def cancel_all(self, current: bool = True):
+        """Cancel every running job (except the calling one unless `current`)"""
+        this = asyncio.current_task()
+        for task in list(self._tasks):
+            if current or task is not this:
+                task.cancel()
+
+    def stats(self) -> dict:
+        return {
+            **self.counters,
+            "enabled": self.enabled,
+            "running": len(self._tasks),
+            "concurrency": self.concurrency,
+        }
+
+
+# Create a singleton instance
+prefetcher = Prefetcher()
@@ -0,0 +1,400 @@
+"""
+Cross-season analytical store of laps and results (Parquet, hive partitioned).
+
+Layout under QUERY_STORE_DIR:
+
+    laps/year={y}/round={r}/session={s}/part.parquet
+    results/year={y}/round={r}/session={s}/part.parquet
+    .version                touched on every write
+
+Sessions are added when they are loaded anyway: in the background after the
+lap index of a FastF1 session is built (app.session_data), by
+`python -m app.data_cache`, or in bulk from the derived store with
+`python -m app.query_store ingest`. Rows within a
+session are sorted by driver number, so row group statistics prune drivers
+as well as partitions prune (year, round, session).
+
+Queries (see `query`) filter, optionally group and aggregate one table,
+reading only the partitions and columns they touch; they never load FastF1.
+Times are stored as integer milliseconds.
+"""
+import os
+import re
+import time
+import shutil
+import logging
+import argparse
+import threading
+from pathlib import Path
+from typing import List, Optional
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from app.analytics import representative_laps
+
+logger = logging.getLogger(__name__)
+
+QUERY_STORE_DIR = Path(os.getenv('QUERY_STORE_DIR', Path(__file__).parent / "query_store"))
+
+PARTITIONING = ds.partitioning(
+    pa.schema([("year", pa.int16()), ("round", pa.int16()), ("session", pa.string())]),
+    flavor="hive"
+)
+
+# Queryable fields of each table, including the partition fields
+TABLE_FIELDS = {
+    "laps": [
+        "year", "round", "session", "event", "location", "driver", "driver_number", "team",
+        "lap_number", "stint", "lap_time_ms", "sector_1_ms", "sector_2_ms", "sector_3_ms",
+        "compound", "tyre_life", "fresh_tyre", "pit_in", "pit_out", "track_status", "position",
+        "is_personal_best", "deleted", "is_accurate", "representative",
+    ],
+    "results": [
+        "year", "round", "session", "event", "location", "driver", "driver_number", "full_name", "team",
+        "position", "grid_position", "status", "points", "q1_ms", "q2_ms", "q3_ms", "time_ms",
+    ],
+}
+
+AGGREGATES = {
+    "count": "count", "sum": "sum", "mean": "mean", "avg": "mean", "min": "min", "max": "max",
+    "median": "approximate_median", "stddev": "stddev", "distinct": "count_distinct",
+}
+
+FILTER_PATTERN = re.compile(r"^(\w+)\s*(==|!=|>=|<=|=|>|<)\s*(.*)$")
+MAX_ROWS = 10000
+
+
+def _ms(series: pd.Series) -> pd.Series:
+    return (pd.to_timedelta(series).dt.total_seconds() * 1000).round().astype('Int64')
+
+
+def _column(frame: pd.DataFrame, column: str) -> pd.Series:
+    return frame[column] if column in frame.columns else pd.Series(None, index=frame.index, dtype=object)
+
+
+def laps_table(laps: pd.DataFrame, event: Optional[str], location: Optional[str]) -> pd.DataFrame:
+    """session.laps in the query store schema"""
+    laps = laps[laps['LapNumber'].notna()]
+    representative = pd.Series(False, index=laps.index)
+    representative[representative_laps(laps).index] = True
+    frame = pd.DataFrame({
+        "event": event,
+        "location": location,
+        "driver": _column(laps, 'Driver').astype('string'),
+        "driver_number": laps['DriverNumber'].astype(str),
+        "team": _column(laps, 'Team').astype('string'),
+        "lap_number": laps['LapNumber'].astype('int16'),
+        "stint": pd.to_numeric(_column(laps, 'Stint'), errors='coerce').astype('Int16'),
+        "lap_time_ms": _ms(laps['LapTime']),
+        "sector_1_ms": _ms(laps['Sector1Time']),
+        "sector_2_ms": _ms(laps['Sector2Time']),
+        "sector_3_ms": _ms(laps['Sector3Time']),
+        "compound": _column(laps, 'Compound').astype('string'),
+        "tyre_life": pd.to_numeric(_column(laps, 'TyreLife'), errors='coerce').astype('Int16'),
+        "fresh_tyre": _column(laps, 'FreshTyre').astype('boolean'),
+        "pit_in": laps['PitInTime'].notna(),
+        "pit_out": laps['PitOutTime'].notna(),
+        "track_status": _column(laps, 'TrackStatus').astype('string'),
+        "position": pd.to_numeric(_column(laps, 'Position'), errors='coerce').astype('Int16'),
+        "is_personal_best": _column(laps, 'IsPersonalBest').astype('boolean'),
+        "deleted": _column(laps, 'Deleted').astype('boolean'),
+        "is_accurate": _column(laps, 'IsAccurate').astype('boolean'),
+        "representative": representative,
+    })
+    return frame.sort_values(["driver_number", "lap_number"], kind='stable')
+
+
+def results_table(results: pd.DataFrame, event: Optional[str], location: Optional[str]) -> pd.DataFrame:
+    """session.results in the query store schema"""
+    frame = pd.DataFrame({
+        "event": event,
+        "location": location,
+        "driver": _column(results, 'Abbreviation').astype('string'),
+        "driver_number": results['DriverNumber'].astype(str),
+        "full_name": _column(results, 'FullName').astype('string'),
+        "team": _column(results, 'TeamName').astype('string'),
+        "position": pd.to_numeric(_column(results, 'Position'), errors='coerce').astype('Int16'),
+        "grid_position": pd.to_numeric(_column(results, 'GridPosition'), errors='coerce').astype('Int16'),
+        "status": _column(results, 'Status').astype('string'),
+        "points": pd.to_numeric(_column(results, 'Points'), errors='coerce').astype('float64'),
+        "q1_ms": _ms(_column(results, 'Q1')),
+        "q2_ms": _ms(_column(results, 'Q2')),
+        "q3_ms": _ms(_column(results, 'Q3')),
+        "time_ms": _ms(_column(results, 'Time')),
+    })
+    return frame.sort_values("driver_number", kind='stable')
+
+
+def parse_filter(expression: str):
+    """"field<op>value" as a pyarrow expression; `=` with commas means one of the values"""
+    match = FILTER_PATTERN.match(expression.strip())
+    if match is None:
+        raise ValueError(f"Invalid filter {expression!r}, expected field<op>value")
+    name, op, raw = match.groups()
+    field = ds.field(name)
+
+    def value(text: str):
+        text = text.strip()
+        # Driver numbers are strings, as everywhere else in the API
+        if name == "driver_number":
+            return text
+        if text.lower() in ("true", "false"):
+            return text.lower() == "true"
+        try:
+            return int(text)
+        except ValueError:
+            pass
+        try:
+            return float(text)
+        except ValueError:
+            return text
+
+    if op in ("=", "==") and "," in raw:
+        return field.isin([value(v) for v in raw.split(",")]), name
+    operand = value(raw)
+    return {
+        "=": field == operand, "==": field == operand, "!=": field != operand,
+        ">": field > operand, ">=": field >= operand, "<": field < operand, "<=": field <= operand,
+    }[op], name
+
+
+class QueryStore:
+    def __init__(self, root: Path = QUERY_STORE_DIR):
+        self.root = Path(root)
+        self._lock = threading.Lock()
+        self._datasets = {}  # table -> (version, dataset)
+        self._executor = None
+        self._queued = set()  # sessions waiting for or in a background ingest
+        self.ingested = 0
+        self.ingest_errors = 0
+
+    def _path(self, table: str, year: int, round_number: int, session_type: str) -> Path:
+        return self.root / table / f"year={int(year)}" / f"round={int(round_number)}" / f"session={session_type.upper()}"
+
+    def _version(self) -> int:
+        try:
+            return (self.root / ".version").stat().st_mtime_ns
+        except OSError:
+            return 0
+
+    def has_session(self, year: int, round_number: int, session_type: str) -> bool:
+        return (self._path("laps", year, round_number, session_type) / "part.parquet").exists()
+
+    def _write(self, table: str, year: int, round_number: int, session_type: str, frame: pd.DataFrame):
+        target = self._path(table, year, round_number, session_type)
+        target.mkdir(parents=True, exist_ok=True)
+        tmp = target / f"part.parquet.{os.getpid()}.tmp"
+        pq.write_table(pa.Table.from_pandas(frame, preserve_index=False), tmp, row_group_size=2000)
+        os.replace(tmp, target / "part.parquet")
+
+    def ingest(self, year: int, round_number: int, session_type: str, laps: pd.DataFrame,
+               results: Optional[pd.DataFrame], event: Optional[str] = None, location: Optional[str] = None):
+        """Add (or replace) the laps and results of one session"""
+        self._write("laps", year, round_number, session_type, laps_table(laps, event, location))
+        if results is not None and not results.empty:
+            self._write("results", year, round_number, session_type, results_table(results, event, location))
+        self.root.mkdir(parents=True, exist_ok=True)
+        (self.root / ".version").touch()
+        logger.info(f"Query store: ingested {year} round {round_number} {session_type}")
+
+    def ingest_session(self, year: int, round_number: int, session_type: str, session):
+        """Ingest a FastF1 session that has its laps loaded"""
+        event = session.event
+        self.ingest(year, round_number, session_type, session.laps, session.results,
+                    str(event.get('EventName')), str(event.get('Location')))
+
+    def schedule_ingest(self, year: int, round_number: int, session_type: str, session) -> bool:
+        """Ingest a loaded session on a background thread, off the request path.
+
+        Returns False if the session is already stored or queued.
+        """
+        key = (year, int(round_number), session_type.upper())
+        with self._lock:
+            if key in self._queued or self.has_session(*key):
+                return False
+            self._queued.add(key)
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="query-store")
+        self._executor.submit(self._background_ingest, key, session)
+        return True
+
+    def _background_ingest(self, key: tuple, session):
+        try:
+            self.ingest_session(*key, session)
+            with self._lock:
+                self.ingested += 1
+        except Exception as e:
+            with self._lock:
+                self.ingest_errors += 1
+            logger.warning(f"Could not add {key} to the query store: {e}")
+        finally:
+            with self._lock:
+                self._queued.discard(key)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "ingested": self.ingested,
+                "ingest_errors": self.ingest_errors,
+                "ingest_pending": len(self._queued),
+            }
+
+    def _dataset(self, table: str):
+        version = self._version()
+        with self._lock:
+            entry = self._datasets.get(table)
+            if entry is not None and entry[0] == version:
+                return entry[1]
+        path = self.root / table
+        if not path.is_dir():
+            return None
+        dataset = ds.dataset(path, format="parquet", partitioning=PARTITIONING)
+        with self._lock:
+            self._datasets[table] = (version, dataset)
+        return dataset
+
+    def query(self, table: str, filters: List[str] = (), group_by: List[str] = (), metrics: List[str] = (),
+              select: List[str] = (), order_by: Optional[str] = None, limit: int = 1000) -> dict:
+        """Filter one table and either aggregate it per group or return the selected columns.
+
+        filters:  "year>=2021", "location=Monaco", "compound=SOFT,MEDIUM"
+        metrics:  "count", "min:lap_time_ms", "mean:lap_time_ms", ...
+        order_by: an output column, "-column" for descending
+        """
+        start = time.perf_counter()
+        if table not in TABLE_FIELDS:
+            raise ValueError(f"Unknown table {table!r}, expected one of {sorted(TABLE_FIELDS)}")
+        fields = TABLE_FIELDS[table]
+
+        expression, used = None, set()
+        for text in filters:
+            condition, name = parse_filter(text)
+            used.add(name)
+            expression = condition if expression is None else expression & condition
+
+        aggregations = []
+        for metric in metrics:
+            function, _, name = metric.partition(":")
+            if function not in AGGREGATES:
+                raise ValueError(f"Unknown aggregate {function!r}, expected one of {sorted(AGGREGATES)}")
+            if not name and function != "count":
+                raise ValueError(f"Aggregate {function!r} needs a field, e.g. {function}:lap_time_ms")
+            # A bare count counts rows: the year partition column is never null
+            label = f"{function}_{name}" if name else "count"
+            name = name or "year"
+            aggregations.append((name, AGGREGATES[function], label))
+            used.add(name)
+        used.update(group_by)
+        if not metrics:
+            select = list(select) or fields
+            used.update(select)
+        unknown = used - set(fields)
+        if unknown:
+            raise ValueError(f"Unknown fields {sorted(unknown)} for table {table!r}")
+
+        dataset = self._dataset(table)
+        if dataset is None:
+            raise LookupError("The query store is empty")
+        # Partition pruning and row group statistics come from the filter;
+        # only the columns the query touches are read
+        columns = [f for f in fields if f in used]
+        try:
+            data = dataset.to_table(columns=columns, filter=expression)
+            if metrics:
+                grouped = data.group_by(list(group_by)).aggregate(
+                    [(name, function) for name, function, _ in aggregations]
+                )
+        except pa.ArrowException as e:
+            # e.g. comparing a number column with text, or the mean of a text column
+            raise ValueError(f"Invalid query: {e}")
+
+        if metrics:
+            # pyarrow names aggregates "{column}_{function}"
+            renamed = {f"{name}_{function}": label for name, function, label in aggregations}
+            data = grouped.rename_columns([renamed.get(c, c) for c in grouped.column_names])
+            ordered = list(group_by) + [label for _, _, label in aggregations]
+            data = data.select(ordered)
+        else:
+            data = data.select(select)
+
+        if order_by:
+            descending = order_by.startswith("-")
+            name = order_by.lstrip("-")
+            if name not in data.column_names:
+                raise ValueError(f"Cannot order by {name!r}")
+            data = data.sort_by([(name, "descending" if descending else "ascending")])
+        total = data.num_rows
+        data = data.slice(0, min(limit, MAX_ROWS))
+
+        return {
+            "table": table,
+            "count": data.num_rows,
+            "total": total,
+            "columns": {name: data.column(name).to_pylist() for name in data.column_names},
+            "elapsed_ms": round((time.perf_counter() - start) * 1000, 2),
+        }
+
+    def sessions(self) -> List[dict]:
+        """(year, round, session) of every ingested session"""
+        dataset = self._dataset("laps")
+        if dataset is None:
+            return []
+        partitions = dataset.to_table(columns=["year", "round", "session"]).group_by(
+            ["year", "round", "session"]).aggregate([])
+        return sorted(partitions.to_pylist(), key=lambda s: (s["year"], s["round"], s["session"]))
+
+
+# Create a singleton instance
+query_store = QueryStore()
+
+
+def ingest_derived_store(store: QueryStore = query_store) -> int:
+    """Ingest every session of the derived store; returns the number of sessions"""
+    from app import derived_store
+    from app.schedule_index import schedule_index
+
+    count = 0
+    for year_dir in sorted(derived_store.STORE_DIR.glob("*")):
+        if not year_dir.name.isdigit():
+            continue
+        for session_dir in sorted(year_dir.glob("*_*")):
+            round_text, _, session_type = session_dir.name.partition("_")
+            if not round_text.isdigit() or session_type.endswith(".tmp"):
+                continue
+            year, round_number = int(year_dir.name), int(round_text)
+            laps = derived_store.read_laps(year, round_number, session_type)
+            if laps is None:
+                continue
+            try:
+                event = schedule_index.resolve(year, round_number=round_number)
+                name, location = event["event_name"], event["circuit_name"]
+            except Exception as e:
+                logger.warning(f"No event name for {year} round {round_number}: {e}")
+                name = location = None
+            results = derived_store.read_results(year, round_number, session_type)
+            store.ingest(year, round_number, session_type, laps, results, name, location)
+            count += 1
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cross-season query store")
+    parser.add_argument("command", choices=["ingest", "sessions", "clear"])
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    if args.command == "ingest":
+        print(f"Ingested {ingest_derived_store()} sessions from the derived store")
+    elif args.command == "sessions":
+        for session in query_store.sessions():
+            print(f"{session['year']} round {session['round']} {session['session']}")
+    else:
+        shutil.rmtree(query_store.root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
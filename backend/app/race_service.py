@@ -0,0 +1,334 @@
+"""
+Loading and shaping of race data for the API.
+
+The functions here take and return plain values (ints, strings, dicts, bytes)
+so they can run in a worker process of app.worker_pool. Errors are raised as
+exceptions and turned into HTTP responses by the routers.
+"""
+import logging
+from typing import List, Optional
+
+import pandas as pd
+
+from app import session_data
+from app.metrics import span
+from app.analytics import session_analytics
+from app.minisectors import compare_laps
+from app.track import lap_path
+from app.telemetry import reduce_telemetry, GridTooLarge, MAX_POINTS
+from app.serializers import (
+    TELEMETRY_CHANNELS, telemetry_rows, telemetry_columns, telemetry_packed,
+    lap_rows, lap_columns, lap_packed
+)
+
+logger = logging.getLogger(__name__)
+
+
+def build_race_results(year: int, round_number: int, race_name: str, date: str) -> dict:
+    session_results = session_data.get_results(year, round_number, 'R')
+
+    results = []
+    for _, driver in session_results.iterrows():
+        fastest_lap = False
+        if pd.notna(driver.get('FastestLap')):
+            try:
+                fastest_lap = bool(int(driver['FastestLap']))
+            except:
+                fastest_lap = bool(driver['FastestLap'])
+
+        result = {
+            "position": int(driver['Position']) if pd.notna(driver.get('Position')) else None,
+            "driver_number": str(driver['DriverNumber']) if pd.notna(driver.get('DriverNumber')) else None,
+            "driver_name": driver['FullName'] if pd.notna(driver.get('FullName')) else None,
+            "team": driver['TeamName'] if pd.notna(driver.get('TeamName')) else None,
+            "grid_position": int(driver['GridPosition']) if pd.notna(driver.get('GridPosition')) else None,
+            "status": driver['Status'] if pd.notna(driver.get('Status')) else None,
+            "points": float(driver['Points']) if pd.notna(driver.get('Points')) else None,
+            "fastest_lap": fastest_lap,
+            "fastest_lap_time": str(driver['FastestLapTime']) if pd.notna(driver.get('FastestLapTime')) else None,
+            "laps_completed": int(driver['NumberOfLaps']) if pd.notna(driver.get('NumberOfLaps')) else None
+        }
+        results.append(result)
+
+    return {
+        "race_name": race_name,
+        "date": date,
+        "results": results
+    }
+
+
+def build_qualifying_results(year: int, round_number: int, race_name: str, date: str) -> dict:
+    session_results = session_data.get_results(year, round_number, 'Q')
+
+    results = []
+    for _, driver in session_results.iterrows():
+        result = {
+            "position": int(driver['Position']) if pd.notna(driver.get('Position')) else None,
+            "driver_number": str(driver['DriverNumber']) if pd.notna(driver.get('DriverNumber')) else None,
+            "driver_name": driver['FullName'] if pd.notna(driver.get('FullName')) else None,
+            "team": driver['TeamName'] if pd.notna(driver.get('TeamName')) else None,
+            "q1_time": str(driver['Q1']) if pd.notna(driver.get('Q1')) else None,
+            "q2_time": str(driver['Q2']) if pd.notna(driver.get('Q2')) else None,
+            "q3_time": str(driver['Q3']) if pd.notna(driver.get('Q3')) else None,
+            "fastest_lap_time": str(driver['BestLapTime']) if pd.notna(driver.get('BestLapTime')) else None
+        }
+        results.append(result)
+
+    return {
+        "race_name": race_name,
+        "date": date,
+        "results": results
+    }
+
+
+def _lap_times(laps: pd.DataFrame, format: str):
+    return lap_columns(laps) if format == "columnar" else lap_rows(laps)
+
+
+def build_lap_times(year: int, round_number: int, race_name: str, session_identifier: str,
+                    driver_number: Optional[str], format: str = "rows", packed: bool = False):
+    """Lap times of one driver, or of every driver if driver_number is None.
+
+    For qualifying only hot laps (within 3 seconds of the driver's best) are kept.
+    """
+    index = session_data.get_lap_index(year, round_number, session_identifier)
+    hot_laps = session_identifier == 'Q'
+
+    if driver_number is not None:
+        with span("lap_pick"):
+            laps = index.select(driver_number, hot_laps=hot_laps)
+        with span("serialization"):
+            if packed:
+                meta = {"race_name": race_name, "driver_number": driver_number}
+                return lap_packed(laps, meta)
+            return {
+                "race_name": race_name,
+                "driver_number": driver_number,
+                "format": format,
+                "lap_times": _lap_times(laps, format)
+            }
+
+    # Whole field: one packed frame per driver, or one entry per driver
+    with span("serialization"):
+        if packed:
+            return b"".join(
+                lap_packed(index.select(number, hot_laps=hot_laps), {"race_name": race_name, "driver_number": number})
+                for number in index.drivers
+            )
+        return {
+            "race_name": race_name,
+            "format": format,
+            "drivers": {
+                str(number): _lap_times(index.select(number, hot_laps=hot_laps), format)
+                for number in index.drivers
+            }
+        }
+
+
+def build_session_analytics(year: int, round_number: int, race_name: str, session_identifier: str) -> dict:
+    """Stints, pace and gaps of the whole field, computed from one read of the laps"""
+    laps = session_data.get_laps(year, round_number, session_identifier)
+    with span("analytics"):
+        analytics = session_analytics(laps)
+    return {
+        "race_name": race_name,
+        "session_type": session_identifier,
+        **analytics
+    }
+
+
+def lap_times_frames(year: int, round_number: int, session_identifier: str,
+                     driver_number: Optional[str]) -> List[tuple]:
+    """[(driver number, laps DataFrame)] for one driver or the whole field, for streaming"""
+    index = session_data.get_lap_index(year, round_number, session_identifier)
+    hot_laps = session_identifier == 'Q'
+    numbers = [driver_number] if driver_number is not None else list(index.drivers)
+    return [(str(number), index.select(number, hot_laps=hot_laps)) for number in numbers]
+
+
+def telemetry_frame(year: int, round_number: int, session_identifier: str, driver_number: str,
+                    lap_number: int, reduce: Optional[dict] = None) -> pd.DataFrame:
+    """Telemetry of one lap, reduced and trimmed to the channels the API returns"""
+    telemetry = session_data.get_lap_telemetry(year, round_number, session_identifier, driver_number, lap_number)
+    logger.debug(f"Found {len(telemetry)} telemetry points")
+    if reduce:
+        with span("reduce"):
+            telemetry = reduce_telemetry(telemetry, reduce["points"], reduce["distance_step"], reduce["method"])
+    columns = [column for column, _, _ in TELEMETRY_CHANNELS.values() if column in telemetry.columns]
+    return telemetry[columns].reset_index(drop=True)
+
+
+def build_telemetry(year: int, round_number: int, race_name: str, session_identifier: str,
+                    driver_number: str, lap_number: int, format: str = "rows", reduce: Optional[dict] = None,
+                    packed: bool = False):
+    telemetry = telemetry_frame(year, round_number, session_identifier, driver_number, lap_number, reduce)
+
+    with span("serialization"):
+        if packed:
+            meta = {"race_name": race_name, "driver_number": driver_number, "lap_number": lap_number}
+            return telemetry_packed(telemetry, meta)
+
+        return {
+            "race_name": race_name,
+            "driver_number": driver_number,
+            "lap_number": lap_number,
+            "format": format,
+            "telemetry": telemetry_columns(telemetry) if format == "columnar" else telemetry_rows(telemetry)
+        }
+
+
+def _lap_telemetry_entry(pair: tuple, loader, format: str, reduce: dict, packed: bool = False):
+    """Telemetry of one lap of a batch, as a dict or as one packed frame.
+
+    When resampling to a point count, the distance step of the first lap is
+    stored in `reduce` and reused so that all laps share one distance grid.
+    """
+    driver_number, lap_number = pair
+    entry = {"driver_number": driver_number, "lap_number": lap_number}
+    telemetry = None
+    if loader is None:
+        entry["error"] = "Lap not found"
+    else:
+        try:
+            telemetry = loader()
+            if reduce["points"] is not None and reduce["method"] == "resample" and not telemetry.empty:
+                reduce["distance_step"] = float(telemetry['Distance'].max()) / (reduce["points"] - 1)
+                reduce["points"] = None
+                # Derived from a bounded point count; later laps may be a little longer
+                reduce["derived_step"] = True
+            with span("reduce"):
+                telemetry = reduce_telemetry(telemetry, reduce["points"], reduce["distance_step"], reduce["method"],
+                                             max_points=None if reduce.get("derived_step") else MAX_POINTS)
+        except GridTooLarge:
+            raise
+        except Exception as e:
+            entry["error"] = str(e)
+
+    with span("serialization"):
+        if packed:
+            return telemetry_packed(telemetry if telemetry is not None else pd.DataFrame(), entry)
+        if telemetry is not None:
+            entry["telemetry"] = telemetry_columns(telemetry) if format == "columnar" else telemetry_rows(telemetry)
+    return entry
+
+
+def build_telemetry_batch(year: int, round_number: int, race_name: str, session_identifier: str,
+                          pairs: List[tuple], format: str, reduce: dict, packed: bool = False):
+    """Telemetry of several laps of one session, loading the session once"""
+    selected = session_data.select_laps_telemetry(year, round_number, session_identifier, pairs)
+    entries = [_lap_telemetry_entry(pair, loader, format, reduce, packed) for pair, loader in selected]
+    if packed:
+        return b"".join(entries)
+    return {
+        "race_name": race_name,
+        "format": format,
+        "laps": entries
+    }
+
+
+def build_batch_lap(year: int, round_number: int, race_name: str, session_identifier: str,
+                    pair: tuple, format: str, reduce: dict, packed: bool = False):
+    """One lap of a streamed batch; returns the entry and the updated `reduce`"""
+    [(pair, loader)] = session_data.select_laps_telemetry(year, round_number, session_identifier, [pair])
+    entry = _lap_telemetry_entry(pair, loader, format, reduce, packed)
+    if not packed:
+        entry["race_name"] = race_name
+    return entry, reduce
+
+
+def build_minisectors(year: int, round_number: int, race_name: str, session_identifier: str,
+                      pairs: Optional[List[tuple]], sectors: int) -> dict:
+    """Mini-sector comparison of the given laps, or of every driver's fastest lap"""
+    if not pairs:
+        index = session_data.get_lap_index(year, round_number, session_identifier)
+        pairs = list(index.best_lap_numbers.items())
+
+    laps = {}
+    errors = []
+    for (driver_number, lap_number), loader in session_data.select_laps_telemetry(
+        year, round_number, session_identifier, pairs
+    ):
+        try:
+            if loader is None:
+                raise LookupError("Lap not found")
+            laps[(driver_number, lap_number)] = loader()
+        except Exception as e:
+            errors.append({"driver_number": driver_number, "lap_number": lap_number, "error": str(e)})
+
+    with span("minisectors"):
+        comparison = compare_laps(laps, sectors)
+    comparison["laps"].extend(errors)
+    return {"race_name": race_name, **comparison}
+
+
+def prefetch_session(year: int, round_number: int, session_identifier: str, top_n: int) -> List[tuple]:
+    """Warm the worker owning a session for the next steps of the UI.
+
+    Loads the session with telemetry, builds its lap index and merges the
+    fastest-lap telemetry of the top finishers. Returns the warmed laps.
+    """
+    index = session_data.get_lap_index(year, round_number, session_identifier)
+    results = session_data.get_results(year, round_number, session_identifier)
+    # Results are ordered by finishing (or qualifying) position
+    top = results['DriverNumber'].astype(str).head(top_n)
+    pairs = [(number, index.best_lap_numbers[number]) for number in top if number in index.best_lap_numbers]
+    for driver_number, lap_number in pairs:
+        session_data.get_lap_telemetry(year, round_number, session_identifier, driver_number, lap_number)
+    return pairs
+
+
+def build_lap_path(year: int, round_number: int, race_name: str, session_identifier: str,
+                   driver_number: str, lap_number: int, tolerance: float) -> dict:
+    """Simplified X/Y/Z path of one lap"""
+    telemetry = session_data.get_lap_telemetry(year, round_number, session_identifier, driver_number, lap_number)
+    with span("simplify"):
+        path = lap_path(telemetry, tolerance)
+    return {"race_name": race_name, "driver_number": driver_number, "lap_number": lap_number, **path}
+
+
+def build_track_outline(year: int, round_number: int, race_name: str, session_identifier: str,
+                        tolerance: float) -> dict:
+    """Circuit outline of a session, taken from the path of its fastest lap"""
+    index = session_data.get_lap_index(year, round_number, session_identifier)
+    if not index.best_ms:
+        raise LookupError("No timed laps in this session")
+    driver_number = min(index.best_ms, key=index.best_ms.get)
+    return build_lap_path(year, round_number, race_name, session_identifier,
+                          driver_number, index.best_lap_numbers[driver_number], tolerance)
+
+
+def build_track_positions(year: int, round_number: int, race_name: str, session_identifier: str,
+                          session_time: float) -> dict:
+    """Position of every car at a session time (seconds)"""
+    index = session_data.get_position_index(year, round_number, session_identifier)
+    time_range = index.time_range()
+    if time_range is None:
+        raise LookupError("No position data for this session")
+    return {
+        "race_name": race_name,
+        "time_range": list(time_range),
+        **index.at(session_time)
+    }
+
+
+def replay_meta(year: int, round_number: int, race_name: str, session_identifier: str) -> dict:
+    """Drivers and time range of a session replay"""
+    index = session_data.get_replay_index(year, round_number, session_identifier)
+    time_range = index.time_range()
+    if time_range is None:
+        raise LookupError("No position data for this session")
+    return {
+        "race_name": race_name,
+        "session_type": session_identifier,
+        "drivers": index.drivers,
+        "time_range": list(time_range),
+        "channels": ["t", "driver"] + list(index.channels),
+    }
+
+
+def replay_windows(year: int, round_number: int, session_identifier: str, start: float,
+                   length: float, count: int) -> List[dict]:
+    """`count` consecutive replay windows from `start` (seconds of session time)"""
+    index = session_data.get_replay_index(year, round_number, session_identifier)
+    with span("replay_window"):
+        return [index.window(start + i * length, length) for i in range(count)]
@@ -0,0 +1,150 @@
+"""
+Session replay: every car's position and key car data, in time windows.
+
+ReplayIndex merges session.pos_data and session.car_data of all drivers into
+flat arrays sorted by session time, so any window [start, start + length) is
+two binary searches away and seeking never rescans the session. Windows are
+built on first use and kept in a small LRU per index.
+
+FrameQueue is the per-client outgoing buffer of the WebSocket endpoint: it
+holds a few frames and drops the oldest one when a slow client falls behind,
+so memory per client stays bounded.
+"""
+import asyncio
+import threading
+from collections import OrderedDict, deque
+
+import numpy as np
+import pandas as pd
+
+# Window length in seconds of session time, and windows kept per session
+DEFAULT_WINDOW_SECONDS = 1.0
+MAX_CACHED_WINDOWS = 512
+
+# Output name -> car data column, taken from the last car sample at or before each position sample
+CAR_CHANNELS = {
+    "speed": "Speed",
+    "rpm": "RPM",
+    "gear": "nGear",
+    "throttle": "Throttle",
+    "brake": "Brake",
+    "drs": "DRS",
+}
+POSITION_CHANNELS = {"x": "X", "y": "Y", "z": "Z"}
+
+
+def _seconds(frame: pd.DataFrame) -> np.ndarray:
+    return frame['SessionTime'].dt.total_seconds().to_numpy(dtype=np.float64)
+
+
+def _values(frame: pd.DataFrame, column: str) -> np.ndarray:
+    if column not in frame.columns:
+        return np.full(len(frame), np.nan)
+    return pd.to_numeric(frame[column], errors='coerce').to_numpy(dtype=np.float64)
+
+
+class ReplayIndex:
+    def __init__(self, pos_data: dict, car_data: dict):
+        self.drivers = []
+        times, codes = [], []
+        channels = {name: [] for name in list(POSITION_CHANNELS) + list(CAR_CHANNELS)}
+        for number in sorted(pos_data, key=str):
+            pos = pos_data[number]
+            if pos is None or pos.empty or 'SessionTime' not in pos.columns:
+                continue
+            pos_times = _seconds(pos)
+            order = np.argsort(pos_times, kind='stable')
+            pos_times = pos_times[order]
+            code = len(self.drivers)
+            self.drivers.append(str(number))
+            times.append(pos_times)
+            codes.append(np.full(len(pos_times), code, dtype=np.int16))
+            for name, column in POSITION_CHANNELS.items():
+                channels[name].append(_values(pos, column)[order])
+
+            car = car_data.get(number)
+            if car is None or car.empty or 'SessionTime' not in car.columns:
+                for name in CAR_CHANNELS:
+                    channels[name].append(np.full(len(pos_times), np.nan))
+                continue
+            car_times = _seconds(car)
+            car_order = np.argsort(car_times, kind='stable')
+            car_times = car_times[car_order]
+            # Last car sample at or before each position sample
+            previous = np.searchsorted(car_times, pos_times, side='right') - 1
+            missing = previous < 0
+            previous = np.clip(previous, 0, max(len(car_times) - 1, 0))
+            for name, column in CAR_CHANNELS.items():
+                values = _values(car, column)[car_order]
+                values = values[previous] if len(values) else np.full(len(pos_times), np.nan)
+                values[missing] = np.nan
+                channels[name].append(values)
+
+        times = np.concatenate(times) if times else np.empty(0)
+        order = np.argsort(times, kind='stable')
+        self.times = times[order]
+        self.codes = np.concatenate(codes)[order] if codes else np.empty(0, dtype=np.int16)
+        self.channels = {
+            name: np.concatenate(parts)[order] if parts else np.empty(0)
+            for name, parts in channels.items()
+        }
+        self._windows = OrderedDict()  # (start ms, length ms) -> window
+        self._lock = threading.Lock()
+
+    def time_range(self):
+        if not len(self.times):
+            return None
+        return float(self.times[0]), float(self.times[-1])
+
+    def _build_window(self, start: float, length: float) -> dict:
+        lo, hi = np.searchsorted(self.times, [start, start + length], side='left')
+        columns = {
+            "t": np.round(self.times[lo:hi] * 1000).astype(np.int64).tolist(),
+            "driver": self.codes[lo:hi].tolist(),
+        }
+        for name, values in self.channels.items():
+            part = values[lo:hi]
+            # Positions are 1/10 m and car channels small numbers; ints keep frames small
+            columns[name] = [None if np.isnan(v) else int(round(v)) for v in part.tolist()]
+        return {"start": start, "end": start + length, "count": int(hi - lo), "columns": columns}
+
+    def window(self, start: float, length: float) -> dict:
+        """Samples of all drivers in [start, start + length) seconds of session time"""
+        key = (int(round(start * 1000)), int(round(length * 1000)))
+        with self._lock:
+            window = self._windows.get(key)
+            if window is not None:
+                self._windows.move_to_end(key)
+                return window
+        window = self._build_window(start, length)
+        with self._lock:
+            self._windows[key] = window
+            while len(self._windows) > MAX_CACHED_WINDOWS:
+                self._windows.popitem(last=False)
+        return window
+
+
+class FrameQueue:
+    """Bounded queue of outgoing frames that drops the oldest frame when full"""
+
+    def __init__(self, max_frames: int):
+        self.max_frames = max_frames
+        self._frames = deque()
+        self._ready = asyncio.Event()
+        self.dropped = 0
+
+    def put(self, frame):
+        if len(self._frames) >= self.max_frames:
+            self._frames.popleft()
+            self.dropped += 1
+        self._frames.append(frame)
+        self._ready.set()
+
+    def clear(self):
+        self._frames.clear()
+
+    async def get(self):
+        while not self._frames:
+            self._ready.clear()
+            await self._ready.wait()
+        return self._frames.popleft()
@@ -1,15 +1,124 @@
-from fastapi import APIRouter, HTTPException, Query
-from fastapi.middleware.cors import CORSMiddleware
-import fastf1
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Query, Header, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import Response, StreamingResponse
 import pandas as pd
-from typing import List, Optional, Dict
+from typing import List, Optional, Literal
 from pydantic import BaseModel
-from app.cache_manager import CacheManager
+from app.cache_manager import cache_manager
+from app import race_service
+from app.schedule_index import schedule_index
+from app.session_cache import SessionCache
+from app.http_cache import (
+    Validator, set_cache_status, make_etag, etag_matches, is_finalized, data_version, add_vary,
+    RESPONSE_VERSION, RECENT_MAX_AGE, IMMUTABLE_CACHE_CONTROL, RECENT_CACHE_CONTROL
+)
+from app.serializers import (
+    wants_packed, telemetry_packed, telemetry_ndjson, lap_ndjson, gzip_chunks, ChunkCompressor,
+    PACKED_MEDIA_TYPE, NDJSON_MEDIA_TYPE, STREAM_CHUNK_ROWS
+)
+from app.worker_pool import worker_pool, WorkerPoolBusy
+from app.metrics import span
+from app.prefetch import prefetcher, PREFETCH_TOP_N
+from app.track import DEFAULT_TOLERANCE
+from app.telemetry import GridTooLarge, MAX_POINTS, MIN_DISTANCE_STEP
+from app.replay import FrameQueue, DEFAULT_WINDOW_SECONDS
+from app.query_store import query_store
+from starlette.concurrency import run_in_threadpool
 import asyncio
-from datetime import datetime, timedelta
+import json
+import logging
 
 router = APIRouter(prefix="/races", tags=["races"])
-cache_manager = CacheManager()
+logger = logging.getLogger(__name__)
+
+# Responses of finished sessions are cached for 24 hours, the current weekend's
+# only for as long as clients may reuse them
+RESPONSE_TTL = 86400
+
+# Upper bound for the number of laps in one batch telemetry request
+MAX_BATCH_LAPS = 20
+
+# Replay: windows fetched from the worker pool per round trip, and frames
+# buffered per client before the oldest are dropped
+REPLAY_BATCH_WINDOWS = 8
+REPLAY_QUEUE_FRAMES = 4
+
+def _session_identifier(session_type: str) -> str:
+    # Use 'Q' for qualifying, 'R' for race
+    return 'Q' if session_type.lower() == 'qualifying' else 'R'
+
+async def _resolve(year: int, race_name: Optional[str], round_number: Optional[int]) -> dict:
+    with span("schedule"):
+        return await run_in_threadpool(schedule_index.resolve, year, race_name, round_number)
+
+async def _cached(request: Request, validator: Validator, cache_key: str, session_key: tuple, fn, *args):
+    """Serve a response from the cache or compute it on the worker pool and cache it"""
+    cache_key = _response_key(cache_key, validator.version)
+    with span("cache_read"):
+        cached_data = await cache_manager.get_cached_data(cache_key)
+    if cached_data is not None:
+        set_cache_status(request, "hit")
+        return cached_data
+    set_cache_status(request, "miss")
+    payload = await worker_pool.run(session_key, fn, *args)
+    ttl = RESPONSE_TTL if validator.finalized else RECENT_MAX_AGE
+    with span("cache_write"):
+        await cache_manager.set_cached_data(cache_key, payload, ttl=ttl)
+    return payload
+
+def _response_key(cache_key: str, version: str) -> str:
+    """Response cache key; the data version drops entries when the session data changes"""
+    return f"{cache_key}:{version}"
+
+def _lap_times_key(year: int, round_number: int, session_identifier: str, driver_number: Optional[str],
+                   format: str) -> str:
+    return f"lap-times:{year}:{round_number}:{session_identifier}:{driver_number or 'all'}:{format}"
+
+async def _schedule_prefetch(year: int, round_number: int, race_name: str, event_date: str,
+                             session_identifier: str):
+    """Warm what the driver view asks for after results: the session with
+    telemetry, the top finishers' fastest laps and the field's lap times.
+
+    Runs as a background task of the results response, so it starts after the
+    response was sent and never ahead of the request's own work.
+    """
+    session_key = SessionCache.make_key(year, round_number, session_identifier)
+
+    async def job():
+        await prefetcher.run(
+            session_key, race_service.prefetch_session, year, round_number, session_identifier, PREFETCH_TOP_N
+        )
+        version = data_version(year, round_number, session_identifier)
+        cache_key = _response_key(_lap_times_key(year, round_number, session_identifier, None, "rows"), version)
+        if await cache_manager.get_cached_data(cache_key) is None:
+            payload = await prefetcher.run(
+                session_key, race_service.build_lap_times, year, round_number, race_name, session_identifier,
+                None, "rows", False
+            )
+            ttl = RESPONSE_TTL if is_finalized(event_date) else RECENT_MAX_AGE
+            await cache_manager.set_cached_data(cache_key, payload, ttl=ttl)
+
+    prefetcher.schedule(session_key, job)
+
+async def _gzip_async(chunks):
+    compressor = ChunkCompressor()
+    async for chunk in chunks:
+        yield compressor.compress(chunk)
+    yield compressor.finish()
+
+def _stream_response(chunks, media_type: str, accept_encoding: Optional[str], headers: dict) -> StreamingResponse:
+    """Stream chunks, gzip compressed chunk by chunk when the client accepts it.
+
+    Setting Content-Encoding here makes GZipMiddleware pass the stream through
+    instead of buffering it in its own compressor.
+    """
+    if accept_encoding and "gzip" in accept_encoding:
+        if hasattr(chunks, "__aiter__"):
+            chunks = _gzip_async(chunks)
+        else:
+            chunks = gzip_chunks(chunks)
+        headers = {**headers, "Content-Encoding": "gzip"}
+        add_vary(headers, "Accept-Encoding")
+    return StreamingResponse(chunks, media_type=media_type, headers=headers)
 
 class DriverResult(BaseModel):
     position: Optional[int]
@@ -32,50 +141,65 @@ class RaceResult(BaseModel):
     results: List[DriverResult]
 
 @router.get("/calendar/{year}")
-async def get_race_calendar(year: int):
-    cache_key = f"calendar:{year}"
-    
-    # Try to get from cache first
-    cached_data = await cache_manager.get_cached_data(cache_key)
-    if cached_data:
-        return cached_data
-        
+async def get_race_calendar(request: Request, response: Response, year: int):
     try:
-        schedule = fastf1.get_event_schedule(year)
-        races = []
-        
-        for _, event in schedule.iterrows():
-            if 'Testing' in event['OfficialEventName']:
-                continue
-                
-            race_info = {
-                "round": int(event['RoundNumber']),
-                "race_name": event['OfficialEventName'],
-                "circuit_name": event['Location'],
-                "country": event['Country'],
-                "date": event['EventDate'].strftime("%Y-%m-%d"),
+        events = await run_in_threadpool(schedule_index.events, year)
+        # Past seasons are final, the current one can still be rescheduled
+        finalized = bool(events) and is_finalized(events[-1]["date"])
+        headers = {
+            "ETag": make_etag(RESPONSE_VERSION, "calendar", year, json.dumps(events, sort_keys=True)),
+            "Cache-Control": IMMUTABLE_CACHE_CONTROL if finalized else RECENT_CACHE_CONTROL,
+        }
+        if etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+            set_cache_status(request, "not-modified")
+            return Response(status_code=304, headers=headers)
+        response.headers.update(headers)
+        return [
+            {
+                "round": event["round"],
+                "race_name": event["race_name"],
+                "circuit_name": event["circuit_name"],
+                "country": event["country"],
+                "date": event["date"],
                 "available_sessions": ['R', 'Q']
             }
-            races.append(race_info)
-        
-        # Cache the results for 24 hours
-        await cache_manager.set_cached_data(cache_key, races, ttl=86400)
-        return races
+            for event in events
+        ]
     except Exception as e:
         raise HTTPException(status_code=404, detail=f"Could not find races for year {year}")
 
 @router.get("/results")
 async def get_race_results(
+    request: Request,
+    response: Response,
+    background_tasks: BackgroundTasks,
     year: int,
-    race_name: str,
+    race_name: Optional[str] = None,
+    round_number: Optional[int] = Query(None, alias="round"),
     page: int = Query(1, ge=1),
-    page_size: int = Query(20, ge=1, le=100)
+    page_size: int = Query(20, ge=1, le=100),
+    prefetch: bool = Query(True, description="Warm lap times and telemetry of this race in the background")
 ):
-    cache_key = f"results:{year}:{race_name}"
+    try:
+        race_info = await _resolve(year, race_name, round_number)
+    except Exception as e:
+        raise HTTPException(status_code=404, detail=f"Could not find race {race_name or round_number} in {year}")
+    round_number = race_info["round"]
+    race_name = race_info["race_name"]
+    if prefetch:
+        background_tasks.add_task(_schedule_prefetch, year, round_number, race_name, race_info["date"], 'R')
+    cache_key = f"results:{year}:{round_number}"
+    validator = Validator(cache_key, year, round_number, 'R', race_info["date"], page, page_size)
+    not_modified = validator.not_modified(request)
+    if not_modified is not None:
+        return not_modified
+    validator.apply(response)
     
     # Try to get from cache first
+    cache_key = _response_key(cache_key, validator.version)
     cached_data = await cache_manager.get_cached_data(cache_key)
     if cached_data:
+        set_cache_status(request, "hit")
         # Apply pagination to cached data
         start_idx = (page - 1) * page_size
         end_idx = start_idx + page_size
@@ -86,45 +210,17 @@ async def get_race_results(
             "total_pages": (len(cached_data["results"]) + page_size - 1) // page_size
         }
     
+    set_cache_status(request, "miss")
     try:
-        schedule = fastf1.get_event_schedule(year)
-        race_info = schedule[schedule['OfficialEventName'] == race_name].iloc[0]
-        round_number = int(race_info['RoundNumber'])
-        
-        session = fastf1.get_session(year, round_number, 'R')
-        session.load()
+        full_response = await worker_pool.run(
+            SessionCache.make_key(year, round_number, 'R'),
+            race_service.build_race_results, year, round_number, race_name, race_info["date"]
+        )
+        results = full_response["results"]
         
-        results = []
-        for _, driver in session.results.iterrows():
-            fastest_lap = False
-            if pd.notna(driver.get('FastestLap')):
-                try:
-                    fastest_lap = bool(int(driver['FastestLap']))
-                except:
-                    fastest_lap = bool(driver['FastestLap'])
-
-            result = {
-                "position": int(driver['Position']) if pd.notna(driver.get('Position')) else None,
-                "driver_number": str(driver['DriverNumber']) if pd.notna(driver.get('DriverNumber')) else None,
-                "driver_name": driver['FullName'] if pd.notna(driver.get('FullName')) else None,
-                "team": driver['TeamName'] if pd.notna(driver.get('TeamName')) else None,
-                "grid_position": int(driver['GridPosition']) if pd.notna(driver.get('GridPosition')) else None,
-                "status": driver['Status'] if pd.notna(driver.get('Status')) else None,
-                "points": float(driver['Points']) if pd.notna(driver.get('Points')) else None,
-                "fastest_lap": fastest_lap,
-                "fastest_lap_time": str(driver['FastestLapTime']) if pd.notna(driver.get('FastestLapTime')) else None,
-                "laps_completed": int(driver['NumberOfLaps']) if pd.notna(driver.get('NumberOfLaps')) else None
-            }
-            results.append(result)
-        
-        full_response = {
-            "race_name": race_name,
-            "date": race_info['EventDate'].strftime("%Y-%m-%d"),
-            "results": results
-        }
-        
-        # Cache the full results for 24 hours
-        await cache_manager.set_cached_data(cache_key, full_response, ttl=86400)
+        # Cache the full results, for 24 hours once the weekend is over
+        ttl = RESPONSE_TTL if validator.finalized else RECENT_MAX_AGE
+        await cache_manager.set_cached_data(cache_key, full_response, ttl=ttl)
         
         # Apply pagination
         start_idx = (page - 1) * page_size
@@ -135,143 +231,606 @@ async def get_race_results(
             "page": page,
             "total_pages": (len(results) + page_size - 1) // page_size
         }
-        
+    
+    except WorkerPoolBusy:
+        raise
     except Exception as e:
         raise HTTPException(status_code=404, detail=f"Could not find race results for {race_name} in {year}")
 
 @router.get("/qualifying-results")
-def get_qualifying_results(year: int, race_name: str):
+async def get_qualifying_results(
+    request: Request,
+    response: Response,
+    background_tasks: BackgroundTasks,
+    year: int,
+    race_name: Optional[str] = None,
+    round_number: Optional[int] = Query(None, alias="round"),
+    prefetch: bool = Query(True, description="Warm lap times and telemetry of this qualifying in the background")
+):
     try:
-        schedule = fastf1.get_event_schedule(year)
-        race_info = schedule[schedule['OfficialEventName'] == race_name].iloc[0]
-        round_number = int(race_info['RoundNumber'])
-        
-        session = fastf1.get_session(year, round_number, 'Q')
-        session.load()
-        
-        results = []
-        for _, driver in session.results.iterrows():
-            result = {
-                "position": int(driver['Position']) if pd.notna(driver.get('Position')) else None,
-                "driver_number": str(driver['DriverNumber']) if pd.notna(driver.get('DriverNumber')) else None,
-                "driver_name": driver['FullName'] if pd.notna(driver.get('FullName')) else None,
-                "team": driver['TeamName'] if pd.notna(driver.get('TeamName')) else None,
-                "q1_time": str(driver['Q1']) if pd.notna(driver.get('Q1')) else None,
-                "q2_time": str(driver['Q2']) if pd.notna(driver.get('Q2')) else None,
-                "q3_time": str(driver['Q3']) if pd.notna(driver.get('Q3')) else None,
-                "fastest_lap_time": str(driver['BestLapTime']) if pd.notna(driver.get('BestLapTime')) else None
-            }
-            results.append(result)
-            
-        return {
-            "race_name": race_name,
-            "date": race_info['EventDate'].strftime("%Y-%m-%d"),
-            "results": results
-        }
+        race_info = await _resolve(year, race_name, round_number)
+        round_number = race_info["round"]
+        race_name = race_info["race_name"]
+        if prefetch:
+            background_tasks.add_task(_schedule_prefetch, year, round_number, race_name, race_info["date"], 'Q')
+
+        cache_key = f"qualifying:{year}:{round_number}"
+        validator = Validator(cache_key, year, round_number, 'Q', race_info["date"])
+        not_modified = validator.not_modified(request)
+        if not_modified is not None:
+            return not_modified
+        validator.apply(response)
+        return await _cached(
+            request, validator, cache_key,
+            SessionCache.make_key(year, round_number, 'Q'),
+            race_service.build_qualifying_results, year, round_number, race_name, race_info["date"]
+        )
+    except WorkerPoolBusy:
+        raise
     except Exception as e:
         raise HTTPException(status_code=404, detail=f"Could not find qualifying results for {race_name} in {year}")
 
 @router.get("/lap-times")
-def get_lap_times(year: int, race_name: str, driver_number: str, session_type: str):
+async def get_lap_times(
+    request: Request,
+    response: Response,
+    year: int,
+    session_type: str,
+    driver_number: Optional[str] = Query(None, description='Driver number or abbreviation; omit or "all" for the whole field'),
+    race_name: Optional[str] = None,
+    round_number: Optional[int] = Query(None, alias="round"),
+    format: Literal["rows", "columnar", "packed"] = "rows",
+    stream: bool = Query(False, description="Stream rows/columnar output as NDJSON, one section per driver"),
+    chunk_size: int = Query(STREAM_CHUNK_ROWS, ge=100, le=20000),
+    accept: Optional[str] = Header(None),
+    accept_encoding: Optional[str] = Header(None)
+):
+    if driver_number is not None and driver_number.lower() == "all":
+        driver_number = None
     try:
-        schedule = fastf1.get_event_schedule(year)
-        race_info = schedule[schedule['OfficialEventName'] == race_name].iloc[0]
-        round_number = int(race_info['RoundNumber'])
-        
-        # Use 'Q' for qualifying, 'R' for race
-        session_identifier = 'Q' if session_type.lower() == 'qualifying' else 'R'
-        session = fastf1.get_session(year, round_number, session_identifier)
-        session.load()
+        race_info = await _resolve(year, race_name, round_number)
+        round_number = race_info["round"]
+        race_name = race_info["race_name"]
         
-        laps = session.laps.pick_driver(driver_number)
-        
-        # For qualifying, we need to filter for hot laps and remove outliers
-        if session_identifier == 'Q':
-            # Get the fastest valid lap time
-            valid_laps = laps[pd.notna(laps['LapTime'])]
-            if len(valid_laps) == 0:
-                return {
-                    "race_name": race_name,
-                    "driver_number": driver_number,
-                    "lap_times": []
-                }
-            
-            fastest_time = valid_laps['LapTime'].min()
-            # Convert timedelta to seconds for comparison
-            fastest_seconds = fastest_time.total_seconds()
-            # Filter laps: must be within 3 seconds of fastest lap and not too fast
-            filtered_laps = valid_laps[
-                (valid_laps['LapTime'].apply(lambda x: x.total_seconds()) <= fastest_seconds + 3) &  # Not too slow
-                (valid_laps['LapTime'].apply(lambda x: x.total_seconds()) >= fastest_seconds - 3)    # Not too fast
-            ]
-            laps_to_process = filtered_laps
-        else:
-            # For race, use all valid laps
-            laps_to_process = laps
-        
-        return {
-            "race_name": race_name,
-            "driver_number": driver_number,
-            "lap_times": [
-                {
-                    "lap_number": int(lap['LapNumber']),
-                    "lap_time": str(lap['LapTime']),
-                    "sector_1": str(lap['Sector1Time']),
-                    "sector_2": str(lap['Sector2Time']),
-                    "sector_3": str(lap['Sector3Time']),
-                    "is_personal_best": bool(lap['IsPersonalBest']),
-                    "compound": lap['Compound']
-                }
-                for _, lap in laps_to_process.iterrows()
-                if pd.notna(lap['LapTime'])
-            ]
-        }
+        session_identifier = _session_identifier(session_type)
+        packed = wants_packed(format, accept)
+        cache_key = _lap_times_key(year, round_number, session_identifier, driver_number, 'packed' if packed else format)
+        validator = Validator(cache_key, year, round_number, session_identifier, race_info["date"],
+                              stream and not packed, chunk_size, negotiated=format != "packed")
+        not_modified = validator.not_modified(request)
+        if not_modified is not None:
+            return not_modified
+
+        if stream and not packed:
+            set_cache_status(request, "miss")
+            frames = await worker_pool.run(
+                SessionCache.make_key(year, round_number, session_identifier),
+                race_service.lap_times_frames, year, round_number, session_identifier, driver_number
+            )
+            chunks = (
+                chunk
+                for number, laps in frames
+                for chunk in lap_ndjson(laps, {"race_name": race_name, "driver_number": number}, format, chunk_size)
+            )
+            return _stream_response(chunks, NDJSON_MEDIA_TYPE, accept_encoding, validator.headers)
+
+        payload = await _cached(
+            request, validator, cache_key,
+            SessionCache.make_key(year, round_number, session_identifier),
+            race_service.build_lap_times, year, round_number, race_name, session_identifier,
+            driver_number, format, packed
+        )
+        if packed:
+            return validator.apply(Response(content=payload, media_type=PACKED_MEDIA_TYPE))
+        validator.apply(response)
+        return payload
+    except WorkerPoolBusy:
+        raise
     except Exception as e:
-        raise HTTPException(status_code=404, detail=f"Could not find lap times for driver {driver_number} in {race_name} {year}")
+        raise HTTPException(status_code=404, detail=f"Could not find lap times for driver {driver_number or 'all'} in {race_name} {year}")
 
 @router.get("/telemetry")
-def get_telemetry(year: int, race_name: str, driver_number: str, lap_number: int, session_type: str):
+async def get_telemetry(
+    request: Request,
+    response: Response,
+    year: int,
+    driver_number: str,
+    lap_number: int,
+    session_type: str,
+    race_name: Optional[str] = None,
+    round_number: Optional[int] = Query(None, alias="round"),
+    format: Literal["rows", "columnar", "packed"] = "rows",
+    points: Optional[int] = Query(None, ge=10, le=MAX_POINTS, description="Target number of samples"),
+    distance_step: Optional[float] = Query(None, ge=MIN_DISTANCE_STEP, description="Resampling step in meters"),
+    downsample: Literal["resample", "lttb"] = "resample",
+    stream: bool = Query(False, description="Stream rows/columnar output as NDJSON in chunks"),
+    chunk_size: int = Query(STREAM_CHUNK_ROWS, ge=100, le=20000),
+    accept: Optional[str] = Header(None),
+    accept_encoding: Optional[str] = Header(None)
+):
     try:
-        print(f"Loading telemetry for Year: {year}, Race: {race_name}, Driver: {driver_number}, Lap: {lap_number}, Session: {session_type}")
-        schedule = fastf1.get_event_schedule(year)
-        race_info = schedule[schedule['OfficialEventName'] == race_name].iloc[0]
-        round_number = int(race_info['RoundNumber'])
-        
-        print(f"Found race info - Round number: {round_number}")
-        
-        # Use 'Q' for qualifying, 'R' for race
-        session_identifier = 'Q' if session_type.lower() == 'qualifying' else 'R'
-        print(f"Loading session: {session_identifier}")
-        session = fastf1.get_session(year, round_number, session_identifier)
-        session.load()
-        
-        print(f"Getting laps for driver {driver_number}")
-        laps = session.laps.pick_driver(driver_number)
-        print(f"Found {len(laps)} laps for driver")
-        
-        print(f"Getting lap {lap_number}")
-        lap = laps.pick_lap(lap_number)
-        print(f"Getting telemetry for lap")
-        telemetry = lap.get_telemetry()
-        print(f"Found {len(telemetry)} telemetry points")
-        
+        logger.debug(f"Loading telemetry for Year: {year}, Race: {race_name or round_number}, Driver: {driver_number}, Lap: {lap_number}, Session: {session_type}")
+        race_info = await _resolve(year, race_name, round_number)
+        round_number = race_info["round"]
+        race_name = race_info["race_name"]
+
+        session_identifier = _session_identifier(session_type)
+        packed = wants_packed(format, accept)
+        reduce = {"points": points, "distance_step": distance_step, "method": downsample}
+        cache_key = (
+            f"telemetry:{year}:{round_number}:{session_identifier}:{driver_number}:{lap_number}:"
+            f"{'packed' if packed else format}:{points}:{distance_step}:{downsample}"
+        )
+        validator = Validator(cache_key, year, round_number, session_identifier, race_info["date"],
+                              stream and not packed, chunk_size, negotiated=format != "packed")
+        not_modified = validator.not_modified(request)
+        if not_modified is not None:
+            return not_modified
+
+        if stream and not packed:
+            set_cache_status(request, "miss")
+            telemetry = await worker_pool.run(
+                SessionCache.make_key(year, round_number, session_identifier),
+                race_service.telemetry_frame, year, round_number, session_identifier,
+                driver_number, lap_number, reduce
+            )
+            meta = {"race_name": race_name, "driver_number": driver_number, "lap_number": lap_number}
+            return _stream_response(
+                telemetry_ndjson(telemetry, meta, format, chunk_size), NDJSON_MEDIA_TYPE, accept_encoding,
+                validator.headers
+            )
+
+        payload = await _cached(
+            request, validator, cache_key,
+            SessionCache.make_key(year, round_number, session_identifier),
+            race_service.build_telemetry, year, round_number, race_name, session_identifier,
+            driver_number, lap_number, format, reduce, packed
+        )
+        if packed:
+            return validator.apply(Response(content=payload, media_type=PACKED_MEDIA_TYPE))
+        validator.apply(response)
+        return payload
+    except WorkerPoolBusy:
+        raise
+    except GridTooLarge as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.warning(f"Error in telemetry endpoint: {str(e)}")
+        raise HTTPException(status_code=404, detail=f"Could not find telemetry for driver {driver_number} lap {lap_number} in {race_name} {year}. Error: {str(e)}") 
+
+@router.get("/analytics/{section}")
+async def get_session_analytics(
+    request: Request,
+    response: Response,
+    section: Literal["all", "stints", "pace", "gaps"],
+    year: int,
+    session_type: str = "race",
+    race_name: Optional[str] = None,
+    round_number: Optional[int] = Query(None, alias="round")
+):
+    """Tyre stints, race pace and gaps to the leader for the whole field.
+
+    All sections are computed together once per session and data version.
+    """
+    try:
+        race_info = await _resolve(year, race_name, round_number)
+        round_number = race_info["round"]
+        race_name = race_info["race_name"]
+
+        session_identifier = _session_identifier(session_type)
+        cache_key = f"analytics:{year}:{round_number}:{session_identifier}"
+        validator = Validator(cache_key, year, round_number, session_identifier, race_info["date"], section)
+        not_modified = validator.not_modified(request)
+        if not_modified is not None:
+            return not_modified
+
+        analytics = await _cached(
+            request, validator, cache_key,
+            SessionCache.make_key(year, round_number, session_identifier),
+            race_service.build_session_analytics, year, round_number, race_name, session_identifier
+        )
+        validator.apply(response)
+        if section == "all":
+            return analytics
         return {
-            "race_name": race_name,
-            "driver_number": driver_number,
-            "lap_number": lap_number,
-            "telemetry": [
-                {
-                    "distance": float(t['Distance']),
-                    "speed": float(t['Speed']),
-                    "rpm": float(t['RPM']) if pd.notna(t.get('RPM')) else None,
-                    "gear": int(t['nGear']) if pd.notna(t.get('nGear')) else None,
-                    "throttle": float(t['Throttle']) if pd.notna(t.get('Throttle')) else None,
-                    "brake": float(t['Brake']) if pd.notna(t.get('Brake')) else None,
-                    "drs": int(t['DRS']) if pd.notna(t.get('DRS')) else None
-                }
-                for _, t in telemetry.iterrows()
-            ]
+            "race_name": analytics["race_name"],
+            "session_type": analytics["session_type"],
+            section: analytics[section]
         }
+    except WorkerPoolBusy:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=404, detail=f"Could not compute {section} analytics for {race_name or round_number} {year}")
+
+def _parse_lap_keys(keys: List[str]) -> List[tuple]:
+    """Parse "driver_number:lap_number" strings into (driver, lap) pairs"""
+    pairs = []
+    for key in keys:
+        for part in key.split(','):
+            driver, sep, lap = part.partition(':')
+            if not sep or not lap.strip().isdigit():
+                raise ValueError(f"Invalid lap key '{part}', expected driver_number:lap_number")
+            pairs.append((driver.strip(), int(lap)))
+    return list(dict.fromkeys(pairs))
+
+
+@router.get("/track/outline")
+async def get_track_outline(
+    request: Request,
+    response: Response,
+    year: int,
+    session_type: str,
+    race_name: Optional[str] = None,
+    round_number: Optional[int] = Query(None, alias="round"),
+    tolerance: float = Query(DEFAULT_TOLERANCE, ge=0, le=50, description="Simplification tolerance in meters")
+):
+    """Circuit outline (path of the session's fastest lap), simplified and delta encoded"""
+    try:
+        race_info = await _resolve(year, race_name, round_number)
+        round_number = race_info["round"]
+        race_name = race_info["race_name"]
+
+        session_identifier = _session_identifier(session_type)
+        cache_key = f"track-outline:{year}:{round_number}:{session_identifier}:{tolerance}"
+        validator = Validator(cache_key, year, round_number, session_identifier, race_info["date"])
+        not_modified = validator.not_modified(request)
+        if not_modified is not None:
+            return not_modified
+
+        payload = await _cached(
+            request, validator, cache_key,
+            SessionCache.make_key(year, round_number, session_identifier),
+            race_service.build_track_outline, year, round_number, race_name, session_identifier, tolerance
+        )
+        validator.apply(response)
+        return payload
+    except WorkerPoolBusy:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=404, detail=f"Could not build track outline for {race_name or round_number} {year}. Error: {str(e)}")
+
+@router.get("/track/lap")
+async def get_lap_path(
+    request: Request,
+    response: Response,
+    year: int,
+    session_type: str,
+    driver_number: str,
+    lap_number: int,
+    race_name: Optional[str] = None,
+    round_number: Optional[int] = Query(None, alias="round"),
+    tolerance: float = Query(DEFAULT_TOLERANCE, ge=0, le=50, description="Simplification tolerance in meters")
+):
+    """X/Y/Z path of one lap, simplified and delta encoded"""
+    try:
+        race_info = await _resolve(year, race_name, round_number)
+        round_number = race_info["round"]
+        race_name = race_info["race_name"]
+
+        session_identifier = _session_identifier(session_type)
+        cache_key = f"track-lap:{year}:{round_number}:{session_identifier}:{driver_number}:{lap_number}:{tolerance}"
+        validator = Validator(cache_key, year, round_number, session_identifier, race_info["date"])
+        not_modified = validator.not_modified(request)
+        if not_modified is not None:
+            return not_modified
+
+        payload = await _cached(
+            request, validator, cache_key,
+            SessionCache.make_key(year, round_number, session_identifier),
+            race_service.build_lap_path, year, round_number, race_name, session_identifier,
+            driver_number, lap_number, tolerance
+        )
+        validator.apply(response)
+        return payload
+    except WorkerPoolBusy:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=404, detail=f"Could not find the path of driver {driver_number} lap {lap_number} in {race_name or round_number} {year}. Error: {str(e)}")
+
+@router.get("/track/positions")
+async def get_track_positions(
+    request: Request,
+    response: Response,
+    year: int,
+    session_type: str,
+    time: float = Query(..., ge=0, description="Session time in seconds"),
+    race_name: Optional[str] = None,
+    round_number: Optional[int] = Query(None, alias="round")
+):
+    """Position of every car at a session time.
+
+    Not stored in the response cache: clients scrub through many times, and
+    the lookup in the session's position index is cheap once it is built.
+    """
+    try:
+        race_info = await _resolve(year, race_name, round_number)
+        round_number = race_info["round"]
+        race_name = race_info["race_name"]
+
+        session_identifier = _session_identifier(session_type)
+        validator = Validator(f"track-positions:{year}:{round_number}:{session_identifier}:{time}",
+                              year, round_number, session_identifier, race_info["date"])
+        not_modified = validator.not_modified(request)
+        if not_modified is not None:
+            return not_modified
+
+        set_cache_status(request, "miss")
+        payload = await worker_pool.run(
+            SessionCache.make_key(year, round_number, session_identifier),
+            race_service.build_track_positions, year, round_number, race_name, session_identifier, time
+        )
+        validator.apply(response)
+        return payload
+    except WorkerPoolBusy:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=404, detail=f"Could not find track positions for {race_name or round_number} {year}. Error: {str(e)}")
+
+@router.get("/query")
+async def query_seasons(
+    table: Literal["laps", "results"] = "laps",
+    where: List[str] = Query([], description="Filters like year>=2021, location=Monaco, compound=SOFT,MEDIUM"),
+    group_by: List[str] = Query([]),
+    metric: List[str] = Query([], description="Aggregates like count, min:lap_time_ms, mean:lap_time_ms"),
+    select: List[str] = Query([], description="Columns of the rows returned without metrics"),
+    order_by: Optional[str] = Query(None, description="Output column, -column for descending"),
+    limit: int = Query(1000, ge=1, le=10000)
+):
+    """Filtered aggregations over the laps and results of every session in the query store.
+
+    Reads local Parquet files only (see app/query_store.py) and never loads
+    FastF1, so sessions that haven't been loaded or precomputed aren't included.
+    """
+    try:
+        return await run_in_threadpool(
+            query_store.query, table, where, group_by, metric, select, order_by, limit
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+@router.websocket("/replay")
+async def replay_session(
+    websocket: WebSocket,
+    year: int,
+    session_type: str = "race",
+    race_name: Optional[str] = None,
+    round_number: Optional[int] = Query(None, alias="round"),
+    start: float = Query(0.0, ge=0, description="Session time in seconds to start from"),
+    rate: float = Query(1.0, gt=0, le=64, description="Playback rate"),
+    window: float = Query(DEFAULT_WINDOW_SECONDS, ge=0.1, le=30, description="Window length in seconds")
+):
+    """Replay a session: positions and key car data of every driver, one frame per window.
+
+    The server sends {"type": "meta", ...} and then {"type": "window", ...}
+    every window/rate seconds until {"type": "end"}. Clients control playback
+    with {"action": "seek", "time": s}, {"action": "rate", "rate": r},
+    {"action": "pause"} and {"action": "play"}. Frames a client can't keep up
+    with are dropped; each frame reports the drops so far.
+    """
+    await websocket.accept()
+    try:
+        race_info = await _resolve(year, race_name, round_number)
+        session_identifier = _session_identifier(session_type)
+        session_key = SessionCache.make_key(year, race_info["round"], session_identifier)
+        meta = await worker_pool.run(
+            session_key, race_service.replay_meta, year, race_info["round"], race_info["race_name"], session_identifier
+        )
+    except Exception as e:
+        await websocket.send_json({"type": "error", "detail": str(e)})
+        await websocket.close(code=1013 if isinstance(e, WorkerPoolBusy) else 1008)
+        return
+    await websocket.send_json({"type": "meta", "window": window, "rate": rate, **meta})
+
+    first, last = meta["time_range"]
+
+    # Windows are numbered on a grid from the first sample, so clients share cached windows
+    def window_number(time: float) -> int:
+        return int(max(0.0, time - first) // window)
+
+    state = {"window": window_number(start), "rate": rate, "paused": False}
+    control = asyncio.Event()
+    frames = FrameQueue(REPLAY_QUEUE_FRAMES)
+
+    async def produce():
+        buffered, buffered_from = [], None
+        while first + state["window"] * window <= last:
+            if state["paused"]:
+                await control.wait()
+                control.clear()
+                continue
+            number = state["window"]
+            if buffered_from is None or not 0 <= number - buffered_from < len(buffered):
+                buffered = await worker_pool.run(
+                    session_key, race_service.replay_windows, year, race_info["round"], session_identifier,
+                    first + number * window, window, REPLAY_BATCH_WINDOWS
+                )
+                buffered_from = number
+                if state["window"] != number:
+                    continue  # Seeked while fetching
+            frames.put({"type": "window", **buffered[number - buffered_from]})
+            state["window"] = number + 1
+            # Sleep one window of playback, or less if the client changes something
+            try:
+                await asyncio.wait_for(control.wait(), timeout=window / state["rate"])
+                control.clear()
+            except asyncio.TimeoutError:
+                pass
+        frames.put({"type": "end"})
+
+    async def send():
+        while True:
+            frame = await frames.get()
+            if frame["type"] == "window":
+                frame["dropped"] = frames.dropped
+            await websocket.send_text(json.dumps(frame, separators=(",", ":")))
+            if frame["type"] == "end":
+                return
+
+    async def receive():
+        while True:
+            message = await websocket.receive_json()
+            action = message.get("action")
+            if action == "seek":
+                state["window"] = window_number(min(float(message.get("time", first)), last))
+                frames.clear()
+            elif action == "rate":
+                state["rate"] = min(max(float(message.get("rate", 1.0)), 0.01), 64.0)
+            elif action in ("pause", "play"):
+                state["paused"] = action == "pause"
+            control.set()
+
+    tasks = [asyncio.create_task(task()) for task in (produce, send, receive)]
+    try:
+        pending = set(tasks)
+        # Until the last frame is sent, the client leaves or a task fails
+        while tasks[1] in pending and tasks[2] in pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                task.result()
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        logger.warning(f"Replay of {year} {race_info['race_name']} stopped: {e}")
+        try:
+            await websocket.send_json({"type": "error", "detail": str(e)})
+            await websocket.close(code=1011)
+        except Exception:
+            pass
+    finally:
+        for task in tasks:
+            task.cancel()
+
+@router.get("/minisectors")
+async def get_minisectors(
+    request: Request,
+    response: Response,
+    year: int,
+    session_type: str,
+    laps: Optional[List[str]] = Query(None, description="Laps as driver_number:lap_number; default: every driver's fastest lap"),
+    sectors: int = Query(25, ge=3, le=200, description="Number of equal-distance mini-sectors"),
+    race_name: Optional[str] = None,
+    round_number: Optional[int] = Query(None, alias="round")
+):
+    """Time of each lap through every mini-sector, deltas and the fastest lap per mini-sector"""
+    try:
+        pairs = _parse_lap_keys(laps) if laps else []
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if len(pairs) > MAX_BATCH_LAPS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_LAPS} laps per request")
+
+    try:
+        race_info = await _resolve(year, race_name, round_number)
+        round_number = race_info["round"]
+        race_name = race_info["race_name"]
+
+        session_identifier = _session_identifier(session_type)
+        lap_keys = ",".join(f"{driver}:{lap}" for driver, lap in pairs) or "fastest"
+        cache_key = f"minisectors:{year}:{round_number}:{session_identifier}:{lap_keys}:{sectors}"
+        validator = Validator(cache_key, year, round_number, session_identifier, race_info["date"])
+        not_modified = validator.not_modified(request)
+        if not_modified is not None:
+            return not_modified
+
+        payload = await _cached(
+            request, validator, cache_key,
+            SessionCache.make_key(year, round_number, session_identifier),
+            race_service.build_minisectors, year, round_number, race_name, session_identifier, pairs, sectors
+        )
+        validator.apply(response)
+        return payload
+    except WorkerPoolBusy:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=404, detail=f"Could not compare mini-sectors for {race_name or round_number} {year}. Error: {str(e)}")
+
+@router.get("/telemetry/batch")
+async def get_telemetry_batch(
+    request: Request,
+    response: Response,
+    year: int,
+    session_type: str,
+    laps: List[str] = Query(..., description="Laps as driver_number:lap_number, repeated or comma separated"),
+    race_name: Optional[str] = None,
+    round_number: Optional[int] = Query(None, alias="round"),
+    format: Literal["rows", "columnar", "packed"] = "rows",
+    stream: bool = False,
+    points: Optional[int] = Query(None, ge=10, le=MAX_POINTS, description="Target number of samples per lap"),
+    distance_step: Optional[float] = Query(None, ge=MIN_DISTANCE_STEP, description="Resampling step in meters"),
+    downsample: Literal["resample", "lttb"] = "resample",
+    accept: Optional[str] = Header(None),
+    accept_encoding: Optional[str] = Header(None)
+):
+    """Telemetry for several laps of one session, loading the session once.
+
+    With stream=true each lap is sent as soon as its telemetry is ready, as
+    one NDJSON line or, for packed output, one packed frame per lap. Streams
+    can carry per-lap errors after the status was sent, so they get no
+    caching headers.
+    """
+    try:
+        pairs = _parse_lap_keys(laps)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if len(pairs) > MAX_BATCH_LAPS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_LAPS} laps per request")
+
+    try:
+        race_info = await _resolve(year, race_name, round_number)
+    except Exception as e:
+        raise HTTPException(status_code=404, detail=f"Could not find telemetry for {race_name or round_number} {year}. Error: {str(e)}")
+    round_number = race_info["round"]
+    race_name = race_info["race_name"]
+    session_identifier = _session_identifier(session_type)
+    session_key = SessionCache.make_key(year, round_number, session_identifier)
+    packed = wants_packed(format, accept)
+    reduce = {"points": points, "distance_step": distance_step, "method": downsample}
+
+    if stream:
+        set_cache_status(request, "miss")
+
+        async def generate():
+            state = reduce
+            for pair in pairs:
+                try:
+                    entry, state = await worker_pool.run(
+                        session_key, race_service.build_batch_lap, year, round_number, race_name,
+                        session_identifier, pair, format, state, packed
+                    )
+                except Exception as e:
+                    entry = {"driver_number": pair[0], "lap_number": pair[1], "error": str(e)}
+                    if packed:
+                        entry = telemetry_packed(pd.DataFrame(), entry)
+                yield entry if packed else json.dumps(entry, separators=(",", ":")).encode() + b"\n"
+
+        media_type = PACKED_MEDIA_TYPE if packed else NDJSON_MEDIA_TYPE
+        return _stream_response(generate(), media_type, accept_encoding, {"Cache-Control": "no-store"})
+
+    lap_keys = ",".join(f"{driver}:{lap}" for driver, lap in pairs)
+    cache_key = (
+        f"telemetry-batch:{year}:{round_number}:{session_identifier}:{lap_keys}:"
+        f"{'packed' if packed else format}:{points}:{distance_step}:{downsample}"
+    )
+    validator = Validator(cache_key, year, round_number, session_identifier, race_info["date"],
+                          negotiated=format != "packed")
+    not_modified = validator.not_modified(request)
+    if not_modified is not None:
+        return not_modified
+    try:
+        payload = await _cached(
+            request, validator, cache_key, session_key, race_service.build_telemetry_batch, year, round_number, race_name,
+            session_identifier, pairs, format, reduce, packed
+        )
+    except WorkerPoolBusy:
+        raise
+    except GridTooLarge as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
-        print(f"Error in telemetry endpoint: {str(e)}")
-        raise HTTPException(status_code=404, detail=f"Could not find telemetry for driver {driver_number} lap {lap_number} in {race_name} {year}. Error: {str(e)}") 
\ No newline at end of file
+        raise HTTPException(status_code=404, detail=f"Could not find telemetry for {race_name} {year}. Error: {str(e)}")
+    if packed:
+        return validator.apply(Response(content=payload, media_type=PACKED_MEDIA_TYPE))
+    validator.apply(response)
+    return payload
@@ -0,0 +1,107 @@
+import threading
+import logging
+from typing import Optional
+
+from app.cache_manager import cache_manager
+from app.fastf1_cache import get_fastf1
+
+logger = logging.getLogger(__name__)
+
+# Schedules of past seasons don't change, the current one rarely does
+SCHEDULE_TTL = 86400
+
+
+def _normalize(name: str) -> str:
+    return " ".join(str(name).split()).lower()
+
+
+class ScheduleIndex:
+    """Per-year lookup tables from event names/locations/rounds to events.
+
+    Each season is built once from `fastf1.get_event_schedule`, persisted
+    through the JSON cache and afterwards resolved with plain dict lookups.
+    """
+
+    def __init__(self, cache=cache_manager):
+        self.cache = cache
+        self._years = {}  # year -> {"events": [...], "lookup": {name: round}}
+        self._lock = threading.Lock()
+
+    def _build(self, year: int) -> list:
+        """Fetch the schedule for a season and flatten it to plain dicts"""
+        schedule = get_fastf1().get_event_schedule(year, include_testing=False)
+        events = []
+        for _, event in schedule.iterrows():
+            if 'Testing' in event['OfficialEventName']:
+                continue
+            events.append({
+                "round": int(event['RoundNumber']),
+                "race_name": event['OfficialEventName'],
+                "event_name": event['EventName'],
+                "circuit_name": event['Location'],
+                "country": event['Country'],
+                "date": event['EventDate'].strftime("%Y-%m-%d"),
+            })
+        return events
+
+    @staticmethod
+    def _make_lookup(events: list) -> dict:
+        lookup = {}
+        for event in events:
+            for name in (event["race_name"], event["event_name"], event["circuit_name"]):
+                lookup.setdefault(_normalize(name), event["round"])
+        return lookup
+
+    def _load_year(self, year: int) -> dict:
+        entry = self._years.get(year)
+        if entry is not None:
+            return entry
+
+        with self._lock:
+            entry = self._years.get(year)
+            if entry is not None:
+                return entry
+
+            cache_key = f"schedule_index:{year}"
+            events = self.cache.get(cache_key, ttl=SCHEDULE_TTL)
+            if not events:
+                logger.info(f"Building schedule index for {year}")
+                events = self._build(year)
+                self.cache.set(cache_key, events, ttl=SCHEDULE_TTL)
+
+            entry = {
+                "events": events,
+                "by_round": {event["round"]: event for event in events},
+                "lookup": self._make_lookup(events),
+            }
+            self._years[year] = entry
+            return entry
+
+    def events(self, year: int) -> list:
+        """All (non-testing) events of a season in round order"""
+        return self._load_year(year)["events"]
+
+    def resolve(self, year: int, race_name: Optional[str] = None, round_number: Optional[int] = None) -> dict:
+        """Resolve an event by round number or by official name/event name/location.
+
+        Raises LookupError if the event can't be found.
+        """
+        entry = self._load_year(year)
+        if round_number is None:
+            if race_name is None:
+                raise LookupError("Either race_name or round must be given")
+            round_number = entry["lookup"].get(_normalize(race_name))
+            if round_number is None and race_name.strip().isdigit():
+                round_number = int(race_name)
+        event = entry["by_round"].get(round_number)
+        if event is None:
+            raise LookupError(f"No event {race_name or round_number} in {year}")
+        return event
+
+    def invalidate(self, year: int):
+        with self._lock:
+            self._years.pop(year, None)
+
+
+# Create a singleton instance
+schedule_index = ScheduleIndex()
@@ -0,0 +1,259 @@
+"""
+Vectorized serialization of telemetry and lap DataFrames.
+
+Both endpoints support three layouts:
+- rows: a list of one object per sample/lap (the original format)
+- columnar: one array per channel, e.g. {"distance": [...], "speed": [...]}
+- packed: typed little-endian arrays behind a small header (see below)
+
+Rows and columnar output can also be streamed as NDJSON (see ndjson_chunks):
+a header line {"meta": {...}, "format": ..., "count": n} followed by either
+one line per sample/lap (rows) or one line per block of samples (columnar,
+{"offset": i, "columns": {...}}). A stream may hold several such sections,
+e.g. one per driver.
+
+Columns are converted to Python lists straight from their NumPy arrays;
+missing values become None without a per-row pd.notna check.
+
+Packed binary layout (media type application/vnd.f1.packed), all little-endian:
+
+    bytes 0-3    magic b"F1PK"
+    bytes 4-7    uint32, length H of the JSON header
+    bytes 8..    JSON header, utf-8, space padded so that 8 + H is a multiple of 8
+    then         channel buffers, each starting on an 8 byte boundary
+
+The JSON header is
+    {"version": 1, "count": <samples>, "body_length": <bytes>, "meta": {...},
+     "channels": [{"name", "dtype", "offset", "length"[, "categories"]}, ...]}
+where offset is relative to the first byte after the header. Every frame is a
+multiple of 8 bytes long, so several frames (e.g. a batch of laps) can be sent
+back to back and read with body_length to find the next one. dtype is one of
+float32 (missing = NaN), int8 (missing = -1) or int16 (missing = -1). int8
+channels with "categories" hold indexes into that list (e.g. tyre compounds).
+"""
+import json
+import zlib
+import struct
+from typing import Iterable, Iterator, Optional
+
+import numpy as np
+import pandas as pd
+
+from app.metrics import span
+
+PACKED_MEDIA_TYPE = "application/vnd.f1.packed"
+PACKED_MAGIC = b"F1PK"
+PACKED_VERSION = 1
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+# Samples/laps serialized per chunk of a streamed response
+STREAM_CHUNK_ROWS = 1000
+
+# Output name -> (DataFrame column, value kind, packed dtype)
+TELEMETRY_CHANNELS = {
+    "distance": ("Distance", float, "float32"),
+    "speed": ("Speed", float, "float32"),
+    "rpm": ("RPM", float, "float32"),
+    "gear": ("nGear", int, "int8"),
+    "throttle": ("Throttle", float, "float32"),
+    "brake": ("Brake", float, "int8"),
+    "drs": ("DRS", int, "int8"),
+}
+
+LAP_TIME_COLUMNS = {
+    "lap_time": "LapTime",
+    "sector_1": "Sector1Time",
+    "sector_2": "Sector2Time",
+    "sector_3": "Sector3Time",
+}
+
+
+def numeric_column(df: pd.DataFrame, column: str, kind=float) -> list:
+    """Convert a numeric column to a list, with NaN mapped to None"""
+    if column not in df.columns:
+        return [None] * len(df)
+    values = pd.to_numeric(df[column], errors='coerce').to_numpy(dtype=np.float64)
+    missing = np.flatnonzero(np.isnan(values))
+    if kind is int:
+        out = np.nan_to_num(values).astype(np.int64).tolist()
+    else:
+        out = values.tolist()
+    for i in missing:
+        out[i] = None
+    return out
+
+
+def timedelta_column(series: pd.Series, missing=None) -> list:
+    """Convert a timedelta column to the str(Timedelta) format used by the API"""
+    out = series.astype(str).tolist()
+    if missing != 'NaT':
+        for i in np.flatnonzero(series.isna().to_numpy()):
+            out[i] = missing
+    return out
+
+
+def telemetry_columns(telemetry: pd.DataFrame) -> dict:
+    """Telemetry as one list per channel"""
+    return {
+        name: numeric_column(telemetry, column, kind)
+        for name, (column, kind, _) in TELEMETRY_CHANNELS.items()
+    }
+
+
+def telemetry_rows(telemetry: pd.DataFrame) -> list:
+    """Telemetry as a list of one dict per sample"""
+    columns = telemetry_columns(telemetry)
+    names = list(columns.keys())
+    return [dict(zip(names, values)) for values in zip(*columns.values())]
+
+
+def lap_columns(laps: pd.DataFrame) -> dict:
+    """Laps as one list per field; missing times are None"""
+    laps = laps[laps['LapTime'].notna()]
+    columns = {"lap_number": numeric_column(laps, 'LapNumber', int)}
+    for name, column in LAP_TIME_COLUMNS.items():
+        columns[name] = timedelta_column(laps[column])
+    columns["is_personal_best"] = laps['IsPersonalBest'].fillna(False).astype(bool).tolist()
+    columns["compound"] = laps['Compound'].astype(object).where(laps['Compound'].notna(), None).tolist()
+    return columns
+
+
+def lap_rows(laps: pd.DataFrame) -> list:
+    """Laps as a list of one dict per lap; missing sector times are 'NaT'"""
+    laps = laps[laps['LapTime'].notna()]
+    columns = lap_columns(laps)
+    for name, column in LAP_TIME_COLUMNS.items():
+        if name != "lap_time":
+            columns[name] = timedelta_column(laps[column], missing='NaT')
+    names = list(columns.keys())
+    return [dict(zip(names, values)) for values in zip(*columns.values())]
+
+
+def wants_packed(format: str, accept: Optional[str]) -> bool:
+    """Packed output is selected by format=packed or by the Accept header"""
+    return format == "packed" or (accept is not None and PACKED_MEDIA_TYPE in accept)
+
+
+def _numeric_array(df: pd.DataFrame, column: str) -> np.ndarray:
+    if column not in df.columns:
+        return np.full(len(df), np.nan)
+    return pd.to_numeric(df[column], errors='coerce').to_numpy(dtype=np.float64)
+
+
+def _timedelta_seconds(series: pd.Series) -> np.ndarray:
+    """Timedeltas as float seconds, NaT -> NaN"""
+    nanos = series.to_numpy(dtype='timedelta64[ns]').astype(np.int64).astype(np.float64)
+    nanos[series.isna().to_numpy()] = np.nan
+    return nanos / 1e9
+
+
+def _to_dtype(values: np.ndarray, dtype: str) -> np.ndarray:
+    if dtype == "float32":
+        return values.astype('<f4')
+    missing = np.isnan(values)
+    values = np.where(missing, -1, values)
+    return values.astype('<i1' if dtype == "int8" else '<i2')
+
+
+def pack_channels(channels: list, meta: dict) -> bytes:
+    """Encode (name, float64 array, dtype[, categories]) channels to the packed layout"""
+    count = len(channels[0][1]) if channels else 0
+    buffers = []
+    header_channels = []
+    offset = 0
+    for channel in channels:
+        name, values, dtype = channel[:3]
+        data = _to_dtype(values, dtype).tobytes()
+        entry = {"name": name, "dtype": dtype, "offset": offset, "length": len(values)}
+        if len(channel) > 3:
+            entry["categories"] = channel[3]
+        header_channels.append(entry)
+        padding = -len(data) % 8
+        buffers.append(data + b"\0" * padding)
+        offset += len(data) + padding
+
+    header = json.dumps({
+        "version": PACKED_VERSION,
+        "count": count,
+        "body_length": offset,
+        "meta": meta,
+        "channels": header_channels,
+    }, separators=(",", ":")).encode()
+    header += b" " * (-(8 + len(header)) % 8)
+    return PACKED_MAGIC + struct.pack('<I', len(header)) + header + b"".join(buffers)
+
+
+def telemetry_packed(telemetry: pd.DataFrame, meta: dict) -> bytes:
+    """Telemetry in the packed binary layout"""
+    return pack_channels([
+        (name, _numeric_array(telemetry, column), dtype)
+        for name, (column, _, dtype) in TELEMETRY_CHANNELS.items()
+    ], meta)
+
+
+def lap_packed(laps: pd.DataFrame, meta: dict) -> bytes:
+    """Laps in the packed binary layout; times are float32 seconds"""
+    laps = laps[laps['LapTime'].notna()]
+    compounds = laps['Compound'].astype('category')
+    categories = [str(c) for c in compounds.cat.categories]
+    codes = compounds.cat.codes.to_numpy().astype(np.float64)
+    codes[codes < 0] = np.nan
+    channels = [("lap_number", _numeric_array(laps, 'LapNumber'), "int16")]
+    for name, column in LAP_TIME_COLUMNS.items():
+        channels.append((name, _timedelta_seconds(laps[column]), "float32"))
+    channels.append(("is_personal_best", laps['IsPersonalBest'].fillna(False).astype(np.float64).to_numpy(), "int8"))
+    channels.append(("compound", codes, "int8", categories))
+    return pack_channels(channels, meta)
+
+
+def _json_line(value) -> bytes:
+    return json.dumps(value, separators=(",", ":")).encode() + b"\n"
+
+
+def ndjson_chunks(frame: pd.DataFrame, meta: dict, format: str, columns_fn, rows_fn,
+                  chunk_rows: int = STREAM_CHUNK_ROWS) -> Iterator[bytes]:
+    """One NDJSON section for a DataFrame, serialized `chunk_rows` rows at a time.
+
+    Only one chunk of the frame is converted to Python objects at any time.
+    """
+    yield _json_line({"meta": meta, "format": format, "count": len(frame)})
+    for start in range(0, len(frame), chunk_rows):
+        chunk = frame.iloc[start:start + chunk_rows]
+        if format == "columnar":
+            yield _json_line({"offset": start, "columns": columns_fn(chunk)})
+        else:
+            yield b"".join(_json_line(row) for row in rows_fn(chunk))
+
+
+def telemetry_ndjson(telemetry: pd.DataFrame, meta: dict, format: str = "rows",
+                     chunk_rows: int = STREAM_CHUNK_ROWS) -> Iterator[bytes]:
+    return ndjson_chunks(telemetry, meta, format, telemetry_columns, telemetry_rows, chunk_rows)
+
+
+def lap_ndjson(laps: pd.DataFrame, meta: dict, format: str = "rows",
+               chunk_rows: int = STREAM_CHUNK_ROWS) -> Iterator[bytes]:
+    laps = laps[laps['LapTime'].notna()]
+    return ndjson_chunks(laps, meta, format, lap_columns, lap_rows, chunk_rows)
+
+
+class ChunkCompressor:
+    """Incremental gzip that flushes after every chunk, so the client can
+    decode (and draw) each chunk as soon as it arrives"""
+
+    def __init__(self, level: int = 6):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, chunk: bytes) -> bytes:
+        with span("compression"):
+            return self._compressor.compress(chunk) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        with span("compression"):
+            return self._compressor.flush()
+
+
+def gzip_chunks(chunks: Iterable[bytes], level: int = 6) -> Iterator[bytes]:
+    compressor = ChunkCompressor(level)
+    for chunk in chunks:
+        yield compressor.compress(chunk)
+    yield compressor.finish()
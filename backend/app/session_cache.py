@@ -0,0 +1,255 @@
+import os
+import threading
+import logging
+from collections import OrderedDict
+from concurrent.futures import Future
+
+from app.fastf1_cache import get_fastf1
+from app.metrics import span
+from app.snapshot import SessionSnapshot, read_snapshot, write_snapshot
+
+logger = logging.getLogger(__name__)
+
+# Upper bound for the estimated memory held by loaded sessions
+DEFAULT_MAX_BYTES = int(os.getenv('SESSION_CACHE_MAX_MB', '768')) * 1024 * 1024
+DEFAULT_MAX_ENTRIES = int(os.getenv('SESSION_CACHE_MAX_ENTRIES', '32'))
+# Keep compact snapshots (app.snapshot) instead of FastF1 sessions
+SESSION_SNAPSHOTS = os.getenv('SESSION_SNAPSHOTS', '1') == '1'
+
+# Optional parts of a session (results are always loaded), see Session.load()
+SESSION_PARTS = ("laps", "telemetry", "weather", "messages")
+
+
+def normalize_parts(parts=None) -> frozenset:
+    """Parts to load; None means everything. Telemetry is sliced by lap, so it implies laps."""
+    if parts is None:
+        return frozenset(SESSION_PARTS)
+    parts = frozenset(parts)
+    unknown = parts - set(SESSION_PARTS)
+    if unknown:
+        raise ValueError(f"Unknown session parts: {sorted(unknown)}")
+    if "telemetry" in parts:
+        parts |= {"laps"}
+    return parts
+
+
+def estimate_session_bytes(session) -> int:
+    """Estimate of the memory held by a loaded session.
+
+    Counts the strings of object columns too (deep), which make up most of
+    laps and results; computed once per load, not per lookup.
+    """
+    if isinstance(session, SessionSnapshot):
+        return session.nbytes
+    frames = []
+    for attr in ('_results', '_laps', '_weather_data', '_race_control_messages'):
+        frame = getattr(session, attr, None)
+        if frame is not None:
+            frames.append(frame)
+    for attr in ('_car_data', '_pos_data'):
+        channels = getattr(session, attr, None)
+        if channels:
+            frames.extend(channels.values())
+
+    total = 0
+    for frame in frames:
+        try:
+            total += int(frame.memory_usage(index=True, deep=True).sum())
+        except Exception:
+            continue
+    return total
+
+
+class SessionCache:
+    """In-process LRU registry of loaded FastF1 sessions.
+
+    Sessions are keyed by (year, round, session type). Callers say which parts
+    of the session they need and only those are loaded; a cached session that
+    lacks a part is upgraded in place by loading just the missing parts.
+    Concurrent requests for a session that is still loading wait on the same
+    load instead of starting their own (single-flight).
+
+    With `snapshots` the cache holds SessionSnapshots: each FastF1 session is
+    converted right after loading and dropped, and snapshots stored by
+    earlier loads are opened instead of loading FastF1 again.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES, max_entries: int = DEFAULT_MAX_ENTRIES,
+                 snapshots: bool = SESSION_SNAPSHOTS):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.snapshots = snapshots
+        self._sessions = OrderedDict()  # key -> (session, size in bytes, loaded parts)
+        self._inflight = {}  # key -> Future
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.coalesced = 0
+        self.loads = 0
+        self.upgrades = 0
+        self.load_errors = 0
+
+    @staticmethod
+    def make_key(year: int, round_number: int, session_type: str):
+        return (int(year), int(round_number), session_type.upper())
+
+    def get(self, year: int, round_number: int, session_type: str, parts=None):
+        """Return a session with at least `parts` loaded, loading them at most once across threads"""
+        key = self.make_key(year, round_number, session_type)
+        parts = normalize_parts(parts)
+        coalesced = False
+
+        while True:
+            with self._lock:
+                entry = self._sessions.get(key)
+                if entry is not None and parts <= entry[2]:
+                    self._sessions.move_to_end(key)
+                    if not coalesced:
+                        self.hits += 1
+                    return entry[0]
+
+                future = self._inflight.get(key)
+                if future is None:
+                    if not coalesced:
+                        self.misses += 1
+                    future = Future()
+                    self._inflight[key] = future
+                    break
+                if not coalesced:
+                    # Another request is already loading this session
+                    self.hits += 1
+                    self.coalesced += 1
+                    coalesced = True
+
+            # Wait, then check whether that load covered the parts needed here
+            try:
+                with span("session_load"):
+                    future.result()
+            except BaseException:
+                if entry is None:
+                    raise
+
+        # This thread owns the load (or the upgrade) of the session
+        session, loaded = (entry[0], entry[2]) if entry is not None else (None, frozenset())
+        try:
+            with span("session_load"):
+                session = self._load(*key, parts=parts - loaded, session=session)
+        except BaseException as e:
+            with self._lock:
+                self.load_errors += 1
+                del self._inflight[key]
+            future.set_exception(e)
+            raise
+
+        size = estimate_session_bytes(session)
+        with self._lock:
+            del self._inflight[key]
+            if entry is None:
+                self.loads += 1
+            else:
+                self.upgrades += 1
+                previous = self._sessions.pop(key, None)
+                if previous is not None:
+                    self._bytes -= previous[1]
+            self._store(key, session, size, loaded | parts)
+        future.set_result(session)
+        return session
+
+    def _load(self, year: int, round_number: int, session_type: str, parts=frozenset(SESSION_PARTS),
+              session=None):
+        """Load `parts` of a new session, or add them to an already loaded one"""
+        if self.snapshots:
+            return self._load_snapshot(year, round_number, session_type, parts, session)
+        return self._load_session(year, round_number, session_type, parts, session)
+
+    def _load_snapshot(self, year: int, round_number: int, session_type: str, parts, snapshot=None):
+        """Snapshot with `parts` and the parts of `snapshot`, from disk or from a FastF1 load"""
+        if snapshot is not None:
+            # Snapshots can't be extended, the session is converted again with all parts
+            parts = parts | snapshot.parts
+        stored = read_snapshot(year, round_number, session_type, parts)
+        if stored is not None:
+            logger.info(f"Opened snapshot of {year} round {round_number} {session_type} "
+                        f"({stored.nbytes / 1e6:.1f} MB)")
+            return stored
+
+        session = self._load_session(year, round_number, session_type, parts)
+        snapshot = SessionSnapshot.from_session(session, parts)
+        try:
+            snapshot = write_snapshot(snapshot, year, round_number, session_type)
+        except OSError as e:
+            logger.warning(f"Could not store the snapshot of {year} round {round_number} {session_type}, "
+                           f"keeping it in memory: {e}")
+        logger.info(f"Snapshot of {year} round {round_number} {session_type}: {snapshot.memory_usage()}")
+        return snapshot
+
+    def _load_session(self, year: int, round_number: int, session_type: str, parts=frozenset(SESSION_PARTS),
+                      session=None):
+        """Load `parts` of a new FastF1 session, or add them to an already loaded one"""
+        if session is None:
+            logger.info(f"Loading session {year} round {round_number} {session_type} {sorted(parts)}")
+            session = get_fastf1().get_session(year, round_number, session_type)
+        else:
+            logger.info(f"Upgrading session {year} round {round_number} {session_type} with {sorted(parts)}")
+        session.load(
+            laps="laps" in parts,
+            telemetry="telemetry" in parts,
+            weather="weather" in parts,
+            messages="messages" in parts
+        )
+        return session
+
+    def _store(self, key, session, size: int, parts: frozenset):
+        """Insert a session and evict least recently used ones over budget"""
+        self._sessions[key] = (session, size, parts)
+        self._bytes += size
+        while len(self._sessions) > 1 and (
+            self._bytes > self.max_bytes or len(self._sessions) > self.max_entries
+        ):
+            evicted_key, (_, evicted_size, _) = self._sessions.popitem(last=False)
+            self._bytes -= evicted_size
+            self.evictions += 1
+            logger.info(f"Evicted session {evicted_key} ({evicted_size / 1e6:.1f} MB)")
+
+    def invalidate(self, year: int, round_number: int, session_type: str):
+        key = self.make_key(year, round_number, session_type)
+        with self._lock:
+            entry = self._sessions.pop(key, None)
+            if entry is not None:
+                self._bytes -= entry[1]
+
+    def clear(self):
+        with self._lock:
+            self._sessions.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._sessions),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "coalesced": self.coalesced,
+                "loads": self.loads,
+                "upgrades": self.upgrades,
+                "load_errors": self.load_errors,
+                "loading": len(self._inflight),
+                "hit_ratio": round(self.hits / lookups, 3) if lookups else None,
+                "sessions": {
+                    f"{y}:{r}:{s}": sorted(parts) for (y, r, s), (_, _, parts) in self._sessions.items()
+                },
+                "session_bytes": {
+                    f"{y}:{r}:{s}": size for (y, r, s), (_, size, _) in self._sessions.items()
+                },
+            }
+
+
+# Create a singleton instance
+session_cache = SessionCache()
@@ -0,0 +1,254 @@
+"""
+Data access for the race endpoints.
+
+Every accessor serves from the precomputed derived store when the session has
+been built there and falls back to the session cache otherwise, which holds
+compact snapshots of loaded sessions (app.snapshot), or FastF1 sessions with
+SESSION_SNAPSHOTS=0. Each accessor only asks the session cache for the parts
+of the session it reads, so e.g. results never pull in telemetry.
+"""
+import os
+import logging
+import threading
+import weakref
+from collections import OrderedDict
+from typing import Callable, List
+
+import pandas as pd
+
+from app import derived_store
+from app.lap_index import LapIndex
+from app.track import PositionIndex
+from app.replay import ReplayIndex
+from app.metrics import span
+from app.query_store import query_store
+from app.session_cache import session_cache, SessionCache
+from app.snapshot import SessionSnapshot
+
+logger = logging.getLogger(__name__)
+
+# Session parts (see app.session_cache.SESSION_PARTS) needed by each accessor
+RESULTS_PARTS = ()
+LAPS_PARTS = ("laps",)
+TELEMETRY_PARTS = ("laps", "telemetry")
+
+# Lap indexes of recently used sessions: session key -> (source, LapIndex)
+_lap_indexes = OrderedDict()
+_lap_indexes_lock = threading.Lock()
+
+# Position indexes of recently used sessions: session key -> (source, PositionIndex)
+_position_indexes = OrderedDict()
+_position_indexes_lock = threading.Lock()
+
+# Replay indexes of recently used sessions: session key -> (source, ReplayIndex)
+_replay_indexes = OrderedDict()
+_replay_indexes_lock = threading.Lock()
+
+# Merged telemetry of recently used laps (filled by requests and by
+# app.prefetch): (session key, driver number, lap number) -> (source, telemetry)
+LAP_TELEMETRY_ENTRIES = int(os.getenv('LAP_TELEMETRY_CACHE_ENTRIES', '32'))
+_lap_telemetry = OrderedDict()
+_lap_telemetry_lock = threading.Lock()
+
+
+def get_results(year: int, round_number: int, session_type: str) -> pd.DataFrame:
+    """session.results"""
+    results = derived_store.read_results(year, round_number, session_type)
+    if results is None:
+        results = session_cache.get(year, round_number, session_type, RESULTS_PARTS).results
+    return results
+
+
+def get_laps(year: int, round_number: int, session_type: str) -> pd.DataFrame:
+    """session.laps of the whole field"""
+    laps = derived_store.read_laps(year, round_number, session_type)
+    if laps is None:
+        laps = session_cache.get(year, round_number, session_type, LAPS_PARTS).laps
+    return laps
+
+
+def get_lap_index(year: int, round_number: int, session_type: str) -> LapIndex:
+    """Lap index of a session, built once per loaded session or store build"""
+    key = SessionCache.make_key(year, round_number, session_type)
+    session = None
+    if derived_store.has_session(year, round_number, session_type):
+        manifest = derived_store.read_manifest(year, round_number, session_type)
+        source = (manifest.get("content_hash"), manifest.get("built_at"))
+    else:
+        session = session_cache.get(year, round_number, session_type, LAPS_PARTS)
+        # A weak reference, so the index doesn't keep evicted sessions alive
+        source = weakref.ref(session)
+
+    with _lap_indexes_lock:
+        entry = _lap_indexes.get(key)
+        if entry is not None and entry[0] == source:
+            _lap_indexes.move_to_end(key)
+            return entry[1]
+
+    with span("lap_index"):
+        laps = session.laps if session is not None else derived_store.read_laps(year, round_number, session_type)
+        index = LapIndex(laps)
+    with _lap_indexes_lock:
+        _lap_indexes[key] = (source, index)
+        _lap_indexes.move_to_end(key)
+        while len(_lap_indexes) > session_cache.max_entries:
+            _lap_indexes.popitem(last=False)
+
+    # Sessions from the derived store are ingested by `python -m app.query_store ingest`
+    if session is not None:
+        query_store.schedule_ingest(year, round_number, session_type, session)
+    return index
+
+
+def get_position_index(year: int, round_number: int, session_type: str) -> PositionIndex:
+    """Position index of a session, built once per loaded session.
+
+    The derived store keeps no raw position data, so this always reads the
+    FastF1 session.
+    """
+    key = SessionCache.make_key(year, round_number, session_type)
+    session = session_cache.get(year, round_number, session_type, TELEMETRY_PARTS)
+    source = weakref.ref(session)
+    with _position_indexes_lock:
+        entry = _position_indexes.get(key)
+        if entry is not None and entry[0] == source:
+            _position_indexes.move_to_end(key)
+            return entry[1]
+
+    with span("position_index"):
+        index = PositionIndex(session.pos_data)
+    with _position_indexes_lock:
+        _position_indexes[key] = (source, index)
+        _position_indexes.move_to_end(key)
+        while len(_position_indexes) > session_cache.max_entries:
+            _position_indexes.popitem(last=False)
+    return index
+
+
+def get_replay_index(year: int, round_number: int, session_type: str) -> ReplayIndex:
+    """Replay index of a session (from session.pos_data and session.car_data), built once per loaded session"""
+    key = SessionCache.make_key(year, round_number, session_type)
+    session = session_cache.get(year, round_number, session_type, TELEMETRY_PARTS)
+    source = weakref.ref(session)
+    with _replay_indexes_lock:
+        entry = _replay_indexes.get(key)
+        if entry is not None and entry[0] == source:
+            _replay_indexes.move_to_end(key)
+            return entry[1]
+
+    with span("replay_index"):
+        index = ReplayIndex(session.pos_data, session.car_data)
+    with _replay_indexes_lock:
+        _replay_indexes[key] = (source, index)
+        _replay_indexes.move_to_end(key)
+        while len(_replay_indexes) > session_cache.max_entries:
+            _replay_indexes.popitem(last=False)
+    return index
+
+
+def _merged_telemetry(key: tuple, session, merge: Callable[[], pd.DataFrame]) -> pd.DataFrame:
+    """merge() (lap.get_telemetry() or the snapshot's lap_telemetry()), reusing
+    the result for recently requested laps.
+
+    `key` is (session key, driver number, lap number).
+    """
+    source = weakref.ref(session)
+    with _lap_telemetry_lock:
+        entry = _lap_telemetry.get(key)
+        if entry is not None and entry[0] == source:
+            _lap_telemetry.move_to_end(key)
+            return entry[1]
+
+    with span("telemetry_merge"):
+        telemetry = merge()
+    with _lap_telemetry_lock:
+        _lap_telemetry[key] = (source, telemetry)
+        _lap_telemetry.move_to_end(key)
+        while len(_lap_telemetry) > LAP_TELEMETRY_ENTRIES:
+            _lap_telemetry.popitem(last=False)
+    return telemetry
+
+
+def _driver_number(year: int, round_number: int, session_type: str, driver: str) -> str:
+    if str(driver).isdigit():
+        return str(driver)
+    laps = derived_store.read_laps(year, round_number, session_type, driver=driver, columns=['DriverNumber'])
+    if laps is None or laps.empty:
+        return str(driver)
+    return str(laps['DriverNumber'].iloc[0])
+
+
+def get_lap_telemetry(year: int, round_number: int, session_type: str, driver: str, lap_number: int) -> pd.DataFrame:
+    """lap.get_telemetry() of one lap; raises LookupError if the lap doesn't exist"""
+    if derived_store.has_session(year, round_number, session_type):
+        with span("store_read"):
+            number = _driver_number(year, round_number, session_type, driver)
+            telemetry = derived_store.read_lap_telemetry(year, round_number, session_type, number, lap_number)
+        if telemetry.empty:
+            raise LookupError(f"No telemetry for driver {driver} lap {lap_number}")
+        return telemetry
+
+    session = session_cache.get(year, round_number, session_type, TELEMETRY_PARTS)
+    session_key = SessionCache.make_key(year, round_number, session_type)
+    if isinstance(session, SessionSnapshot):
+        number = session.driver_number(driver)
+        return _merged_telemetry((session_key, number, int(lap_number)), session,
+                                 lambda: session.lap_telemetry(number, lap_number))
+
+    with span("lap_pick"):
+        lap = session.laps.pick_driver(driver).pick_lap(lap_number)
+    if lap.empty:
+        raise LookupError(f"No lap {lap_number} for driver {driver}")
+    key = (session_key, str(lap['DriverNumber'].iloc[0]), int(lap_number))
+    return _merged_telemetry(key, session, lap.get_telemetry)
+
+
+def select_laps_telemetry(year: int, round_number: int, session_type: str, pairs: List[tuple]) -> list:
+    """Loaders for the telemetry of several (driver, lap) pairs of one session.
+
+    Returns [(pair, loader)] where loader() returns the lap's telemetry, or
+    loader is None if the lap doesn't exist. With FastF1 as the source all
+    laps are sliced out of session.laps in one pass.
+    """
+    if derived_store.has_session(year, round_number, session_type):
+        return [
+            (pair, lambda pair=pair: get_lap_telemetry(year, round_number, session_type, *pair))
+            for pair in pairs
+        ]
+
+    session = session_cache.get(year, round_number, session_type, TELEMETRY_PARTS)
+    session_key = SessionCache.make_key(year, round_number, session_type)
+    if isinstance(session, SessionSnapshot):
+        loaders = []
+        for pair in pairs:
+            number, lap_number = session.driver_number(pair[0]), int(pair[1])
+            if not session.has_lap(number, lap_number):
+                loaders.append((pair, None))
+                continue
+            loaders.append((pair, lambda number=number, lap_number=lap_number: _merged_telemetry(
+                (session_key, number, lap_number), session, lambda: session.lap_telemetry(number, lap_number)
+            )))
+        return loaders
+
+    session_laps = session.laps
+    drivers = session_laps['DriverNumber'].astype(str)
+    # Accept three letter abbreviations as well as driver numbers
+    numbers = dict(zip(session_laps['Driver'].str.upper(), drivers))
+    wanted = [(numbers.get(driver.upper(), driver), lap) for driver, lap in pairs]
+
+    with span("lap_pick"):
+        keys = pd.MultiIndex.from_arrays([drivers, session_laps['LapNumber']])
+        selected = session_laps[keys.isin(wanted)]
+        by_key = {
+            (str(lap['DriverNumber']), int(lap['LapNumber'])): lap
+            for _, lap in selected.iterlaps()
+        }
+    loaders = []
+    for pair, key in zip(pairs, wanted):
+        lap = by_key.get(key)
+        if lap is None:
+            loaders.append((pair, None))
+        else:
+            loaders.append((pair, lambda key=key, lap=lap: _merged_telemetry((session_key,) + key, session,
+                                                                             lap.get_telemetry)))
+    return loaders
@@ -0,0 +1,455 @@
+"""
+Compact, memory-mappable snapshots of loaded sessions.
+
+A loaded FastF1 Session holds its results, laps and car/position data as
+pandas DataFrames with object and Timedelta columns, several hundred MB for a
+race with telemetry. A SessionSnapshot keeps the same data as typed NumPy
+arrays:
+
+    times           int32 milliseconds (session time, lap and sector times)
+    car data        float32 speed, uint16 RPM, uint8 gear/throttle/brake/DRS;
+                    missing samples of integer channels are the dtype's maximum
+    positions       float32 X/Y/Z
+    text columns    int16 category codes (driver, team, compound, ...)
+    flags           uint8, 255 for missing
+
+and rebuilds small DataFrames on access. Snapshots are written under
+SNAPSHOT_DIR as one .npy file per array and opened with mmap, so a session
+costs a file mapping rather than heap memory, pages are shared between worker
+processes, and the next process reuses it without loading FastF1 at all.
+
+Layout:
+
+    {year}/{round:02d}_{session}/
+        meta.json                 parts, event, drivers, column encodings
+        results.{column}.npy
+        laps.{column}.npy
+        car.{channel}.npy         all drivers, concatenated in driver order
+        car.offsets.npy           start of each driver's samples
+        pos.{channel}.npy
+        pos.offsets.npy
+
+Weather and race control messages are not kept.
+"""
+import os
+import json
+import uuid
+import shutil
+import logging
+from pathlib import Path
+from datetime import datetime, timezone
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from app.derived_store import LAPS_COLUMNS, BOOLEAN_COLUMNS
+from app.http_cache import FINALIZED_AFTER
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_DIR = Path(os.getenv('SNAPSHOT_DIR', Path(__file__).parent / "snapshots"))
+# Bump when the layout changes; older snapshots are rebuilt
+SNAPSHOT_VERSION = 2
+# Snapshots of sessions that weren't final yet when built are reused this long
+RECENT_SNAPSHOT_SECONDS = int(os.getenv('SNAPSHOT_RECENT_SECONDS', '600'))
+
+MISSING_MS = np.iinfo(np.int32).min
+MISSING_FLAG = 255
+
+# Channel -> dtype; integer channels store missing samples as the dtype's maximum
+CAR_CHANNELS = {
+    "Speed": np.float32,
+    "RPM": np.uint16,
+    "nGear": np.uint8,
+    "Throttle": np.uint8,
+    "Brake": np.uint8,
+    "DRS": np.uint8,
+}
+POS_CHANNELS = {"X": np.float32, "Y": np.float32, "Z": np.float32}
+
+# dtypes of the rebuilt lap telemetry, as lap.get_telemetry() returns them
+TELEMETRY_DTYPES = {
+    "Speed": np.float64, "RPM": np.float64, "nGear": np.int64, "Throttle": np.float64,
+    "Brake": bool, "DRS": np.int64,
+}
+
+
+def _ms(values: pd.Series) -> np.ndarray:
+    ms = pd.to_timedelta(values).dt.round('ms').to_numpy(dtype='timedelta64[ms]').astype(np.int64)
+    ms[np.asarray(pd.isna(values))] = MISSING_MS
+    return ms.astype(np.int32)
+
+
+def _timedelta(ms: np.ndarray) -> pd.Series:
+    ms = np.asarray(ms)
+    values = pd.to_timedelta(ms.astype(np.int64), unit='ms')
+    return pd.Series(values).mask(ms == MISSING_MS)
+
+
+def _channel(values: np.ndarray, dtype=None) -> np.ndarray:
+    """Samples of a stored channel, missing ones as NaN; cast to `dtype` if none are missing"""
+    values = np.asarray(values)
+    if np.issubdtype(values.dtype, np.integer):
+        missing = values == np.iinfo(values.dtype).max
+        if missing.any():
+            values = values.astype(np.float64)
+            values[missing] = np.nan
+            return values
+    return values if dtype is None else values.astype(dtype)
+
+
+def encode_column(name: str, series: pd.Series) -> tuple:
+    """(encoding, array, categories) of a DataFrame column"""
+    if pd.api.types.is_timedelta64_dtype(series):
+        return "ms", _ms(series), None
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return "datetime", series.to_numpy(dtype='datetime64[ns]').astype(np.int64), None
+    if name in BOOLEAN_COLUMNS or pd.api.types.is_bool_dtype(series):
+        flags = series.astype('boolean')
+        values = np.where(flags.isna(), MISSING_FLAG, flags.fillna(False).astype(np.uint8)).astype(np.uint8)
+        return "flag", values, None
+    if pd.api.types.is_numeric_dtype(series):
+        return "float32", pd.to_numeric(series, errors='coerce').to_numpy(dtype=np.float32), None
+    # Text: category codes; everything is stored as its string form
+    text = series.astype(object).where(series.notna(), None)
+    categorical = pd.Categorical([None if v is None else str(v) for v in text])
+    return "category", categorical.codes.astype(np.int16), [str(c) for c in categorical.categories]
+
+
+def decode_column(encoding: str, values: np.ndarray, categories: Optional[list]) -> pd.Series:
+    if encoding == "ms":
+        return _timedelta(values)
+    if encoding == "datetime":
+        return pd.Series(pd.to_datetime(np.asarray(values), unit='ns'))
+    if encoding == "flag":
+        values = np.asarray(values)
+        return pd.Series(pd.arrays.BooleanArray(values == 1, values == MISSING_FLAG))
+    if encoding == "float32":
+        return pd.Series(np.asarray(values, dtype=np.float64))
+    return pd.Series(pd.Categorical.from_codes(np.asarray(values), categories)).astype(object)
+
+
+class SessionSnapshot:
+    """Results, laps and car/position data of one session in typed arrays.
+
+    Exposes the parts of the FastF1 Session API the data accessors use
+    (results, laps, car_data, pos_data, event) plus lap_telemetry().
+    """
+
+    def __init__(self, meta: dict, arrays: dict, mapped: bool = False):
+        self.meta = meta
+        self.arrays = arrays  # "{table}.{column}" -> array
+        self.mapped = mapped
+        self.parts = frozenset(meta["parts"])
+        self.drivers = meta["drivers"]
+        self._driver_codes = {d: i for i, d in enumerate(self.drivers)}
+        self._numbers = None  # abbreviation -> driver number
+
+    # Building and storage
+
+    @classmethod
+    def from_session(cls, session, parts) -> "SessionSnapshot":
+        """Snapshot of a loaded FastF1 session; `parts` are the parts it was loaded with"""
+        parts = frozenset(parts)
+        arrays, columns = {}, {}
+
+        def add_table(table: str, frame: pd.DataFrame, names):
+            columns[table] = []
+            for name in names:
+                if name not in frame.columns:
+                    continue
+                encoding, values, categories = encode_column(name, frame[name].reset_index(drop=True))
+                arrays[f"{table}.{name}"] = values
+                columns[table].append([name, encoding, categories])
+
+        results = session.results
+        add_table("results", results, list(results.columns))
+        drivers = [str(d) for d in results['DriverNumber'].dropna()] if 'DriverNumber' in results else []
+        if "laps" in parts:
+            laps = session.laps
+            add_table("laps", laps, LAPS_COLUMNS)
+            for number in laps['DriverNumber'].dropna().astype(str).unique():
+                if number not in drivers:
+                    drivers.append(number)
+
+        if "telemetry" in parts:
+            cls._add_channels(arrays, "car", session.car_data, drivers, CAR_CHANNELS)
+            cls._add_channels(arrays, "pos", session.pos_data, drivers, POS_CHANNELS)
+
+        event = session.event
+        meta = {
+            "version": SNAPSHOT_VERSION,
+            "parts": sorted(parts),
+            "drivers": drivers,
+            "columns": columns,
+            "event": {
+                "RoundNumber": int(event['RoundNumber']),
+                "EventName": str(event.get('EventName')),
+                "Location": str(event.get('Location')),
+                "EventDate": pd.Timestamp(event['EventDate']).strftime("%Y-%m-%d")
+                if pd.notna(event.get('EventDate')) else None,
+            },
+            "built_at": datetime.now(timezone.utc).isoformat(),
+        }
+        return cls(meta, arrays)
+
+    @staticmethod
+    def _add_channels(arrays: dict, prefix: str, data: dict, drivers: list, channels: dict):
+        """Concatenate the samples of every driver, each driver sorted by session time"""
+        times, values = [], {name: [] for name in channels}
+        offsets = [0]
+        for number in drivers:
+            frame = data.get(number) if data else None
+            if frame is None or frame.empty or 'SessionTime' not in frame.columns:
+                offsets.append(offsets[-1])
+                continue
+            frame = frame.sort_values('SessionTime', kind='stable')
+            times.append(_ms(frame['SessionTime']))
+            for name, dtype in channels.items():
+                column = pd.to_numeric(frame[name], errors='coerce') if name in frame.columns \
+                    else pd.Series(np.nan, index=frame.index)
+                if np.issubdtype(dtype, np.integer):
+                    info = np.iinfo(dtype)
+                    column = column.clip(info.min, info.max - 1).fillna(info.max)
+                values[name].append(column.to_numpy().astype(dtype))
+            offsets.append(offsets[-1] + len(frame))
+        arrays[f"{prefix}.SessionTime"] = np.concatenate(times) if times else np.empty(0, dtype=np.int32)
+        for name, dtype in channels.items():
+            arrays[f"{prefix}.{name}"] = np.concatenate(values[name]) if values[name] else np.empty(0, dtype=dtype)
+        arrays[f"{prefix}.offsets"] = np.array(offsets, dtype=np.int64)
+
+    def save(self, target: Path):
+        """Write the snapshot to `target` atomically.
+
+        Every writer (web and session worker processes may save the same
+        session at once) uses its own temporary directory. A snapshot already
+        at `target` is renamed aside and removed only after the new one is in
+        place; processes that have its files mapped keep reading them.
+        """
+        tag = f"{os.getpid()}.{uuid.uuid4().hex[:8]}"
+        tmp = target.with_name(f"{target.name}.{tag}.tmp")
+        tmp.mkdir(parents=True)
+        try:
+            for name, values in self.arrays.items():
+                np.save(tmp / f"{name}.npy", np.ascontiguousarray(values), allow_pickle=False)
+            with open(tmp / "meta.json", 'w') as f:
+                json.dump(self.meta, f)
+            old = target.with_name(f"{target.name}.{tag}.old")
+            try:
+                os.rename(target, old)
+            except FileNotFoundError:
+                old = None
+            try:
+                os.rename(tmp, target)
+            except OSError:
+                # Another writer put its snapshot in place between the renames
+                shutil.rmtree(tmp, ignore_errors=True)
+            if old is not None:
+                shutil.rmtree(old, ignore_errors=True)
+        except BaseException:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+
+    @classmethod
+    def open(cls, path: Path, mmap: bool = True) -> "SessionSnapshot":
+        with open(path / "meta.json") as f:
+            meta = json.load(f)
+        arrays = {
+            file.name[:-len(".npy")]: np.load(file, mmap_mode='r' if mmap else None, allow_pickle=False)
+            for file in path.glob("*.npy")
+        }
+        return cls(meta, arrays, mapped=mmap)
+
+    # Accounting
+
+    def memory_usage(self) -> dict:
+        """Bytes of each part: results, laps, car_data and pos_data"""
+        usage = {"results": 0, "laps": 0, "car_data": 0, "pos_data": 0}
+        names = {"results": "results", "laps": "laps", "car": "car_data", "pos": "pos_data"}
+        for name, values in self.arrays.items():
+            usage[names[name.split(".", 1)[0]]] += int(values.nbytes)
+        return usage
+
+    @property
+    def nbytes(self) -> int:
+        return sum(self.memory_usage().values())
+
+    # Session API
+
+    @property
+    def event(self) -> dict:
+        return self.meta["event"]
+
+    def _table(self, table: str) -> pd.DataFrame:
+        frame = {}
+        for name, encoding, categories in self.meta["columns"].get(table, []):
+            frame[name] = decode_column(encoding, self.arrays[f"{table}.{name}"], categories)
+        return pd.DataFrame(frame)
+
+    @property
+    def results(self) -> pd.DataFrame:
+        return self._table("results")
+
+    @property
+    def laps(self) -> pd.DataFrame:
+        if "laps" not in self.parts:
+            raise LookupError("Laps are not part of this snapshot")
+        return self._table("laps")
+
+    def _channels(self, prefix: str, channels: dict, number: str) -> Optional[dict]:
+        if f"{prefix}.offsets" not in self.arrays:
+            raise LookupError("Telemetry is not part of this snapshot")
+        code = self._driver_codes.get(str(number))
+        if code is None:
+            return None
+        offsets = self.arrays[f"{prefix}.offsets"]
+        lo, hi = int(offsets[code]), int(offsets[code + 1])
+        if lo == hi:
+            return None
+        columns = {"SessionTime": self.arrays[f"{prefix}.SessionTime"][lo:hi]}
+        for name in channels:
+            columns[name] = self.arrays[f"{prefix}.{name}"][lo:hi]
+        return columns
+
+    def _frames(self, prefix: str, channels: dict) -> dict:
+        frames = {}
+        for number in self.drivers:
+            columns = self._channels(prefix, channels, number)
+            if columns is None:
+                continue
+            frame = {"SessionTime": _timedelta(columns.pop("SessionTime"))}
+            frame.update({name: _channel(values) for name, values in columns.items()})
+            frames[number] = pd.DataFrame(frame)
+        return frames
+
+    @property
+    def car_data(self) -> dict:
+        """session.car_data: driver number -> DataFrame"""
+        return self._frames("car", CAR_CHANNELS)
+
+    @property
+    def pos_data(self) -> dict:
+        """session.pos_data: driver number -> DataFrame"""
+        return self._frames("pos", POS_CHANNELS)
+
+    def driver_number(self, driver: str) -> str:
+        """Driver number of a number or a three letter abbreviation"""
+        driver = str(driver)
+        if driver in self._driver_codes:
+            return driver
+        if self._numbers is None:
+            results = self.results
+            self._numbers = {}
+            if 'Abbreviation' in results.columns:
+                self._numbers = dict(zip(results['Abbreviation'].astype(str).str.upper(),
+                                         results['DriverNumber'].astype(str)))
+        return self._numbers.get(driver.upper(), driver)
+
+    def _code(self, table: str, column: str, value: str) -> Optional[int]:
+        """Category code of a value in a text column, None if it never occurs"""
+        for name, _, categories in self.meta["columns"].get(table, []):
+            if name == column:
+                return categories.index(value) if value in categories else None
+        return None
+
+    def _lap_window(self, number: str, lap_number: int) -> Optional[tuple]:
+        """(start, end) session time in ms of a lap"""
+        code = self._code("laps", "DriverNumber", number)
+        if code is None:
+            return None
+        rows = np.flatnonzero(
+            (np.asarray(self.arrays["laps.DriverNumber"]) == code)
+            & (np.asarray(self.arrays["laps.LapNumber"]) == lap_number)
+        )
+        if not len(rows):
+            return None
+        start = int(self.arrays["laps.LapStartTime"][rows[0]])
+        end = int(self.arrays["laps.Time"][rows[0]])
+        if start == MISSING_MS or end == MISSING_MS:
+            return None
+        return start, end
+
+    def has_lap(self, driver: str, lap_number: int) -> bool:
+        return self._lap_window(self.driver_number(driver), lap_number) is not None
+
+    def lap_telemetry(self, driver: str, lap_number: int) -> pd.DataFrame:
+        """Car data of one lap with interpolated positions and integrated distance.
+
+        Like lap.get_telemetry(), but on the car data's own time base: X/Y/Z
+        are interpolated at the car samples and Distance is integrated from
+        speed. Raises LookupError if the lap doesn't exist.
+        """
+        number = self.driver_number(driver)
+        window = self._lap_window(number, int(lap_number))
+        if window is None:
+            raise LookupError(f"No lap {lap_number} for driver {driver}")
+        start, end = window
+        car = self._channels("car", CAR_CHANNELS, number)
+        if car is None:
+            raise LookupError(f"No telemetry for driver {driver} lap {lap_number}")
+        lo, hi = np.searchsorted(car["SessionTime"], [start, end], side='left')
+        times = np.asarray(car["SessionTime"][lo:hi], dtype=np.int64)
+        if not len(times):
+            raise LookupError(f"No telemetry for driver {driver} lap {lap_number}")
+
+        telemetry = {
+            "SessionTime": pd.to_timedelta(times, unit='ms'),
+            "Time": pd.to_timedelta(times - start, unit='ms'),
+        }
+        speed = np.asarray(car["Speed"][lo:hi], dtype=np.float64)
+        # As FastF1's integrate_distance: speed (km/h) times the time since the previous sample
+        elapsed = np.diff(times, prepend=start) / 1000
+        telemetry["Distance"] = np.nancumsum(speed / 3.6 * elapsed)
+        for name, dtype in TELEMETRY_DTYPES.items():
+            telemetry[name] = _channel(car[name][lo:hi], dtype)
+
+        pos = self._channels("pos", POS_CHANNELS, number)
+        for name in POS_CHANNELS:
+            if pos is None:
+                telemetry[name] = np.full(len(times), np.nan)
+            else:
+                telemetry[name] = np.interp(times, np.asarray(pos["SessionTime"], dtype=np.int64),
+                                            np.asarray(pos[name], dtype=np.float64))
+        return pd.DataFrame(telemetry)
+
+
+def snapshot_dir(year: int, round_number: int, session_type: str) -> Path:
+    return SNAPSHOT_DIR / str(year) / f"{int(round_number):02d}_{session_type.upper()}"
+
+
+def _fresh(meta: dict) -> bool:
+    """Snapshots built once the session was final never go stale, others only briefly reused"""
+    built_at = datetime.fromisoformat(meta["built_at"])
+    event_date = meta["event"].get("EventDate")
+    if event_date and built_at.date() - datetime.strptime(event_date, "%Y-%m-%d").date() >= FINALIZED_AFTER:
+        return True
+    return (datetime.now(timezone.utc) - built_at).total_seconds() < RECENT_SNAPSHOT_SECONDS
+
+
+def read_snapshot(year: int, round_number: int, session_type: str, parts) -> Optional[SessionSnapshot]:
+    """The stored snapshot of a session if it has `parts` and is current, else None"""
+    path = snapshot_dir(year, round_number, session_type)
+    try:
+        with open(path / "meta.json") as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if meta.get("version") != SNAPSHOT_VERSION or not set(parts) <= set(meta["parts"]) or not _fresh(meta):
+        return None
+    try:
+        return SessionSnapshot.open(path)
+    except (OSError, ValueError):
+        # Replaced by another process while it was being opened
+        return None
+
+
+def write_snapshot(snapshot: SessionSnapshot, year: int, round_number: int, session_type: str) -> SessionSnapshot:
+    """Store a snapshot and return it memory-mapped from its files"""
+    # Another process may have stored the session while this one was loading it
+    stored = read_snapshot(year, round_number, session_type, snapshot.parts)
+    if stored is not None:
+        return stored
+    path = snapshot_dir(year, round_number, session_type)
+    snapshot.save(path)
+    return SessionSnapshot.open(path)
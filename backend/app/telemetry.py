@@ -0,0 +1,143 @@
+"""
+Server-side reduction of lap telemetry for charting.
+
+- resample_by_distance: puts every channel onto a regular distance grid.
+  Continuous channels are linearly interpolated, discrete ones (gear, DRS,
+  brake) take the value of the nearest preceding sample. Grids starting at 0
+  with the same step line up exactly, so laps can be overlaid directly.
+- decimate: Largest-Triangle-Three-Buckets on speed, which keeps peaks and
+  troughs, plus every sample where the brake is pressed or released.
+"""
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+CONTINUOUS_CHANNELS = ['Speed', 'RPM', 'Throttle']
+STEP_CHANNELS = ['nGear', 'DRS', 'Brake']
+
+# Bounds of the reduction parameters of the telemetry endpoints
+MAX_POINTS = 20000
+MIN_DISTANCE_STEP = 0.5
+
+
+class GridTooLarge(ValueError):
+    """A distance step that would put a lap on more than MAX_POINTS samples"""
+
+
+def distance_grid(max_distance: float, points: Optional[int] = None, step: Optional[float] = None,
+                  max_points: Optional[int] = MAX_POINTS) -> np.ndarray:
+    """Regular distance grid starting at 0, by point count or by step in meters"""
+    if step is None:
+        step = max_distance / max(points - 1, 1)
+    count = int(np.floor(max_distance / step + 1e-9)) + 1
+    if max_points is not None and count > max_points:
+        raise GridTooLarge(
+            f"A {step:g} m step gives {count} samples for this {max_distance:.0f} m lap, "
+            f"at most {max_points} are allowed"
+        )
+    return np.arange(count) * step
+
+
+def _interp(grid: np.ndarray, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+    valid = ~np.isnan(y)
+    if not valid.any():
+        return np.full(len(grid), np.nan)
+    # Hold the first value before the first sample, nothing past the lap end
+    return np.interp(grid, x[valid], y[valid], right=np.nan)
+
+
+def _step(grid: np.ndarray, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+    idx = np.searchsorted(x, grid, side='right') - 1
+    out = y[np.clip(idx, 0, len(y) - 1)]
+    out[grid > x[-1]] = np.nan
+    return out
+
+
+def resample_by_distance(telemetry: pd.DataFrame, grid: np.ndarray) -> pd.DataFrame:
+    """Telemetry channels sampled at the given distances"""
+    distance = telemetry['Distance'].to_numpy(dtype=np.float64)
+    order = np.argsort(distance, kind='stable')
+    distance = distance[order]
+
+    columns = {'Distance': grid}
+    for column in CONTINUOUS_CHANNELS + STEP_CHANNELS:
+        if column not in telemetry.columns:
+            continue
+        values = pd.to_numeric(telemetry[column], errors='coerce').to_numpy(dtype=np.float64)[order]
+        if column in CONTINUOUS_CHANNELS:
+            columns[column] = _interp(grid, distance, values)
+        else:
+            columns[column] = _step(grid, distance, values)
+    return pd.DataFrame(columns)
+
+
+def lttb(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """Indices of the Largest-Triangle-Three-Buckets downsampling of (x, y)"""
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    # Bucket boundaries for the n - 2 points between the fixed first and last
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+
+    a = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        # Average of the next bucket is the third triangle vertex
+        next_start, next_end = end, edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+
+        bucket_x = x[start:end]
+        bucket_y = y[start:end]
+        areas = np.abs(
+            (x[a] - avg_x) * (bucket_y - y[a]) - (x[a] - bucket_x) * (avg_y - y[a])
+        )
+        a = start + int(np.argmax(areas))
+        selected[i + 1] = a
+    return selected
+
+
+def decimate(telemetry: pd.DataFrame, points: int) -> pd.DataFrame:
+    """Reduce telemetry to about `points` samples, keeping speed extremes and brake events"""
+    if len(telemetry) <= points:
+        return telemetry
+    telemetry = telemetry.sort_values('Distance', kind='stable')
+    distance = telemetry['Distance'].to_numpy(dtype=np.float64)
+    speed = pd.to_numeric(telemetry['Speed'], errors='coerce').to_numpy(dtype=np.float64)
+    speed = np.where(np.isnan(speed), 0.0, speed)
+
+    keep = lttb(distance, speed, points)
+    if 'Brake' in telemetry.columns:
+        brake = telemetry['Brake'].fillna(False).to_numpy(dtype=np.int8)
+        changes = np.flatnonzero(np.diff(brake)) + 1
+        keep = np.union1d(keep, changes)
+    return telemetry.iloc[keep]
+
+
+def reduce_telemetry(
+    telemetry: pd.DataFrame,
+    points: Optional[int] = None,
+    distance_step: Optional[float] = None,
+    method: str = "resample",
+    max_distance: Optional[float] = None,
+    max_points: Optional[int] = MAX_POINTS
+) -> pd.DataFrame:
+    """Apply the requested downsampling; returns telemetry unchanged if none was requested.
+
+    Raises GridTooLarge if resampling would produce more than `max_points` samples.
+    """
+    if (points is None and distance_step is None) or telemetry.empty:
+        return telemetry
+    if method == "lttb":
+        if points is None:
+            length = telemetry['Distance'].max() - telemetry['Distance'].min()
+            points = int(length / distance_step) + 1
+        return decimate(telemetry, points)
+    if max_distance is None:
+        max_distance = float(telemetry['Distance'].max())
+    return resample_by_distance(telemetry, distance_grid(max_distance, points, distance_step, max_points))
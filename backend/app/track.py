@@ -0,0 +1,157 @@
+"""
+Track positions: lap paths, circuit outlines and where every car is.
+
+Coordinates are FastF1's X/Y/Z position channels, which are in 1/10 m, kept
+as integers. Paths are simplified with Douglas-Peucker (every dropped point
+lies within `tolerance` of the kept polyline) and delta encoded: the first
+value of each array is absolute, every following one is the difference to
+its predecessor, so a cumulative sum restores the coordinates. The dtype
+reported with each array (int16 or int32) is the smallest that holds all of
+its values, for clients that pack them into typed arrays.
+"""
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+# Default simplification tolerance in meters
+DEFAULT_TOLERANCE = 1.0
+# X/Y/Z units per meter
+UNITS_PER_METER = 10
+POSITION_CHANNELS = ['X', 'Y', 'Z']
+
+
+def simplify(x: np.ndarray, y: np.ndarray, tolerance: float) -> np.ndarray:
+    """Indices of the points kept by Douglas-Peucker with the given tolerance"""
+    count = len(x)
+    if count <= 2 or tolerance <= 0:
+        return np.arange(count)
+    keep = np.zeros(count, dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, count - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        # Distance of every point in between to the chord start-end
+        dx, dy = x[end] - x[start], y[end] - y[start]
+        px, py = x[start + 1:end] - x[start], y[start + 1:end] - y[start]
+        length = np.hypot(dx, dy)
+        if length == 0:
+            distances = np.hypot(px, py)
+        else:
+            distances = np.abs(dx * py - dy * px) / length
+        farthest = int(distances.argmax())
+        if distances[farthest] > tolerance:
+            split = start + 1 + farthest
+            keep[split] = True
+            stack.append((start, split))
+            stack.append((split, end))
+    return np.flatnonzero(keep)
+
+
+def int_dtype(values: np.ndarray) -> str:
+    if len(values) == 0 or (values.min() >= -32768 and values.max() <= 32767):
+        return "int16"
+    return "int32"
+
+
+def delta_encode(values: np.ndarray) -> dict:
+    """Integer values as {"dtype", "values"} with all but the first value stored as deltas"""
+    values = np.asarray(values, dtype=np.int64)
+    deltas = np.diff(values, prepend=0) if len(values) else values
+    return {"dtype": int_dtype(deltas), "values": deltas.tolist()}
+
+
+def _positions(frame: pd.DataFrame) -> tuple:
+    """Integer X/Y/Z of the samples that have a position, and the mask of those samples"""
+    coords = [pd.to_numeric(frame[c], errors='coerce').to_numpy(dtype=np.float64)
+              if c in frame.columns else np.full(len(frame), np.nan) for c in POSITION_CHANNELS]
+    valid = ~(np.isnan(coords[0]) | np.isnan(coords[1]))
+    coords = [np.nan_to_num(c[valid]).round().astype(np.int64) for c in coords]
+    return coords, valid
+
+
+def lap_path(telemetry: pd.DataFrame, tolerance: float = DEFAULT_TOLERANCE) -> dict:
+    """Simplified, delta-encoded path of one lap, with the lap distance of each point"""
+    (x, y, z), valid = _positions(telemetry)
+    if len(x) == 0:
+        raise LookupError("No position data for this lap")
+    kept = simplify(x.astype(np.float64), y.astype(np.float64), tolerance * UNITS_PER_METER)
+    path = {
+        "units": "dm",
+        "tolerance": tolerance,
+        "samples": int(len(x)),
+        "count": int(len(kept)),
+        "encoding": "delta",
+        "x": delta_encode(x[kept]),
+        "y": delta_encode(y[kept]),
+        "z": delta_encode(z[kept]),
+    }
+    if 'Distance' in telemetry.columns:
+        distance = telemetry['Distance'].to_numpy(dtype=np.float64)[valid][kept]
+        path["distance"] = delta_encode(np.nan_to_num(distance).round())
+    return path
+
+
+class PositionIndex:
+    """Position samples of every driver of a session, for lookups by session time.
+
+    Built from session.pos_data. Samples of all drivers live in flat arrays
+    sorted by (driver, time), so the positions of the whole field at a time
+    are found with one searchsorted over keys offset per driver.
+    """
+
+    def __init__(self, pos_data: dict):
+        drivers, times, coords = [], [], []
+        for number, frame in sorted(pos_data.items(), key=lambda item: str(item[0])):
+            if frame is None or frame.empty or 'SessionTime' not in frame.columns:
+                continue
+            seconds = frame['SessionTime'].dt.total_seconds().to_numpy(dtype=np.float64)
+            (x, y, z), valid = _positions(frame)
+            seconds = seconds[valid]
+            order = np.argsort(seconds, kind='stable')
+            drivers.append(str(number))
+            times.append(seconds[order])
+            coords.append(np.stack([x[order], y[order], z[order]]))
+
+        self.drivers = drivers
+        lengths = np.array([len(t) for t in times], dtype=np.int64)
+        self.starts = np.concatenate([[0], np.cumsum(lengths)[:-1]]) if len(lengths) else lengths
+        self.stops = self.starts + lengths
+        self.times = np.concatenate(times) if times else np.empty(0)
+        self.coords = np.concatenate(coords, axis=1) if coords else np.empty((3, 0), dtype=np.int64)
+        # Keys increase across drivers: driver i's samples sit in [i * span, (i + 1) * span)
+        self.span = float(self.times.max()) + 1.0 if len(self.times) else 1.0
+        driver_index = np.repeat(np.arange(len(drivers)), lengths)
+        self.keys = self.times + driver_index * self.span
+
+    def at(self, session_time: float) -> dict:
+        """Interpolated X/Y/Z of every driver that has samples around session_time"""
+        targets = session_time + np.arange(len(self.drivers)) * self.span
+        # First sample at or after the time, and whether the driver has one before it too
+        after = np.searchsorted(self.keys, targets, side='left')
+        in_slice = after < self.stops
+        exact = in_slice.copy()
+        if len(self.keys):
+            exact &= self.keys[np.minimum(after, len(self.keys) - 1)] == targets
+        index = np.flatnonzero(exact | (in_slice & (after > self.starts)))
+        a = after[index]
+        b = np.where(exact[index], a, a - 1)
+        t0, t1 = self.times[b], self.times[a]
+        weight = np.where(t1 > t0, (session_time - t0) / np.where(t1 > t0, t1 - t0, 1.0), 0.0)
+        coords = self.coords[:, b] + (self.coords[:, a] - self.coords[:, b]) * weight
+        coords = coords.round().astype(np.int64)
+        return {
+            "session_time": session_time,
+            "units": "dm",
+            "drivers": [self.drivers[i] for i in index],
+            "x": {"dtype": int_dtype(coords[0]), "values": coords[0].tolist()},
+            "y": {"dtype": int_dtype(coords[1]), "values": coords[1].tolist()},
+            "z": {"dtype": int_dtype(coords[2]), "values": coords[2].tolist()},
+        }
+
+    def time_range(self) -> Optional[tuple]:
+        if not len(self.times):
+            return None
+        return float(self.times.min()), float(self.times.max())
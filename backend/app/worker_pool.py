@@ -0,0 +1,211 @@
+"""
+Bounded process pool for FastF1 loading and DataFrame shaping.
+
+Blocking work from app.race_service runs here instead of on the event loop
+or in the request threadpool. The pool is made of single-process executors;
+tasks are routed by session key so each session is loaded (and kept in the
+session cache) by exactly one worker process.
+
+Configuration:
+    SESSION_POOL_WORKERS  number of worker processes, 0 runs tasks in threads
+                          of the API process instead (default 2)
+    SESSION_POOL_QUEUE    maximum number of pending request tasks before
+                          requests are rejected with 503; background tasks
+                          of app.prefetch don't count (default 16)
+
+A worker process that dies (e.g. killed for running out of memory) breaks
+its executor; it is replaced by a fresh one and the tasks that were on it
+fail with 503 so clients retry.
+"""
+import os
+import time
+import asyncio
+import logging
+import multiprocessing
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Optional
+
+from fastapi import HTTPException
+from starlette.concurrency import run_in_threadpool
+
+from app.fastf1_cache import get_fastf1
+from app.metrics import start_phases, add_phases
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = int(os.getenv('SESSION_POOL_WORKERS', '2'))
+DEFAULT_QUEUE_DEPTH = int(os.getenv('SESSION_POOL_QUEUE', '16'))
+RETRY_AFTER_SECONDS = 5
+
+
+class WorkerPoolBusy(HTTPException):
+    def __init__(self, retry_after: int = RETRY_AFTER_SECONDS):
+        super().__init__(
+            status_code=503,
+            detail="Server is busy loading session data, please retry",
+            headers={"Retry-After": str(retry_after)}
+        )
+
+
+def _init_worker(fastf1_cache_dir: Optional[str]):
+    """Runs once in every worker process"""
+    # Workers exist to load sessions, so they import FastF1 right away
+    get_fastf1(fastf1_cache_dir)
+
+
+def _run_task(fn: Callable, args: tuple, kwargs: dict, submitted_at: float):
+    """Run a task in a worker and report the worker's session cache and query
+    store stats and the task's phase timings (see app.metrics) with it"""
+    from app.session_cache import session_cache
+    from app.query_store import query_store
+    phases = start_phases()
+    phases["queue_wait"] = max(0.0, time.time() - submitted_at)
+    result = fn(*args, **kwargs)
+    return result, (session_cache.stats(), query_store.stats()), phases
+
+
+class WorkerPool:
+    def __init__(self, workers: int = DEFAULT_WORKERS, queue_depth: int = DEFAULT_QUEUE_DEPTH):
+        self.workers = workers
+        self.queue_depth = queue_depth
+        self.fastf1_cache_dir = None
+        self._executors = []
+        self._pending = 0  # request tasks, bounded by queue_depth
+        self._background = 0  # prefetch tasks
+        self._worker_pending = {}  # worker index -> tasks queued or running on it
+        self._worker_stats = {}  # worker index -> (session cache stats, query store stats)
+        self.completed = 0
+        self.rejected = 0
+        self.failed = 0
+        self.restarts = 0
+
+    def configure(self, fastf1_cache_dir: Optional[str] = None, workers: Optional[int] = None,
+                  queue_depth: Optional[int] = None):
+        """Set options before the first task starts the worker processes"""
+        if fastf1_cache_dir is not None:
+            self.fastf1_cache_dir = fastf1_cache_dir
+        if workers is not None:
+            self.workers = workers
+        if queue_depth is not None:
+            self.queue_depth = queue_depth
+
+    def _new_executor(self) -> ProcessPoolExecutor:
+        # spawn avoids forking the threads of the running API process
+        return ProcessPoolExecutor(
+            max_workers=1,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker,
+            initargs=(self.fastf1_cache_dir,)
+        )
+
+    def _start(self):
+        self._executors = [self._new_executor() for _ in range(self.workers)]
+        logger.info(f"Started {self.workers} session worker processes")
+
+    def _restart(self, index: int, broken: ProcessPoolExecutor):
+        """Replace a broken executor, unless a concurrent failure already did"""
+        if index >= len(self._executors) or self._executors[index] is not broken:
+            return
+        broken.shutdown(wait=False, cancel_futures=True)
+        self._executors[index] = self._new_executor()
+        self._worker_stats.pop(index, None)
+        self.restarts += 1
+        logger.warning(f"Session worker {index} died, started a new one")
+
+    def _worker_for(self, key) -> int:
+        return zlib.crc32(repr(key).encode()) % self.workers
+
+    async def run(self, key, fn: Callable, *args, **kwargs):
+        """Run fn(*args, **kwargs) on the worker owning `key` (e.g. a session key).
+
+        Raises WorkerPoolBusy (503) without queueing if too many tasks are pending.
+        """
+        if self._pending >= self.queue_depth:
+            self.rejected += 1
+            raise WorkerPoolBusy()
+
+        self._pending += 1
+        try:
+            result, phases = await self._submit(key, fn, args, kwargs)
+            add_phases(phases)
+            return result
+        finally:
+            self._pending -= 1
+
+    async def run_background(self, key, fn: Callable, *args, **kwargs):
+        """Run low-priority work (app.prefetch) on the worker owning `key`.
+
+        It doesn't count toward queue_depth, so it never turns a request away;
+        callers check busy() first so it doesn't queue ahead of requests.
+        """
+        self._background += 1
+        try:
+            result, _ = await self._submit(key, fn, args, kwargs)
+            return result
+        finally:
+            self._background -= 1
+
+    def busy(self, key) -> bool:
+        """True if the worker owning `key` has tasks queued or running"""
+        index = self._worker_for(key) if self.workers > 0 else 0
+        return self._worker_pending.get(index, 0) > 0
+
+    async def _submit(self, key, fn: Callable, args: tuple, kwargs: dict):
+        index = self._worker_for(key) if self.workers > 0 else 0
+        self._worker_pending[index] = self._worker_pending.get(index, 0) + 1
+        try:
+            if self.workers <= 0:
+                result, _, phases = await run_in_threadpool(_run_task, fn, args, kwargs, time.time())
+            else:
+                if not self._executors:
+                    self._start()
+                executor = self._executors[index]
+                loop = asyncio.get_running_loop()
+                try:
+                    result, stats, phases = await loop.run_in_executor(
+                        executor, _run_task, fn, args, kwargs, time.time()
+                    )
+                except BrokenProcessPool:
+                    # The session it held is gone with it; a retry loads it on the new worker
+                    self._restart(index, executor)
+                    raise WorkerPoolBusy()
+                self._worker_stats[index] = stats
+            self.completed += 1
+            return result, phases
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self._worker_pending[index] -= 1
+
+    def shutdown(self):
+        for executor in self._executors:
+            executor.shutdown(wait=False, cancel_futures=True)
+        self._executors = []
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "started": bool(self._executors),
+            "queue_depth": self.queue_depth,
+            "pending": self._pending,
+            "background": self._background,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "failed": self.failed,
+            "restarts": self.restarts,
+        }
+
+    def session_cache_stats(self) -> list:
+        """Last reported session cache stats of each worker process"""
+        return [self._worker_stats[i][0] for i in sorted(self._worker_stats)]
+
+    def query_store_stats(self) -> list:
+        """Last reported background ingest stats of each worker process"""
+        return [self._worker_stats[i][1] for i in sorted(self._worker_stats)]
+
+
+# Create a singleton instance
+worker_pool = WorkerPool()
@@ -0,0 +1,315 @@
+"""
+Benchmark and load test of the races API against the bundled Monaco data.
+
+Runs the ASGI app in-process (httpx, no server) with the FastF1 cache pointed
+at a copy of app/temp_cache (Monaco 2023 Race, Monaco 2024 Qualifying) and
+writes machine-readable results. Run from backend/:
+
+    python bench_api.py [--repeat 30] [--concurrency 8] [--requests 200] [--output bench_api.json]
+
+For every scenario it measures
+    cold      nothing cached: session load, shaping and serialization
+    computed  session loaded but response not cached: shaping and serialization
+    warm      response cache hits (p50/p95/p99)
+    load      throughput and latency of --requests requests, --concurrency at a time
+and the peak RSS of the benchmark process (and worker processes) afterwards.
+
+The bundled cache holds the timing data of both sessions but no season
+schedules or car/position data. The copy gets the Monaco events of
+bench_fixtures/season_schedule.json as FastF1's fallback schedule, so every
+scenario except telemetry runs with --offline (the calendar then lists only
+Monaco). Telemetry is skipped with --offline unless --fastf1-cache points at a
+cache that has the race's car and position data; without --offline FastF1
+downloads what is missing into the copy.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+BUNDLED_CACHE_DIR = "app/temp_cache"
+SCHEDULE_FIXTURE = "bench_fixtures/season_schedule.json"
+
+# (name, path, params); Monaco is round 6 in 2023 and round 8 in 2024
+SCENARIOS = [
+    ("calendar", "/races/calendar/2023", {}),
+    ("results", "/races/results", {"year": 2023, "round": 6}),
+    ("qualifying_results", "/races/qualifying-results", {"year": 2024, "round": 8}),
+    ("lap_times", "/races/lap-times", {
+        "year": 2023, "round": 6, "session_type": "race", "driver_number": "1", "format": "columnar",
+    }),
+    ("lap_times_all", "/races/lap-times", {
+        "year": 2023, "round": 6, "session_type": "race", "driver_number": "all", "format": "columnar",
+    }),
+    ("telemetry", "/races/telemetry", {
+        "year": 2023, "round": 6, "session_type": "race", "driver_number": "1", "lap_number": 10,
+        "format": "columnar",
+    }),
+]
+
+# Scenarios that need car and position data -> the session they read it from
+CAR_DATA_SCENARIOS = {"telemetry": (2023, 6, "R")}
+
+
+def prepare_fastf1_cache(source: str, target: str, offline: bool):
+    """Copy a FastF1 cache to `target`, add the schedule fixture and enable it.
+
+    The fixture is stored as FastF1's cache of the live timing season index,
+    the schedule backend FastF1 falls back to when its own can't be reached.
+    """
+    from fastf1._api import season_schedule
+    from app.fastf1_cache import get_fastf1
+
+    shutil.copytree(source, target)
+    fastf1 = get_fastf1(target)
+    if offline:
+        fastf1.Cache.offline_mode(True)
+    with open(SCHEDULE_FIXTURE) as f:
+        schedules = json.load(f)
+    for year, meetings in schedules.items():
+        # Kept as is if the cache already has the season index
+        season_schedule(f"/static/{year}/", response={"Meetings": meetings})
+    return fastf1
+
+
+def has_car_data(fastf1, cache_dir: str, year: int, round_number: int, session_type: str) -> bool:
+    """Whether a FastF1 cache holds the car and position data of a session"""
+    session = fastf1.get_session(year, round_number, session_type)
+    session_dir = os.path.join(cache_dir, session.api_path[len("/static/"):])
+    return all(
+        os.path.isfile(os.path.join(session_dir, f"{name}.ff1pkl"))
+        for name in ("car_data", "position_data")
+    )
+
+
+def percentile(values, q: float):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(q / 100 * len(ordered))) - 1))
+    return ordered[rank]
+
+
+def summarize(samples_ms: list) -> dict:
+    if not samples_ms:
+        return {"count": 0}
+    return {
+        "count": len(samples_ms),
+        "mean_ms": round(statistics.fmean(samples_ms), 3),
+        "p50_ms": round(percentile(samples_ms, 50), 3),
+        "p95_ms": round(percentile(samples_ms, 95), 3),
+        "p99_ms": round(percentile(samples_ms, 99), 3),
+        "max_ms": round(max(samples_ms), 3),
+    }
+
+
+def peak_rss_mb() -> dict:
+    """Peak resident set size so far (ru_maxrss is KB on Linux, bytes on macOS)"""
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return {
+        "self": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale, 1),
+        "workers": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale, 1),
+    }
+
+
+class Bench:
+    def __init__(self, client, workers: int):
+        from app.cache_manager import cache_manager
+        from app.session_cache import session_cache
+        from app.worker_pool import worker_pool
+
+        self.client = client
+        self.workers = workers
+        self.cache_manager = cache_manager
+        self.session_cache = session_cache
+        self.worker_pool = worker_pool
+
+    def reset(self, sessions: bool):
+        """Drop cached responses and, for a cold start, the loaded sessions"""
+        self.cache_manager.clear()
+        if sessions:
+            if self.workers > 0:
+                # Sessions live in the workers; they are started again by the next task
+                self.worker_pool.shutdown()
+            else:
+                self.session_cache.clear()
+            # Stored session snapshots would spare the next load its FastF1 parsing
+            shutil.rmtree(os.environ["SNAPSHOT_DIR"], ignore_errors=True)
+
+    async def request(self, path: str, params: dict):
+        start = time.perf_counter()
+        response = await self.client.get(path, params=params)
+        body = response.content
+        elapsed = (time.perf_counter() - start) * 1000
+        return elapsed, response, len(body)
+
+    async def timed(self, path: str, params: dict, count: int, reset=None) -> tuple:
+        samples = []
+        response = None
+        for _ in range(count):
+            if reset is not None:
+                self.reset(sessions=reset)
+            elapsed, response, _ = await self.request(path, params)
+            if response.status_code != 200:
+                break
+            samples.append(elapsed)
+        return samples, response
+
+    async def load(self, path: str, params: dict, total: int, concurrency: int) -> dict:
+        semaphore = asyncio.Semaphore(concurrency)
+        samples = []
+        errors = 0
+
+        async def one():
+            nonlocal errors
+            async with semaphore:
+                elapsed, response, _ = await self.request(path, params)
+                if response.status_code == 200:
+                    samples.append(elapsed)
+                else:
+                    errors += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(total)))
+        wall = time.perf_counter() - start
+        return {
+            "requests": total,
+            "concurrency": concurrency,
+            "errors": errors,
+            "wall_s": round(wall, 3),
+            "throughput_rps": round(len(samples) / wall, 1) if wall else None,
+            **summarize(samples),
+        }
+
+    async def scenario(self, name: str, path: str, params: dict, args) -> dict:
+        result = {"path": path, "params": params}
+
+        cold, response = await self.timed(path, params, args.cold, reset=True)
+        if response.status_code != 200:
+            result["error"] = {"status": response.status_code, "detail": response.text[:500]}
+            result["peak_rss_mb"] = peak_rss_mb()
+            return result
+        result["cold"] = summarize(cold)
+
+        computed, _ = await self.timed(path, params, args.repeat, reset=False)
+        result["computed"] = summarize(computed)
+
+        # One request to fill the response cache, then hits only
+        _, response, size = await self.request(path, params)
+        result["bytes"] = size
+        result["content_encoding"] = response.headers.get("content-encoding")
+        warm, response = await self.timed(path, params, args.repeat)
+        result["warm"] = summarize(warm)
+        result["warm_x_cache"] = response.headers.get("x-cache")
+
+        result["load"] = await self.load(path, params, args.requests, args.concurrency)
+        result["peak_rss_mb"] = peak_rss_mb()
+        return result
+
+
+def report(results: dict):
+    print(f"\n{'scenario':<20}{'cold p50':>10}{'computed':>10}{'warm p50':>10}{'warm p99':>10}{'rps':>8}{'RSS MB':>8}")
+    for name, result in results.items():
+        if "skipped" in result:
+            print(f"{name:<20}skipped: {result['skipped'][:60]}")
+            continue
+        if "error" in result:
+            print(f"{name:<20}error {result['error']['status']}: {result['error']['detail'][:60]}")
+            continue
+        print(
+            f"{name:<20}{result['cold']['p50_ms']:>10}{result['computed']['p50_ms']:>10}"
+            f"{result['warm']['p50_ms']:>10}{result['warm']['p99_ms']:>10}"
+            f"{result['load']['throughput_rps']:>8}{result['peak_rss_mb']['self']:>8}"
+        )
+
+
+async def run(args, work_dir: str) -> dict:
+    import httpx
+    import pandas as pd
+
+    from app.main import app
+    from app.worker_pool import worker_pool
+
+    fastf1_cache = os.path.join(work_dir, "fastf1")
+    fastf1 = prepare_fastf1_cache(args.fastf1_cache, fastf1_cache, args.offline)
+    worker_pool.configure(fastf1_cache_dir=fastf1_cache, workers=args.workers,
+                          queue_depth=max(args.concurrency, 16))
+
+    results = {}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench",
+                                 headers={"Accept-Encoding": "gzip"}, timeout=None) as client:
+        bench = Bench(client, args.workers)
+        for name, path, params in SCENARIOS:
+            if args.only and name not in args.only:
+                continue
+            session = CAR_DATA_SCENARIOS.get(name)
+            if args.offline and session and not has_car_data(fastf1, fastf1_cache, *session):
+                reason = "{} has no car/position data of {} round {} {}".format(args.fastf1_cache, *session)
+                print(f"Skipping {name}: {reason}")
+                results[name] = {"path": path, "params": params, "skipped": reason}
+                continue
+            print(f"Running {name}...")
+            results[name] = await bench.scenario(name, path, params, args)
+    worker_pool.shutdown()
+
+    return {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "fastf1": fastf1.__version__,
+            "pandas": pd.__version__,
+            "workers": args.workers,
+            "repeat": args.repeat,
+            "cold_runs": args.cold,
+            "offline": args.offline,
+            "fastf1_cache": args.fastf1_cache,
+        },
+        "scenarios": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=30, help="Samples of computed and warm latency")
+    parser.add_argument("--cold", type=int, default=3, help="Samples of cold latency")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per load test")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--workers", type=int, default=0, help="Session worker processes (0 runs in-process)")
+    parser.add_argument("--fastf1-cache", default=BUNDLED_CACHE_DIR)
+    parser.add_argument("--offline", action="store_true", help="Don't let FastF1 download missing data")
+    parser.add_argument("--only", nargs="+", choices=[name for name, _, _ in SCENARIOS])
+    parser.add_argument("--output", default="bench_api.json")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="f1_bench_")
+    # Response cache and derived store must start empty, and the app must not
+    # write into the checked-in directories
+    os.environ["JSON_CACHE_DIR"] = os.path.join(work_dir, "json")
+    os.environ["DERIVED_STORE_DIR"] = os.path.join(work_dir, "derived_store")
+    os.environ["QUERY_STORE_DIR"] = os.path.join(work_dir, "query_store")
+    os.environ["SNAPSHOT_DIR"] = os.path.join(work_dir, "snapshots")
+    os.environ.pop("REDIS_URL", None)
+    try:
+        output = asyncio.run(run(args, work_dir))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    report(output["scenarios"])
+    with open(args.output, "w") as f:
+        json.dump(output, f, indent=2)
+    print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Micro-benchmark: row vs columnar serialization of telemetry and lap times.
+
+Uses the Monaco 2023 race (round 6) from a copy of app/temp_cache, offline.
+The bundled cache has no car data, so the telemetry part is skipped unless
+--fastf1-cache points at a cache that has it. Run from backend/:
+
+    python bench_serialization.py [--repeat 20] [--fastf1-cache app/temp_cache]
+"""
+import argparse
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import pandas as pd
+
+from app.serializers import telemetry_rows, telemetry_columns, lap_rows, lap_columns
+from bench_api import BUNDLED_CACHE_DIR, prepare_fastf1_cache, has_car_data
+
+# Monaco 2023 race
+SESSION = (2023, 6, 'R')
+
+
+def legacy_telemetry_rows(telemetry):
+    """The original iterrows() implementation of get_telemetry"""
+    return [
+        {
+            "distance": float(t['Distance']),
+            "speed": float(t['Speed']),
+            "rpm": float(t['RPM']) if pd.notna(t.get('RPM')) else None,
+            "gear": int(t['nGear']) if pd.notna(t.get('nGear')) else None,
+            "throttle": float(t['Throttle']) if pd.notna(t.get('Throttle')) else None,
+            "brake": float(t['Brake']) if pd.notna(t.get('Brake')) else None,
+            "drs": int(t['DRS']) if pd.notna(t.get('DRS')) else None
+        }
+        for _, t in telemetry.iterrows()
+    ]
+
+
+def legacy_lap_rows(laps):
+    """The original iterrows() implementation of get_lap_times"""
+    return [
+        {
+            "lap_number": int(lap['LapNumber']),
+            "lap_time": str(lap['LapTime']),
+            "sector_1": str(lap['Sector1Time']),
+            "sector_2": str(lap['Sector2Time']),
+            "sector_3": str(lap['Sector3Time']),
+            "is_personal_best": bool(lap['IsPersonalBest']),
+            "compound": lap['Compound']
+        }
+        for _, lap in laps.iterrows()
+        if pd.notna(lap['LapTime'])
+    ]
+
+
+def measure(name, serializer, frame, repeat):
+    """Time serializer + JSON encoding and report payload sizes"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        payload = json.dumps(serializer(frame), separators=(",", ":"))
+    elapsed = (time.perf_counter() - start) / repeat
+    raw = payload.encode()
+    return {
+        "name": name,
+        "ms": round(elapsed * 1000, 2),
+        "bytes": len(raw),
+        "gzip_bytes": len(gzip.compress(raw)),
+    }
+
+
+def report(title, rows):
+    print(f"\n{title}")
+    print(f"{'mode':<10}{'ms':>10}{'bytes':>12}{'gzip':>10}")
+    for row in rows:
+        print(f"{row['name']:<10}{row['ms']:>10}{row['bytes']:>12}{row['gzip_bytes']:>10}")
+
+
+def run(args, fastf1_cache: str):
+    fastf1 = prepare_fastf1_cache(args.fastf1_cache, fastf1_cache, offline=True)
+    car_data = has_car_data(fastf1, fastf1_cache, *SESSION)
+    session = fastf1.get_session(*SESSION)
+    session.load(telemetry=car_data, weather=False, messages=False)
+
+    laps = session.laps.pick_driver('1')
+    report("Lap times (driver 1, full race)", [
+        measure("legacy", legacy_lap_rows, laps, args.repeat),
+        measure("rows", lap_rows, laps, args.repeat),
+        measure("columnar", lap_columns, laps, args.repeat),
+    ])
+
+    if not car_data:
+        print("\nSkipping telemetry: {} has no car/position data of {} round {} {}".format(
+            args.fastf1_cache, *SESSION))
+        return
+
+    telemetry = laps.pick_fastest().get_telemetry()
+    report(f"Telemetry (driver 1 fastest lap, {len(telemetry)} samples)", [
+        measure("legacy", legacy_telemetry_rows, telemetry, args.repeat),
+        measure("rows", telemetry_rows, telemetry, args.repeat),
+        measure("columnar", telemetry_columns, telemetry, args.repeat),
+    ])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--fastf1-cache", default=BUNDLED_CACHE_DIR)
+    args = parser.parse_args()
+
+    # FastF1 works on a copy, so nothing is written into the checked-in cache
+    work_dir = tempfile.mkdtemp(prefix="f1_bench_")
+    try:
+        run(args, os.path.join(work_dir, "fastf1"))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
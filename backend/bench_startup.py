@@ -0,0 +1,235 @@
+"""
+Startup benchmark: import time of the app and cold start and memory of the server.
+
+Run from backend/:
+
+    python bench_startup.py [--imports 5] [--workers 4] [--output bench_startup.json]
+
+It measures
+    import    seconds to import app.main in a fresh interpreter, and whether
+              FastF1 was imported with it (it should be deferred to first use)
+    servers   for uvicorn --workers, gunicorn and gunicorn with PRELOAD_APP=1:
+              seconds until the health check answers, until every worker has
+              answered it, and the RSS/PSS/shared memory of every process
+
+PSS (proportional set size) divides shared pages between the processes that
+map them, so with preload the workers' PSS drops while their RSS stays about
+the same. Memory is read from /proc and only reported on Linux. The caches
+and stores point at a temporary directory, Redis is not used.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from datetime import datetime, timezone
+
+IMPORT_SNIPPET = (
+    "import sys, time; start = time.perf_counter(); import app.main; "
+    "print(time.perf_counter() - start, 'fastf1' in sys.modules, 'pandas' in sys.modules)"
+)
+
+# (name, command, extra environment); {port} and {workers} are filled in
+SERVERS = [
+    ("uvicorn", ["uvicorn", "app.main:app", "--port", "{port}", "--workers", "{workers}"], {}),
+    ("gunicorn", ["gunicorn", "-c", "gunicorn.conf.py", "app.main:app"], {"PRELOAD_APP": "0"}),
+    ("gunicorn_preload", ["gunicorn", "-c", "gunicorn.conf.py", "app.main:app"], {"PRELOAD_APP": "1"}),
+]
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def measure_imports(count: int, env: dict) -> dict:
+    samples = []
+    fastf1_imported = pandas_imported = None
+    for _ in range(count):
+        output = subprocess.run([sys.executable, "-c", IMPORT_SNIPPET], env=env, capture_output=True,
+                                text=True, check=True).stdout.split()
+        samples.append(float(output[-3]) * 1000)
+        fastf1_imported, pandas_imported = output[-2] == "True", output[-1] == "True"
+    return {
+        "count": count,
+        "mean_ms": round(statistics.fmean(samples), 1),
+        "min_ms": round(min(samples), 1),
+        "max_ms": round(max(samples), 1),
+        "fastf1_imported": fastf1_imported,
+        "pandas_imported": pandas_imported,
+    }
+
+
+def children(pid: int) -> list:
+    """Direct children of a process, from /proc"""
+    found = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # The command name may contain spaces; the ppid follows the closing parenthesis
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        if ppid == pid:
+            found.append(int(entry))
+    return found
+
+
+def memory_mb(pid: int) -> dict:
+    """RSS, PSS and shared memory of a process in MB (Linux)"""
+    values = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 2 and parts[1].isdigit():
+                    values[parts[0].rstrip(":")] = int(parts[1])
+        with open(f"/proc/{pid}/cmdline", "rb") as f:
+            cmdline = f.read().replace(b"\0", b" ").decode(errors="replace").strip()
+    except OSError:
+        return {"pid": pid}
+    shared = values.get("Shared_Clean", 0) + values.get("Shared_Dirty", 0)
+    return {
+        "pid": pid,
+        "rss_mb": round(values.get("Rss", 0) / 1024, 1),
+        "pss_mb": round(values.get("Pss", 0) / 1024, 1),
+        "shared_mb": round(shared / 1024, 1),
+        "cmdline": cmdline[:120],
+    }
+
+
+def health(port: int):
+    """Health check response, or None if the server isn't answering yet"""
+    request = urllib.request.Request(f"http://127.0.0.1:{port}/", headers={"Connection": "close"})
+    try:
+        with urllib.request.urlopen(request, timeout=2) as response:
+            return json.loads(response.read())
+    except (OSError, ValueError):
+        return None
+
+
+def measure_server(name: str, command: list, extra_env: dict, env: dict, workers: int, timeout: float) -> dict:
+    port = free_port()
+    command = [part.format(port=port, workers=workers) for part in command]
+    env = {**env, **extra_env, "PORT": str(port), "WEB_CONCURRENCY": str(workers)}
+    start = time.perf_counter()
+    process = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                               start_new_session=True)
+    result = {"command": " ".join(command), "workers": workers}
+    try:
+        first = None
+        pids = set()
+        deadline = start + timeout
+        while time.perf_counter() < deadline and process.poll() is None:
+            body = health(port)
+            if body is None:
+                time.sleep(0.05)
+                continue
+            if first is None:
+                first = time.perf_counter() - start
+            pids.add(body.get("startup", {}).get("pid"))
+            if len(pids) >= workers:
+                break
+        if first is None:
+            stderr = process.stderr.read().decode(errors="replace") if process.poll() is not None else ""
+            result["error"] = f"no health check response within {timeout}s {stderr[-500:]}".strip()
+            return result
+        result["first_response_s"] = round(first, 3)
+        result["all_workers_s"] = round(time.perf_counter() - start, 3) if len(pids) >= workers else None
+        result["workers_seen"] = len(pids)
+
+        if sys.platform.startswith("linux"):
+            master = memory_mb(process.pid)
+            processes = [memory_mb(pid) for pid in children(process.pid)]
+            # multiprocessing's helper process isn't a worker
+            processes = [p for p in processes if "resource_tracker" not in p.get("cmdline", "")]
+            result["master"] = master
+            result["processes"] = processes
+            result["total_pss_mb"] = round(master.get("pss_mb", 0) + sum(p.get("pss_mb", 0) for p in processes), 1)
+            result["total_rss_mb"] = round(master.get("rss_mb", 0) + sum(p.get("rss_mb", 0) for p in processes), 1)
+        return result
+    finally:
+        try:
+            os.killpg(process.pid, signal.SIGTERM)
+            process.wait(timeout=15)
+        except (ProcessLookupError, subprocess.TimeoutExpired):
+            os.killpg(process.pid, signal.SIGKILL)
+
+
+def report(output: dict):
+    imports = output["import"]
+    print(f"\nimport app.main: {imports['mean_ms']} ms mean over {imports['count']} runs "
+          f"(fastf1 imported: {imports['fastf1_imported']})")
+    print(f"\n{'server':<18}{'first s':>9}{'all s':>9}{'RSS MB':>9}{'PSS MB':>9}{'worker PSS':>12}")
+    for name, result in output["servers"].items():
+        if "error" in result:
+            print(f"{name:<18}error: {result['error'][:80]}")
+            continue
+        worker_pss = [p.get("pss_mb", 0) for p in result.get("processes", [])]
+        mean_pss = round(statistics.fmean(worker_pss), 1) if worker_pss else "-"
+        print(f"{name:<18}{result['first_response_s']:>9}{result['all_workers_s'] or '-':>9}"
+              f"{result.get('total_rss_mb', '-'):>9}{result.get('total_pss_mb', '-'):>9}{mean_pss:>12}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--imports", type=int, default=5, help="Fresh interpreters timing the import")
+    parser.add_argument("--workers", type=int, default=4, help="Web server worker processes")
+    parser.add_argument("--timeout", type=float, default=60, help="Seconds to wait for a server")
+    parser.add_argument("--only", nargs="+", choices=[name for name, _, _ in SERVERS])
+    parser.add_argument("--preload-seasons", default="", help="PRELOAD_SEASONS for the preloaded server")
+    parser.add_argument("--preload-sessions", default="", help="PRELOAD_SESSIONS for the preloaded server")
+    parser.add_argument("--output", default="bench_startup.json")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="f1_startup_")
+    env = {
+        **os.environ,
+        "JSON_CACHE_DIR": os.path.join(work_dir, "json"),
+        "DERIVED_STORE_DIR": os.path.join(work_dir, "derived_store"),
+        "QUERY_STORE_DIR": os.path.join(work_dir, "query_store"),
+        "SNAPSHOT_DIR": os.path.join(work_dir, "snapshots"),
+        "FF1_CACHE_DIR": os.path.join(work_dir, "fastf1"),
+        "PRELOAD_SEASONS": args.preload_seasons,
+        "PRELOAD_SESSIONS": args.preload_sessions,
+        "PYTHONDONTWRITEBYTECODE": "1",
+    }
+    env.pop("REDIS_URL", None)
+
+    output = {
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+        "environment": {"python": platform.python_version(), "platform": platform.platform(),
+                        "cpus": os.cpu_count()},
+    }
+    try:
+        output["import"] = measure_imports(args.imports, env)
+        output["servers"] = {}
+        for name, command, extra_env in SERVERS:
+            if args.only and name not in args.only:
+                continue
+            if shutil.which(command[0]) is None:
+                output["servers"][name] = {"error": f"{command[0]} is not installed"}
+                continue
+            output["servers"][name] = measure_server(name, command, extra_env, env, args.workers, args.timeout)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    report(output)
+    with open(args.output, "w") as f:
+        json.dump(output, f, indent=2)
+    print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,25 @@
+"""
+Gunicorn settings for production: uvicorn workers behind one master process.
+
+    gunicorn -c gunicorn.conf.py app.main:app
+
+With PRELOAD_APP=1 the master imports the app and runs
+app.app_context.preload() (FastF1, pandas, schedule index and, with
+SESSION_POOL_WORKERS=0, hot sessions) before forking the workers, which then
+share that memory copy-on-write and start without repeating the imports.
+"""
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv('WEB_CONCURRENCY', '4'))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = os.getenv('PRELOAD_APP', '0') == '1'
+# Cold session loads can take a while
+timeout = 120
+
+
+def when_ready(server):
+    # Runs in the master after the app is loaded and before workers are forked
+    if preload_app:
+        from app.app_context import preload
+        preload()
@@ -102,6 +102,72 @@ const driverColorPalette = [
     '#ff0080'   // Pink
 ];
 
+// Media type of the packed binary telemetry/lap encoding (see backend/app/serializers.py)
+const PACKED_MEDIA_TYPE = 'application/vnd.f1.packed';
+
+const PACKED_ARRAY_TYPES = {
+    float32: Float32Array,
+    int8: Int8Array,
+    int16: Int16Array
+};
+
+// Decode one packed frame starting at byteOffset into
+// { meta, count, columns: { name: TypedArray }, byteLength }
+// Channel buffers are 8-byte aligned, so the typed arrays are views over the
+// response buffer and nothing is copied.
+function decodePacked(buffer, byteOffset = 0) {
+    const view = new DataView(buffer, byteOffset);
+    const magic = String.fromCharCode(...new Uint8Array(buffer, byteOffset, 4));
+    if (magic !== 'F1PK') {
+        throw new Error('Invalid packed response');
+    }
+    const headerLength = view.getUint32(4, true);
+    const header = JSON.parse(new TextDecoder().decode(new Uint8Array(buffer, byteOffset + 8, headerLength)));
+    const bodyOffset = byteOffset + 8 + headerLength;
+
+    const columns = {};
+    header.channels.forEach(channel => {
+        const ArrayType = PACKED_ARRAY_TYPES[channel.dtype];
+        columns[channel.name] = new ArrayType(buffer, bodyOffset + channel.offset, channel.length);
+        if (channel.categories) {
+            columns[`${channel.name}_categories`] = channel.categories;
+        }
+    });
+    return {
+        meta: header.meta,
+        count: header.count,
+        columns,
+        byteLength: 8 + headerLength + header.body_length
+    };
+}
+
+// Decode a response made of several packed frames sent back to back
+function decodePackedFrames(buffer) {
+    const frames = [];
+    let offset = 0;
+    while (offset < buffer.byteLength) {
+        const frame = decodePacked(buffer, offset);
+        frames.push(frame);
+        offset += frame.byteLength;
+    }
+    return frames;
+}
+
+// Turn decoded packed telemetry into the row format used by the charts
+function packedTelemetryToRows(decoded) {
+    const { distance, speed, throttle, brake } = decoded.columns;
+    const rows = new Array(decoded.count);
+    for (let i = 0; i < decoded.count; i++) {
+        rows[i] = {
+            distance: distance[i],
+            speed: speed[i],
+            throttle: Number.isNaN(throttle[i]) ? null : throttle[i],
+            brake: brake[i] < 0 ? null : brake[i]
+        };
+    }
+    return rows;
+}
+
 // Format time string to mm:ss.SSS
 function formatTime(timeStr) {
     if (!timeStr || timeStr === 'None') return '-';
@@ -337,27 +403,29 @@ async function loadDriverDetails() {
             <div id="data-visualization"></div>
         `;
 
-        // Load lap times for all selected drivers
+        // Load lap times of the whole field in one request
+        const url = `${API_BASE_URL}/lap-times?year=${state.selectedYear}&race_name=${encodeURIComponent(state.selectedRace.race_name)}&driver_number=all&session_type=${state.selectedSession}`;
+        const response = await fetch(url, {
+            method: 'GET',
+            mode: 'cors',
+            credentials: 'omit',
+            headers: {
+                'Accept': 'application/json',
+                'Content-Type': 'application/json',
+                'ngrok-skip-browser-warning': 'true'
+            }
+        });
+        const data = await response.json();
+        const lapTimesByDriver = data.drivers || {};
+
         for (const driverNumber of state.selectedDrivers) {
-            const url = `${API_BASE_URL}/lap-times?year=${state.selectedYear}&race_name=${encodeURIComponent(state.selectedRace.race_name)}&driver_number=${driverNumber}&session_type=${state.selectedSession}`;
-            const response = await fetch(url, {
-                method: 'GET',
-                mode: 'cors',
-                credentials: 'omit',
-                headers: {
-                    'Accept': 'application/json',
-                    'Content-Type': 'application/json',
-                    'ngrok-skip-browser-warning': 'true'
-                }
-            });
-            const data = await response.json();
-            
-            if (!data.lap_times || data.lap_times.length === 0) {
+            const lapTimes = lapTimesByDriver[driverNumber];
+            if (!lapTimes || lapTimes.length === 0) {
                 continue;
             }
-            
+
             // Store lap times data
-            state.currentLapTimes[driverNumber] = data.lap_times;
+            state.currentLapTimes[driverNumber] = lapTimes;
         }
 
         // Create lap times chart with multiple drivers
@@ -746,48 +814,47 @@ async function loadTelemetryForSelectedLaps() {
             Object.values(state.telemetryChart).forEach(chart => chart?.destroy());
         }
         
-        // Fetch telemetry data for all selected laps
+        // Fetch telemetry data for all selected laps in a single batch request
         const telemetryData = {};
-        for (const key of state.selectedLapsByClick) {
-            const [driverNumber, lapNumber] = key.split(':').map(str => str.trim());
-            try {
-                console.log(`Fetching telemetry for ${key} - Driver: ${driverNumber}, Lap: ${lapNumber}`);
-                const url = `${API_BASE_URL}/telemetry?year=${state.selectedYear}&race_name=${encodeURIComponent(state.selectedRace.race_name)}&driver_number=${driverNumber}&lap_number=${parseInt(lapNumber)}&session_type=${state.selectedSession}`;
-                console.log(`URL: ${url}`);
-                
-                const response = await fetch(url, {
-                    method: 'GET',
-                    mode: 'cors',
-                    credentials: 'omit',
-                    headers: {
-                        'Accept': 'application/json',
-                        'Content-Type': 'application/json',
-                        'ngrok-skip-browser-warning': 'true'
-                    }
-                });
-                console.log(`Response status: ${response.status}`);
-                
-                if (!response.ok) {
-                    const errorText = await response.text();
-                    console.error(`Error response: ${errorText}`);
-                    throw new Error(`HTTP error! status: ${response.status}, details: ${errorText}`);
+        const lapKeys = Array.from(state.selectedLapsByClick);
+        const lapParams = lapKeys.map(key => `laps=${encodeURIComponent(key)}`).join('&');
+        const url = `${API_BASE_URL}/telemetry/batch?year=${state.selectedYear}&race_name=${encodeURIComponent(state.selectedRace.race_name)}&session_type=${state.selectedSession}&format=packed&${lapParams}`;
+        console.log(`Fetching telemetry for ${lapKeys.length} laps: ${url}`);
+
+        try {
+            const response = await fetch(url, {
+                method: 'GET',
+                mode: 'cors',
+                credentials: 'omit',
+                headers: {
+                    'Accept': PACKED_MEDIA_TYPE,
+                    'ngrok-skip-browser-warning': 'true'
                 }
-                
-                const data = await response.json();
-                console.log(`Received data:`, data);
-                
-                if (data && data.telemetry && data.telemetry.length > 0) {
-                    telemetryData[key] = data;
+            });
+            console.log(`Response status: ${response.status}`);
+
+            if (!response.ok) {
+                const errorText = await response.text();
+                console.error(`Error response: ${errorText}`);
+                throw new Error(`HTTP error! status: ${response.status}, details: ${errorText}`);
+            }
+
+            const frames = decodePackedFrames(await response.arrayBuffer());
+            frames.forEach((frame, index) => {
+                const key = lapKeys[index];
+                const { driver_number: driverNumber, lap_number: lapNumber, error } = frame.meta;
+                if (!error && frame.count > 0) {
+                    telemetryData[key] = { ...frame.meta, telemetry: packedTelemetryToRows(frame) };
                     console.log(`Successfully loaded telemetry for ${key}`);
                 } else {
-                    console.warn(`No telemetry data for Driver ${driverNumber}, Lap ${lapNumber}`);
+                    console.warn(`No telemetry data for Driver ${driverNumber}, Lap ${lapNumber}${error ? `: ${error}` : ''}`);
                     state.selectedLapsByClick.delete(key);
                 }
-            } catch (error) {
-                console.error(`Error loading telemetry for Driver ${driverNumber}, Lap ${lapNumber}:`, error);
-                showError(`Failed to load telemetry: ${error.message}`);
-                state.selectedLapsByClick.delete(key);
-            }
+            });
+        } catch (error) {
+            console.error('Error loading telemetry for selected laps:', error);
+            showError(`Failed to load telemetry: ${error.message}`);
+            state.selectedLapsByClick.clear();
         }
 
         // Update the display after removing any invalid laps